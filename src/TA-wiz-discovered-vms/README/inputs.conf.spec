@@ -1,5 +1,8 @@
 [wiz_virtual_machines://<name>]
 global_account = 
+accounts = Optional comma-separated names of other accounts (Wiz tenants) collected by this input.
 project_id = Enter the Wiz Project ID to narrow down your report. Leave the asterisk (*) to select all projects.
 api_endpoint_url = Example: https://api.us5.app.wiz.io/graphql
-token_url = https://auth.app.wiz.io/oauth/token
\ No newline at end of file
+token_url = https://auth.app.wiz.io/oauth/token
+entity_types = Comma-separated Wiz entity types collected in one report, each optionally followed by =<sourcetype>. Defaults to VIRTUAL_MACHINE.
+routing_rules = Optional JSON list of rules, first match wins. Each rule has a "match" object (platform, subscription, region, project, tag) and sets an index, a sourcetype and/or a list of fields to keep.
\ No newline at end of file
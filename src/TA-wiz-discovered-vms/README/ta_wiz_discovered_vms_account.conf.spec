@@ -1,3 +1,6 @@
 [<name>]
 username = 
-password = 
\ No newline at end of file
+password = 
+tenant_id = 
+api_endpoint_url = 
+token_url = 
\ No newline at end of file
@@ -1,2 +1,27 @@
 [logging]
-loglevel = 
\ No newline at end of file
+loglevel = 
+
+[additional_parameters]
+max_concurrent_inputs = 
+daemon_mode = 
+schedule_jitter = 
+startup_window = 
+schedule_spread = 
+api_requests_per_minute = 
+api_max_concurrency = 
+circuit_breaker_threshold = 
+circuit_breaker_cooldown = 
+inventory_kvstore = 
+snapshot_retention = 
+metrics_index = 
+change_events = 
+enrichment_lookup = 
+enrichment_key = 
+enrichment_match = 
+enrichment_max_mb = 
+max_runs_per_account = 
+prewarm_next_report = 
+prewarm_lead_time = 
+report_sharing_window = 
+report_memory_budget_mb = 
+report_download_ranges = 
@@ -33,6 +33,36 @@ fields = [
             min_len=1, 
             max_len=8192, 
         )
+    ), 
+    field.RestField(
+        'tenant_id',
+        required=False,
+        encrypted=False,
+        default=None,
+        validator=validator.String(
+            min_len=0, 
+            max_len=200, 
+        )
+    ), 
+    field.RestField(
+        'api_endpoint_url',
+        required=False,
+        encrypted=False,
+        default=None,
+        validator=validator.String(
+            min_len=0, 
+            max_len=8192, 
+        )
+    ), 
+    field.RestField(
+        'token_url',
+        required=False,
+        encrypted=False,
+        default=None,
+        validator=validator.String(
+            min_len=0, 
+            max_len=8192, 
+        )
     )
 ]
 model = RestModel(fields, name=None)
@@ -25,10 +25,207 @@ fields_logging = [
 model_logging = RestModel(fields_logging, name='logging')
 
 
+fields_additional_parameters = [
+    field.RestField(
+        'max_concurrent_inputs',
+        required=False,
+        encrypted=False,
+        default='4',
+        validator=validator.Pattern(
+            regex=r"""^[1-9]\d*$""", 
+        )
+    ), 
+    field.RestField(
+        'daemon_mode',
+        required=False,
+        encrypted=False,
+        default=False,
+        validator=None
+    ), 
+    field.RestField(
+        'schedule_jitter',
+        required=False,
+        encrypted=False,
+        default='0',
+        validator=validator.Pattern(
+            regex=r"""^\d+$""", 
+        )
+    ), 
+    field.RestField(
+        'startup_window',
+        required=False,
+        encrypted=False,
+        default='0',
+        validator=validator.Pattern(
+            regex=r"""^\d+$""", 
+        )
+    ), 
+    field.RestField(
+        'schedule_spread',
+        required=False,
+        encrypted=False,
+        default='hash',
+        validator=None
+    ), 
+    field.RestField(
+        'api_requests_per_minute',
+        required=False,
+        encrypted=False,
+        default='120',
+        validator=validator.Pattern(
+            regex=r"""^[1-9]\d*$""", 
+        )
+    ), 
+    field.RestField(
+        'api_max_concurrency',
+        required=False,
+        encrypted=False,
+        default='4',
+        validator=validator.Pattern(
+            regex=r"""^[1-9]\d*$""", 
+        )
+    ), 
+    field.RestField(
+        'circuit_breaker_threshold',
+        required=False,
+        encrypted=False,
+        default='3',
+        validator=validator.Pattern(
+            regex=r"""^[1-9]\d*$""", 
+        )
+    ), 
+    field.RestField(
+        'circuit_breaker_cooldown',
+        required=False,
+        encrypted=False,
+        default='1800',
+        validator=validator.Pattern(
+            regex=r"""^\d+$""", 
+        )
+    ), 
+    field.RestField(
+        'inventory_kvstore',
+        required=False,
+        encrypted=False,
+        default=True,
+        validator=None
+    ), 
+    field.RestField(
+        'snapshot_retention',
+        required=False,
+        encrypted=False,
+        default='3',
+        validator=validator.Pattern(
+            regex=r"""^\d+$""", 
+        )
+    ), 
+    field.RestField(
+        'metrics_index',
+        required=False,
+        encrypted=False,
+        default='',
+        validator=None
+    ), 
+    field.RestField(
+        'change_events',
+        required=False,
+        encrypted=False,
+        default=False,
+        validator=None
+    ), 
+    field.RestField(
+        'enrichment_lookup',
+        required=False,
+        encrypted=False,
+        default='',
+        validator=None
+    ), 
+    field.RestField(
+        'enrichment_key',
+        required=False,
+        encrypted=False,
+        default='',
+        validator=None
+    ), 
+    field.RestField(
+        'enrichment_match',
+        required=False,
+        encrypted=False,
+        default='resource_id',
+        validator=validator.Pattern(
+            regex=r"""^(resource_id|hostname|tag:.+)$""", 
+        )
+    ), 
+    field.RestField(
+        'enrichment_max_mb',
+        required=False,
+        encrypted=False,
+        default='64',
+        validator=validator.Pattern(
+            regex=r"""^\d+$""", 
+        )
+    ), 
+    field.RestField(
+        'max_runs_per_account',
+        required=False,
+        encrypted=False,
+        default='',
+        validator=validator.Pattern(
+            regex=r"""^[1-9]\d*$""", 
+        )
+    ), 
+    field.RestField(
+        'prewarm_next_report',
+        required=False,
+        encrypted=False,
+        default=False,
+        validator=None
+    ), 
+    field.RestField(
+        'prewarm_lead_time',
+        required=False,
+        encrypted=False,
+        default='300',
+        validator=validator.Pattern(
+            regex=r"""^[1-9]\d*$""", 
+        )
+    ), 
+    field.RestField(
+        'report_sharing_window',
+        required=False,
+        encrypted=False,
+        default='0',
+        validator=validator.Pattern(
+            regex=r"""^\d+$""", 
+        )
+    ), 
+    field.RestField(
+        'report_memory_budget_mb',
+        required=False,
+        encrypted=False,
+        default='512',
+        validator=validator.Pattern(
+            regex=r"""^\d+$""", 
+        )
+    ), 
+    field.RestField(
+        'report_download_ranges',
+        required=False,
+        encrypted=False,
+        default='4',
+        validator=validator.Pattern(
+            regex=r"""^[1-9]\d*$""", 
+        )
+    )
+]
+model_additional_parameters = RestModel(fields_additional_parameters, name='additional_parameters')
+
+
 endpoint = MultipleModel(
     'ta_wiz_discovered_vms_settings',
     models=[
-        model_logging
+        model_logging, 
+        model_additional_parameters
     ],
 )
 
@@ -40,6 +40,13 @@ fields = [
         default=None,
         validator=None
     ), 
+    field.RestField(
+        'accounts',
+        required=False,
+        encrypted=False,
+        default=None,
+        validator=None
+    ), 
     field.RestField(
         'project_id',
         required=True,
@@ -70,6 +77,26 @@ fields = [
             max_len=8192, 
         )
     ), 
+    field.RestField(
+        'entity_types',
+        required=False,
+        encrypted=False,
+        default='VIRTUAL_MACHINE',
+        validator=validator.String(
+            min_len=0, 
+            max_len=8192, 
+        )
+    ), 
+    field.RestField(
+        'routing_rules',
+        required=False,
+        encrypted=False,
+        default=None,
+        validator=validator.String(
+            min_len=0, 
+            max_len=8192, 
+        )
+    ), 
 
     field.RestField(
         'disabled',
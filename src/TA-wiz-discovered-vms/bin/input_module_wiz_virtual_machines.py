@@ -8,16 +8,345 @@ import requests
 import csv
 import json
 import socket
+import tempfile
 from io import StringIO
 from string import Template
 import gc
+import copy
+import hashlib
+import random
+import threading
+import zlib
+import functools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from solnlib import utils as sutils
+from splunktaucclib.global_config import GlobalConfig, GlobalConfigSchema
+
+import wiz_change_events
+import wiz_checkpoint_buffer
+import wiz_circuit_breaker
+import wiz_enrichment
+import wiz_entity_types
+import wiz_fingerprint_index
+import wiz_inventory_kvstore
+import wiz_metrics
+import wiz_range_download
+import wiz_ratelimit
+import wiz_report_cache
+import wiz_report_spill
+import wiz_routing
+import wiz_run_summary
+import wiz_scheduler
+import wiz_snapshot
+import wiz_state_store
+import wiz_vm_lookup
+
+DEFAULT_MAX_CONCURRENT_INPUTS = 4
+DEFAULT_SCHEDULE_SPREAD = wiz_scheduler.SPREAD_HASH
+DEFAULT_API_REQUESTS_PER_MINUTE = 120
+DEFAULT_API_MAX_CONCURRENCY = 4
+MAX_THROTTLED_RETRIES = 5
+DEFAULT_CIRCUIT_BREAKER_THRESHOLD = 3
+DEFAULT_CIRCUIT_BREAKER_COOLDOWN = 1800
+TOMBSTONE_RETENTION_SECONDS = 30 * 86400
+DEFAULT_SNAPSHOT_RETENTION = 3
+DEFAULT_MAX_RUNS_PER_ACCOUNT = 0
+DEFAULT_REPORT_MEMORY_BUDGET_MB = 512
+DEFAULT_REPORT_DOWNLOAD_RANGES = 4
+DEFAULT_PREWARM_LEAD_TIME = 300
+PREWARM_CHECKPOINT_PREFIX = 'wiz_prewarmed_report_'
+LAST_RUN_CHECKPOINT_PREFIX = 'wiz_last_run_'
+PREWARM_MAX_AGE_SLACK_SECONDS = 600
+PENDING_REPORT_CHECKPOINT_PREFIX = 'wiz_pending_report_'
+PENDING_REPORT_MAX_AGE_SECONDS = 3600
+REPORT_FAILED_STATES = ('FAILED', 'EXPIRED')
+MAX_REPORT_STATUS_POLLS = 100
+INVENTORY_KEYS_CHECKPOINT_PREFIX = 'wiz_inventory_keys_'
+RESOURCE_ID_COLUMNS = ('External ID', 'Provider ID', 'Provider Unique ID')
+RESOURCE_ID_KEYS = ('id', 'Id', 'ID', 'InstanceId', 'instanceId', 'arn', 'selfLink')
+FINGERPRINT_COLUMNS = ('Cloud Native JSON', 'Subscription ID', 'Projects', 'Region', 'Wiz JSON Object')
+TOKEN_EXPIRY_SKEW_SECONDS = 300
+SUMMARY_SOURCETYPE = 'wiz:virtualmachines:summary'
+METRICS_SOURCETYPE = 'wiz:virtualmachines:metrics'
+CHANGE_SOURCETYPE = 'wiz:virtualmachines:change'
+
+_http_session = None
+_http_session_lock = threading.Lock()
+_token_cache = {}
+_token_locks = {}
+_token_cache_lock = threading.Lock()
+_event_writer_lock = threading.Lock()
+_shutdown_event = threading.Event()
+_governors = {}
+_governors_lock = threading.Lock()
+_circuit_breakers = {}
+_account_slots = {}
+_account_slots_lock = threading.Lock()
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class ReportRunFailed(Exception):
+    """
+    A Wiz report run failed, expired or did not complete in time; it will not become downloadable.
+    """
+
+def use_single_instance_mode():
+    return True
 
 def validate_input(helper, definition):
-    pass
+    wiz_routing.parse_rules(definition.parameters.get('routing_rules'))
+    wiz_entity_types.parse_entity_types(definition.parameters.get('entity_types'))
+
+def get_int_setting(helper, name, default, minimum=1):
+    """
+    Read an integer of at least `minimum` from the Add-on Settings page, falling back to a default.
+    """
+    
+    value = helper.get_global_setting(name)
+    
+    if value is None or str(value).strip() == "":
+        return default
+    
+    try:
+        return max(minimum, int(value))
+    except (TypeError, ValueError):
+        helper.log_warning(f"Invalid value for setting {name}: {value}. Using default of {default}.")
+        return default
+
+def is_daemon_mode(helper):
+    return sutils.is_true(helper.get_global_setting('daemon_mode') or '0')
+
+def get_schedule_spread(helper):
+    
+    spread = helper.get_global_setting('schedule_spread') or DEFAULT_SCHEDULE_SPREAD
+    
+    if spread not in (wiz_scheduler.SPREAD_NONE, wiz_scheduler.SPREAD_HASH, wiz_scheduler.SPREAD_EVEN):
+        helper.log_warning(f"Unknown schedule spread {spread}. Using {DEFAULT_SCHEDULE_SPREAD}.")
+        return DEFAULT_SCHEDULE_SPREAD
+    
+    return spread
+
+def get_checkpoint_dir(helper):
+    
+    checkpoint_dir = helper.context_meta.get('checkpoint_dir') or tempfile.gettempdir()
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    return checkpoint_dir
+
+def install_checkpoint_buffer(helper):
+    """
+    Put a write-behind buffer in front of the helper's checkpointer, so save_check_point calls are
+    coalesced per key and written in batches.
+    
+    Returns:
+    WriteBehindCheckpointer: The buffer, or None if the checkpointer could not be initialised.
+    """
+    
+    if isinstance(helper.ckpt, wiz_checkpoint_buffer.WriteBehindCheckpointer):
+        return helper.ckpt
+    
+    try:
+        if helper.ckpt is None:
+            helper._init_ckpt()
+    except Exception as e:
+        helper.log_warning(f"Checkpoint store is not available, checkpoints will not be buffered. {e}")
+        return None
+    
+    helper.ckpt = wiz_checkpoint_buffer.WriteBehindCheckpointer(helper.ckpt, helper)
+    return helper.ckpt
+
+def open_inventory_collection(helper, name):
+    """
+    Return the writer for the wiz_vm_inventory KV store collection, or None when the feature is
+    disabled or the KV store cannot be reached.
+    
+    Until one run of the input has completed with per-input document keys, the writer also removes
+    the documents older versions keyed by resource ID alone.
+    """
+    
+    if not sutils.is_true(helper.get_global_setting('inventory_kvstore') or '0'):
+        return None
+    
+    try:
+        migrated = helper.get_check_point(INVENTORY_KEYS_CHECKPOINT_PREFIX + name)
+        return wiz_inventory_kvstore.VmInventoryCollection(helper, name, remove_legacy_keys=not migrated)
+    except Exception as e:
+        helper.log_warning(f"KV store collection {wiz_inventory_kvstore.COLLECTION_NAME} is not available, "
+                           f"the VM inventory lookup will not be updated for input {name}. {e}")
+        return None
+
+def open_snapshot_writer(helper, name, run_id):
+    """
+    Start the on-disk snapshot of a run, or return None when snapshots are disabled.
+    """
+    
+    if get_int_setting(helper, 'snapshot_retention', DEFAULT_SNAPSHOT_RETENTION, minimum=0) == 0:
+        return None
+    
+    try:
+        return wiz_snapshot.SnapshotWriter(wiz_snapshot.snapshot_path(get_checkpoint_dir(helper), name, run_id))
+    except OSError as e:
+        helper.log_warning(f"Could not create the inventory snapshot for input {name}. {e}")
+        return None
+
+def open_previous_snapshot(helper, name):
+    """
+    Open the newest snapshot of an input for change events, or return None when change events are
+    disabled or no previous snapshot exists.
+    """
+    
+    if not sutils.is_true(helper.get_global_setting('change_events') or '0'):
+        return None
+    
+    latest = wiz_snapshot.latest_snapshots(get_checkpoint_dir(helper), name).get(name)
+    
+    if latest is None:
+        helper.log_info(f"No previous snapshot for input {name}, change events start with the next run.")
+        return None
+    
+    try:
+        return wiz_snapshot.Snapshot.open(latest[1])
+    except (OSError, ValueError) as e:
+        helper.log_warning(f"Could not open the previous snapshot of input {name}, no change events for this run. {e}")
+        return None
+
+def open_enricher(helper, name):
+    """
+    Load the enrichment lookup configured on the Add-on Settings page, or return None when
+    enrichment is disabled or the lookup cannot be loaded.
+    """
+    
+    source = (helper.get_global_setting('enrichment_lookup') or '').strip()
+    
+    if not source:
+        return None
+    
+    try:
+        match = wiz_enrichment.parse_match(helper.get_global_setting('enrichment_match'))
+        key_field = (helper.get_global_setting('enrichment_key') or '').strip() or None
+        max_bytes = get_int_setting(helper, 'enrichment_max_mb', wiz_enrichment.DEFAULT_MAX_MB) * 1024 * 1024
+        index = wiz_enrichment.load_index(helper, APP_DIR, source, key_field, max_bytes)
+    except Exception as e:
+        helper.log_warning(f"Enrichment lookup {source} is not available, events of input {name} will not be enriched. {e}")
+        return None
+    
+    if index.truncated:
+        helper.log_warning(f"Enrichment lookup {source} exceeds the memory cap: only {len(index)} keys were loaded.")
+    
+    return wiz_enrichment.Enricher(index, match)
+
+def get_fingerprint_index_path(helper, name):
+    return os.path.join(get_checkpoint_dir(helper), f"wiz_fingerprints_{name}.idx")
+
+def get_governor(helper, endpoint):
+    """
+    Return the node-wide rate limiter for a Wiz endpoint, creating it on first use.
+    """
+    
+    with _governors_lock:
+        governor = _governors.get(endpoint)
+        if governor is None:
+            rate = get_int_setting(helper, 'api_requests_per_minute', DEFAULT_API_REQUESTS_PER_MINUTE) / 60.0
+            concurrency = get_int_setting(helper, 'api_max_concurrency', DEFAULT_API_MAX_CONCURRENCY)
+            governor = wiz_ratelimit.WizApiGovernor(helper, get_checkpoint_dir(helper), endpoint, rate, concurrency)
+            _governors[endpoint] = governor
+            helper.log_info(f"Wiz API governor for {endpoint}: {rate * 60:.0f} requests/min, {concurrency} in flight, state={governor.state_path}")
+    
+    return governor
+
+def get_circuit_breaker(helper, endpoint):
+    """
+    Return the circuit breaker guarding a Wiz endpoint, creating it on first use.
+    """
+    
+    with _governors_lock:
+        breaker = _circuit_breakers.get(endpoint)
+        if breaker is None:
+            threshold = get_int_setting(helper, 'circuit_breaker_threshold', DEFAULT_CIRCUIT_BREAKER_THRESHOLD)
+            cooldown = get_int_setting(helper, 'circuit_breaker_cooldown', DEFAULT_CIRCUIT_BREAKER_COOLDOWN, minimum=0)
+            breaker = wiz_circuit_breaker.CircuitBreaker(helper, endpoint, threshold, cooldown)
+            _circuit_breakers[endpoint] = breaker
+    
+    return breaker
+
+def wiz_request(helper, endpoint, kind, method, url, **kwargs):
+    """
+    Send one Wiz call through the node-wide governor of `endpoint`, retrying throttled calls.
+    
+    Args:
+    endpoint (str): The Wiz endpoint whose limits apply (API or token URL).
+    kind (str): Label of the call for log messages.
+    method (str): HTTP method.
+    url (str): URL to call. Differs from endpoint for report downloads.
+    
+    Returns:
+    requests.Response: The last response received.
+    """
+    
+    governor = get_governor(helper, endpoint)
+    breaker = get_circuit_breaker(helper, endpoint)
+    
+    for attempt in range(MAX_THROTTLED_RETRIES + 1):
+        
+        with governor.slot(kind, _shutdown_event):
+            try:
+                response = get_http_session().request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                breaker.record_failure(f"{kind}: {e}")
+                raise
+        
+        governor.record_response(kind, response)
+        
+        if response.status_code not in wiz_ratelimit.THROTTLED_STATUS_CODES:
+            break
+        
+        if attempt < MAX_THROTTLED_RETRIES:
+            # Hand a streamed throttled response's connection back to the pool before retrying.
+            response.close()
+    
+    if response.status_code >= 500 or response.status_code in wiz_ratelimit.THROTTLED_STATUS_CODES:
+        breaker.record_failure(f"{kind}: HTTP {response.status_code}")
+    elif response.status_code < 400:
+        breaker.record_success()
+    
+    return response
+
+def get_http_pool_size(helper, max_workers):
+    """
+    Return the connection pool size for a number of concurrent stanzas: each may download its
+    report in report_download_ranges concurrent byte ranges.
+    """
+    
+    return max_workers * get_int_setting(helper, 'report_download_ranges', DEFAULT_REPORT_DOWNLOAD_RANGES, minimum=1)
+
+def get_http_session(pool_size=DEFAULT_MAX_CONCURRENT_INPUTS):
+    """
+    Return the HTTP session shared by every stanza collected in this process.
+    
+    The connection pool is sized on first use, so call this with get_http_pool_size before any
+    worker thread starts.
+    """
+    
+    global _http_session
+    
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _http_session = session
+    
+    return _http_session
 
 def get_wiz_access_token(helper, token_url, client_id, client_secret):
     """
     Authenticate to Wiz API and get the access token.
+    
+    Tokens are cached per (token_url, client_id) for the lifetime of the process, so inputs
+    sharing an account authenticate once until the token is close to expiry. Each account has its own
+    lock, so a slow token request only holds up the inputs waiting for the same token.
 
     Args:
     client_id (str): The client ID.
@@ -28,31 +357,48 @@ def get_wiz_access_token(helper, token_url, client_id, client_secret):
     """
     
     url = token_url
+    cache_key = (token_url, client_id)
     
-    helper.log_info(f"Obtaining access token for {client_id[:6]}...{client_id[-6:]}...")
+    with _token_cache_lock:
+        lock = _token_locks.get(cache_key)
+        if lock is None:
+            lock = _token_locks[cache_key] = threading.Lock()
     
-    payload = {
-        'grant_type': 'client_credentials',
-        'client_id': client_id,
-        'client_secret': client_secret,
-        'audience': 'wiz-api'
-    }
+    with lock:
     
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
+        cached = _token_cache.get(cache_key)
     
-    response = requests.post(url, data=payload, headers=headers)
+        if cached is not None and cached[1] > time.time():
+            helper.log_debug(f"Reusing cached access token for {client_id[:6]}...{client_id[-6:]}.")
+            return cached[0]
     
-    if response.status_code == 200:
-        token_data = response.json()
-        helper.log_info(f"Access token for {client_id[:6]}...{client_id[-6:]} was successfully obtained.")
-        return token_data['access_token']
-    else:
-        helper.log_error(f"Failed to obtain access token. Status Code: {response.status_code}. Response: {response.text}")
-        return None
+        helper.log_info(f"Obtaining access token for {client_id[:6]}...{client_id[-6:]}...")
+    
+        payload = {
+            'grant_type': 'client_credentials',
+            'client_id': client_id,
+            'client_secret': client_secret,
+            'audience': 'wiz-api'
+        }
+        
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded'
+        }
+        
+        response = wiz_request(helper, url, "token", "POST", url, data=payload, headers=headers)
+        
+        if response.status_code == 200:
+            token_data = response.json()
+            helper.log_info(f"Access token for {client_id[:6]}...{client_id[-6:]} was successfully obtained.")
+            expires_at = time.time() + int(token_data.get('expires_in', 0)) - TOKEN_EXPIRY_SKEW_SECONDS
+            _token_cache[cache_key] = (token_data['access_token'], expires_at)
+            return token_data['access_token']
+        else:
+            helper.log_error(f"Failed to obtain access token. Status Code: {response.status_code}. Response: {response.text}")
+            return None
 
-def create_cloud_resource_inventory_report(helper, api_url, bearer_token, project_id, report_name):
+def create_cloud_resource_inventory_report(helper, api_url, bearer_token, project_id, report_name,
+                                           entity_types=(wiz_entity_types.VIRTUAL_MACHINE,)):
     
     headers = {
         'Authorization': f'bearer {bearer_token}',
@@ -69,17 +415,15 @@ def create_cloud_resource_inventory_report(helper, api_url, bearer_token, projec
                 "cloudResourceParams": {
                         "includeCloudNativeJSON": True,
                         "includeWizJSON": True,
-                        "entityType": [
-                            "VIRTUAL_MACHINE"
-                        ]
+                        "entityType": list(entity_types)
                 }
             }
         }
     }
     
-    helper.log_info(f"Creating report: {report_name}. Filter projectId={project_id}")
+    helper.log_info(f"Creating report: {report_name}. Filter projectId={project_id} entityType={','.join(entity_types)}")
     
-    response = requests.post(api_url, json=query, headers=headers)
+    response = wiz_request(helper, api_url, "createReport", "POST", api_url, json=query, headers=headers)
     
     if response.status_code > 299:
         helper.log_error(f"Failed to create report. Status Code: {response.status_code}. Response: {response.text}")
@@ -89,7 +433,203 @@ def create_cloud_resource_inventory_report(helper, api_url, bearer_token, projec
     helper.log_info(f"Report: {report_name} successfully created, id={rid}.")
     return rid
 
-def get_cloud_resource_inventory_report(helper, api_url, bearer_token, rn, report_id):
+def report_name(name):
+    return f"from_Splunk_TA-wiz-discovered-vms_{socket.gethostname()}_{name}_{int(time.time())}"
+
+def report_params(url, project_id, entity_types):
+    """
+    Return the parameters a pre-warmed report must share with the run that uses it.
+    """
+    
+    return {'api_url': url, 'project_id': project_id, 'entity_types': list(entity_types)}
+
+def prewarm_next_report(helper, name):
+    """
+    Create the report of the next run of a stanza now, and remember its ID in the checkpoint
+    store, so that the next run only has to poll it once and download it.
+    """
+    
+    if _shutdown_event.is_set():
+        return None
+    
+    global_account = helper.get_arg('global_account', name)
+    url = helper.get_arg("api_endpoint_url", name)
+    token_url = helper.get_arg("token_url", name)
+    project_id = helper.get_arg('project_id', name)
+    entity_types = wiz_entity_types.parse_entity_types(helper.get_arg('entity_types', name), helper.get_sourcetype(name))
+    
+    for endpoint in (token_url, url):
+        if not get_circuit_breaker(helper, endpoint).allow_request():
+            return None
+    
+    token = get_wiz_access_token(helper, token_url, global_account['username'], global_account['password'])
+    if token is None:
+        helper.log_warning(f"Could not pre-warm the next report of input {name}: authentication failed.")
+        return None
+    
+    rn = report_name(name)
+    report_id = create_cloud_resource_inventory_report(helper, url, token, project_id, rn, entity_types)
+    if report_id is None:
+        helper.log_warning(f"Could not pre-warm the next report of input {name}.")
+        return None
+    
+    state = dict(report_params(url, project_id, entity_types), report_id=report_id, report_name=rn, created=int(time.time()))
+    helper.save_check_point(PREWARM_CHECKPOINT_PREFIX + name, state)
+    helper.log_info(f"Pre-warmed report {report_id} for the next run of input {name}.")
+    return report_id
+
+def get_prewarm_lead_time(helper):
+    return get_int_setting(helper, 'prewarm_lead_time', DEFAULT_PREWARM_LEAD_TIME, minimum=1)
+
+def schedule_prewarm(helper, name, next_run):
+    """
+    Pre-warm the next report of a stanza when the Pre-warm Next Report setting is on, Pre-warm
+    Lead Time seconds before the next run is due. Only daemon mode knows when the next run starts,
+    so outside daemon mode nothing is pre-warmed: a report created at the end of a run would be a
+    whole interval old when the next run downloads it.
+    
+    Args:
+    next_run (float): Epoch of the stanza's next run, as scheduled by the daemon (see
+    wiz_scheduler.StanzaScheduler.next_run_time), or None if it does not run again.
+    """
+    
+    if not sutils.is_true(helper.get_global_setting('prewarm_next_report') or '0'):
+        return
+    
+    if not is_daemon_mode(helper):
+        helper.log_debug(f"Pre-warm Next Report only applies in daemon mode, input {name} creates its report when it runs.")
+        return
+    
+    if next_run is None:
+        helper.log_debug(f"Input {name} is not scheduled to run again, its next report is not pre-warmed.")
+        return
+    
+    delay = next_run - get_prewarm_lead_time(helper) - time.time()
+    
+    if delay <= 0:
+        prewarm_next_report(helper, name)
+        return
+    
+    def _prewarm():
+        try:
+            prewarm_next_report(helper, name)
+        except Exception as e:
+            helper.log_warning(f"Could not pre-warm the next report of input {name}. {e}")
+    
+    timer = threading.Timer(delay, _prewarm)
+    timer.daemon = True
+    timer.start()
+    helper.log_info(f"The next report of input {name} will be pre-warmed in {int(delay)}s.")
+
+def take_prewarmed_report(helper, name, params):
+    """
+    Return (report ID, report name) of the report pre-warmed for this run, or None. The
+    checkpoint is consumed either way; a report created for other parameters, outside daemon
+    mode, or more than the lead time (plus some slack) ago, is ignored.
+    """
+    
+    key = PREWARM_CHECKPOINT_PREFIX + name
+    state = helper.get_check_point(key)
+    
+    if not state:
+        return None
+    
+    helper.delete_check_point(key)
+    max_age = get_prewarm_lead_time(helper) + PREWARM_MAX_AGE_SLACK_SECONDS
+    
+    if (not is_daemon_mode(helper) or any(state.get(k) != v for k, v in params.items())
+            or time.time() - state.get('created', 0) > max_age):
+        helper.log_info(f"Ignoring pre-warmed report {state.get('report_id')} of input {name}: it is stale or was created with other settings.")
+        return None
+    
+    return state['report_id'], state['report_name']
+
+def save_pending_report(helper, name, params, report_id, rn):
+    """
+    Remember the report a stanza is retrieving until its run has ingested it. Written through the
+    checkpoint buffer, so it survives the process being killed.
+    """
+    
+    key = PENDING_REPORT_CHECKPOINT_PREFIX + name
+    state = dict(params, report_id=report_id, report_name=rn, created=int(time.time()))
+    checkpointer = getattr(helper, 'ckpt', None)
+    
+    try:
+        if hasattr(checkpointer, 'write_through'):
+            checkpointer.write_through(key, state)
+        else:
+            helper.save_check_point(key, state)
+    except Exception as e:
+        helper.log_warning(f"Could not save the pending report of input {name}, it will not be resumed if this run is interrupted. {e}")
+
+def load_pending_report(helper, name, params):
+    """
+    Return (report ID, report name) of the report an earlier run of the stanza was still
+    retrieving when it failed, was shut down or was killed, or None. Retrieving it again resumes
+    its download from the bytes already on disk. A report created for other parameters, or more
+    than PENDING_REPORT_MAX_AGE_SECONDS ago, is dropped.
+    """
+    
+    key = PENDING_REPORT_CHECKPOINT_PREFIX + name
+    state = helper.get_check_point(key)
+    
+    if not state:
+        return None
+    
+    if any(state.get(k) != v for k, v in params.items()) or time.time() - state.get('created', 0) > PENDING_REPORT_MAX_AGE_SECONDS:
+        helper.delete_check_point(key)
+        helper.log_info(f"Not resuming report {state.get('report_id')} of input {name}: it is stale or was created with other settings.")
+        return None
+    
+    return state['report_id'], state['report_name']
+
+def get_resource_id(row, json_object):
+    """
+    Return the cloud resource ID of a report row, used as the VM's key in local state.
+    """
+    
+    for column in RESOURCE_ID_COLUMNS:
+        if row.get(column):
+            return row[column]
+    
+    for key in RESOURCE_ID_KEYS:
+        value = json_object.get(key)
+        if isinstance(value, (str, int)) and value != "":
+            return str(value)
+    
+    return "sha1:" + hashlib.sha1(row['Cloud Native JSON'].encode('utf-8')).hexdigest()
+
+def vm_fingerprint(row):
+    """
+    Return a 64-bit content hash of a report row. "Last Seen" is left out so that a VM which was
+    merely rescanned does not count as changed.
+    """
+    
+    h = hashlib.blake2b(digest_size=8)
+    for column in FINGERPRINT_COLUMNS:
+        h.update((row.get(column) or '').encode('utf-8'))
+        h.update(b'\x1f')
+    return int.from_bytes(h.digest(), 'big')
+
+def get_cloud_resource_inventory_report(helper, api_url, bearer_token, rn, report_id, stats=None, entity_types=None, entity_writer=None,
+                                        shared_report=None):
+    """
+    Wait for a report run to complete, download it and parse its rows.
+    
+    Args:
+    stats (dict): Optional dict that receives the downloaded bytes and the parse errors.
+    entity_types (dict): The entity types requested in the report (see wiz_entity_types.parse_entity_types).
+    entity_writer (EntityEventWriter): Optional writer of the rows of entity types other than
+    virtual machines, given each row as it is parsed (see wiz_entity_types.EntityEventWriter).
+    shared_report (SharedReport): Optional spool the downloaded CSV is saved to for other inputs.
+    
+    Returns:
+    iterable: (resource ID, fingerprint, VM JSON) of every virtual machine, or None on failure. A
+    report spooled to disk is a wiz_report_spill.SpilledRows, parsed while it is iterated.
+    
+    Raises:
+    ReportRunFailed: If the report run failed or did not complete within MAX_REPORT_STATUS_POLLS polls.
+    """
     
     headers = {
         'Authorization': f'bearer {bearer_token}',
@@ -103,12 +643,11 @@ def get_cloud_resource_inventory_report(helper, api_url, bearer_token, rn, repor
         }
     }
     
-    data = []
     retry_counter = 0
     
     helper.log_info(f"Obtaining status for report: {rn} ({report_id})")
     
-    response = requests.post(api_url, json=query, headers=headers)
+    response = wiz_request(helper, api_url, "reportStatus", "POST", api_url, json=query, headers=headers)
     
     if response.status_code > 200:
         helper.log_error(f"Failed to retrieve report. Status Code: {response.status_code}. Response: {response.text}")
@@ -118,34 +657,242 @@ def get_cloud_resource_inventory_report(helper, api_url, bearer_token, rn, repor
     
     while report_state != "COMPLETED":
         
+        if report_state in REPORT_FAILED_STATES:
+            raise ReportRunFailed(f"Report {report_id} ended with status {report_state}.")
+        
         helper.log_info(f"Report status is {report_state}, sleeping for now...")
-        time.sleep(10)
-        response = requests.post(api_url, json=query, headers=headers)
+        
+        if _shutdown_event.wait(10):
+            helper.log_warning(f"Shutdown requested while waiting for report {report_id}. This collection will end without success.")
+            return None
+        
+        response = wiz_request(helper, api_url, "reportStatus", "POST", api_url, json=query, headers=headers)
         
         retry_counter = retry_counter + 1
         
-        if retry_counter > 99:
-            helper.log_error(f"Too many attempts made to retrieve the report {report_id}. This collection will end without success.")
-            return None
+        if retry_counter >= MAX_REPORT_STATUS_POLLS:
+            get_circuit_breaker(helper, api_url).record_failure(f"report {report_id} did not complete in time")
+            raise ReportRunFailed(f"Too many attempts made to retrieve the report {report_id}.")
         
         if response.status_code == 200:
             report_state = response.json()['data']['report']['lastRun']['status']
     
-    helper.log_info(f"Report status is {report_state}. Retrieving report as CSV (non-disk, ephemeral).")
-    
     report_url = response.json()['data']['report']['lastRun']['url']
+    checkpoint_dir = get_checkpoint_dir(helper)
+    spill_path = wiz_report_spill.spill_path(checkpoint_dir, report_id)
     
-    report_csv = requests.get(report_url)
+    if wiz_report_spill.is_complete(spill_path):
+        helper.log_info(f"Report status is {report_state}. Report {report_id} was already downloaded to {spill_path}, parsing it again.")
+        return parse_spilled_report(helper, spill_path, report_id, rn, stats, entity_types, entity_writer, shared_report)
+    
+    report_csv = wiz_request(helper, api_url, "reportDownload", "GET", report_url, stream=True)
     
     if report_csv.status_code > 299:
         helper.log_error(f"Failed to retrieve report. Status Code: {response.status_code}. Response: {response.text}")
         return None
+    
+    content_length = report_csv.headers.get('Content-Length')
+    size = int(content_length) if content_length and content_length.isdigit() else None
+    budget = get_report_memory_budget(helper)
+    
+    ranged_size = wiz_range_download.supports_ranges(report_csv)
+    parts = get_int_setting(helper, 'report_download_ranges', DEFAULT_REPORT_DOWNLOAD_RANGES, minimum=1)
+    parts = wiz_range_download.range_count(ranged_size or 0, parts)
+    
+    if ranged_size and parts > 1 and wiz_report_spill.has_free_space(checkpoint_dir, ranged_size):
+        etag = wiz_range_download.validator(report_csv)
+        report_csv.close()
+        helper.log_info(f"Report status is {report_state}. Retrieving report as CSV to {spill_path} in {parts} ranges ({ranged_size} bytes).")
+        downloaded = download_report_ranges(helper, api_url, report_url, spill_path, ranged_size, parts, etag, report_id)
+        if downloaded is None:
+            return None
+        if downloaded:
+            wiz_report_spill.prune(checkpoint_dir)
+            helper.log_info(f"CSV retrieval was successful. Now parsing data...")
+            return parse_spilled_report(helper, spill_path, report_id, rn, stats, entity_types, entity_writer, shared_report)
+        report_csv = wiz_request(helper, api_url, "reportDownload", "GET", report_url, stream=True)
+        if report_csv.status_code > 299:
+            helper.log_error(f"Failed to retrieve report. Status Code: {report_csv.status_code}. Response: {report_csv.text}")
+            return None
+    
+    if wiz_report_spill.should_spill(size, budget):
+        if wiz_report_spill.has_free_space(checkpoint_dir, size):
+            helper.log_info(f"Report status is {report_state}. Retrieving report as CSV to {spill_path} ({size or 'unknown'} bytes).")
+            try:
+                wiz_report_spill.stream_to_file(report_csv, spill_path, size, _shutdown_event)
+            except (IOError, requests.exceptions.RequestException) as e:
+                helper.log_error(f"Failed to download report {report_id} to {spill_path}. {e}")
+                return None
+            finally:
+                report_csv.close()
+            wiz_report_spill.prune(checkpoint_dir)
+            helper.log_info(f"CSV retrieval was successful. Now parsing data...")
+            return parse_spilled_report(helper, spill_path, report_id, rn, stats, entity_types, entity_writer, shared_report)
+        helper.log_warning(f"Not enough free space in {checkpoint_dir} to spill report {report_id}, keeping it in memory.")
+    
+    helper.log_info(f"Report status is {report_state}. Retrieving report as CSV (non-disk, ephemeral).")
         
     helper.log_info(f"CSV retrieval was successful. Now parsing data...")
     
-    content = report_csv.content.decode('utf-8')
+    if stats is not None:
+        stats['bytes'] = len(report_csv.content)
+    
+    if shared_report is not None:
+        try:
+            shared_report.store(report_id, rn, report_csv.content)
+        except OSError as e:
+            helper.log_warning(f"Could not spool report {report_id} for other inputs. {e}")
+    
+    return parse_report_csv(helper, report_csv.content, stats, entity_types, entity_writer)
+
+def download_report_ranges(helper, api_url, report_url, path, size, parts, etag, report_id):
+    """
+    Download a report in concurrent byte ranges to its spool file, resuming the ranges left
+    incomplete by an earlier attempt at the same report.
+    
+    Returns:
+    bool: True when the file is complete, False when the server does not serve ranges and the
+    report must be downloaded in a single stream, None on failure (progress is kept for the next attempt).
+    """
+    
+    def get(url, **kwargs):
+        return wiz_request(helper, api_url, "reportDownloadRange", "GET", url, **kwargs)
+    
+    download = wiz_range_download.RangedDownload(get, report_url, path, size, parts, etag=etag, stop_event=_shutdown_event)
+    
+    if download.resumed_bytes:
+        helper.log_info(f"Resuming the download of report {report_id}: {download.resumed_bytes} of {size} bytes were already downloaded.")
+    
+    try:
+        fetched = download.download()
+    except wiz_range_download.RangesNotSupported as e:
+        helper.log_warning(f"{e} Downloading report {report_id} in a single stream.")
+        return False
+    except (IOError, requests.exceptions.RequestException) as e:
+        helper.log_error(f"Failed to download report {report_id} to {path}, the next attempt will resume it. {e} {download.stats()}")
+        return None
+    
+    helper.log_info(f"Downloaded {fetched} bytes of report {report_id} in byte ranges. {download.stats()}")
+    return True
+
+def parse_spilled_report(helper, path, report_id, rn, stats=None, entity_types=None, entity_writer=None, shared_report=None):
+    """
+    Parse a report spooled to disk. The spool file is deleted once every row has been read; if
+    reading fails, it is kept and parsed again by the next attempt for the same report. A shared
+    report is first moved to the shared spool, and read from there.
+    """
+    
+    if shared_report is not None:
+        try:
+            shared_report.store_file(report_id, rn, path)
+            wiz_report_spill.remove(path)
+            path = shared_report.csv_path
+        except OSError as e:
+            helper.log_warning(f"Could not spool report {report_id} for other inputs. {e}")
+            shared_report = None
+    
+    on_complete = None if shared_report is not None else functools.partial(wiz_report_spill.remove, path)
+    
+    try:
+        return parse_report_file(helper, path, stats, entity_types, entity_writer, on_complete)
+    except (OSError, ValueError, csv.Error) as e:
+        helper.log_error(f"Failed to parse report {report_id} from {path}, it will be parsed again by the next attempt. {e}")
+        return None
+    
+def get_report_memory_budget(helper):
+    return get_int_setting(helper, 'report_memory_budget_mb', DEFAULT_REPORT_MEMORY_BUDGET_MB, minimum=0) * 1024 * 1024
+
+def parse_report_file(helper, path, stats=None, entity_types=None, entity_writer=None, on_complete=None):
+    """
+    Parse a report CSV file: read into memory when it fits the memory budget, otherwise streamed
+    from an mmap and its row-offset index while the rows are ingested.
+    
+    Args:
+    on_complete (callable): Optional, called once every row has been read.
+    
+    Returns:
+    iterable: The VM tuples (see parse_report_rows), or None when the report cannot be split by
+    entity type.
+    
+    Raises:
+    OSError, ValueError, csv.Error: If the file cannot be read or its header parsed.
+    """
+    
+    size = os.path.getsize(path)
+    if stats is not None:
+        stats['bytes'] = size
+    
+    if not wiz_report_spill.should_spill(size, get_report_memory_budget(helper)):
+        with open(path, 'rb') as fp:
+            data = parse_report_csv(helper, fp.read(), stats, entity_types, entity_writer)
+        if data is not None and on_complete is not None:
+            on_complete()
+        return data
+    
+    report = wiz_report_spill.SpilledReport(path)
+    helper.log_debug(f"Indexed {len(report)} records of {path}.")
+    
+    try:
+        rows = iter_report_rows(helper, report.iter_text(), stats, entity_types, entity_writer)
+    except BaseException:
+        report.close()
+        raise
+    
+    if rows is None:
+        report.close()
+        return None
+    
+    return wiz_report_spill.SpilledRows(report, rows, on_complete)
+
+def parse_report_csv(helper, content, stats=None, entity_types=None, entity_writer=None):
+    """
+    Parse the rows of a downloaded report held in memory (see get_cloud_resource_inventory_report).
+    """
+    
+    content = content.decode('utf-8')
     csv_data = StringIO(content)
-    reader = csv.DictReader(csv_data)
+    data = parse_report_rows(helper, csv_data, stats, entity_types, entity_writer)
+    
+    del csv_data
+    gc.collect()
+    
+    return data
+
+def parse_report_rows(helper, lines, stats=None, entity_types=None, entity_writer=None):
+    """
+    Parse report CSV records into a list of (resource ID, fingerprint, VM JSON) tuples.
+    
+    Args:
+    lines: Iterable of CSV text, header first.
+    
+    Returns:
+    list: The VM tuples, or None when several entity types were requested and the report has no
+    column to tell them apart.
+    """
+    
+    rows = iter_report_rows(helper, lines, stats, entity_types, entity_writer)
+    
+    return None if rows is None else list(rows)
+
+def iter_report_rows(helper, lines, stats=None, entity_types=None, entity_writer=None):
+    """
+    Return a generator parsing report CSV records into (resource ID, fingerprint, VM JSON) tuples
+    as it is consumed, or None when the report cannot be split by entity type. The header is read
+    right away; rows of other entity types go to entity_writer as they are reached.
+    """
+    
+    reader = csv.DictReader(lines)
+    
+    if entity_types:
+        try:
+            wiz_entity_types.check_columns(reader.fieldnames, entity_types)
+        except ValueError as e:
+            helper.log_error(f"Failed to split the report by entity type. {e}")
+            return None
+    
+    return _iter_report_rows(helper, reader, stats, entity_types, entity_writer)
+
+def _iter_report_rows(helper, reader, stats, entity_types, entity_writer):
     
     for row in reader:
         
@@ -158,60 +905,757 @@ def get_cloud_resource_inventory_report(helper, api_url, bearer_token, rn, repor
             json_object['projects'] = row['Projects']
             json_object['region'] = row['Region']
             json_object['wizJsonObject'] = row['Wiz JSON Object']
-            data.append(json_object)
+            entity_type = wiz_entity_types.row_entity_type(row, entity_types) if entity_types else wiz_entity_types.VIRTUAL_MACHINE
         except json.JSONDecodeError as e:
             helper.log_error(f"Failed to decode JSON. {e}")
+            if stats is not None:
+                stats['errors'] = stats.get('errors', 0) + 1
+            continue
     
-    del csv_data
-    del reader
-    gc.collect()
+        if entity_type == wiz_entity_types.VIRTUAL_MACHINE:
+            yield get_resource_id(row, json_object), vm_fingerprint(row), json_object
+        elif entity_type is None:
+            helper.log_error(f"Skipping a report row without an {wiz_entity_types.ENTITY_TYPE_COLUMN}.")
+            if stats is not None:
+                stats['errors'] = stats.get('errors', 0) + 1
+        elif entity_writer is not None:
+            entity_writer.add(entity_type, json_object)
+
+def stanza_report_key(helper, name):
+    """
+    Return the report key of a stanza (see wiz_report_cache.report_key), or None if its settings
+    cannot be read.
+    """
     
-    return data
+    try:
+        entity_types = wiz_entity_types.parse_entity_types(helper.get_arg('entity_types', name), helper.get_sourcetype(name))
+        client_id = (helper.get_arg('global_account', name) or {})['username']
+    except (KeyError, TypeError, ValueError):
+        return None
+    
+    return wiz_report_cache.report_key(client_id, helper.get_arg('api_endpoint_url', name), helper.get_arg('project_id', name), entity_types)
 
-def collect_events(helper, ew):
+def open_shared_report(helper, name, client_id, url, project_id, entity_types):
+    """
+    Return the SharedReport of this stanza's report, or None when report sharing is disabled or
+    no other stanza asks for the same report.
+    """
+    
+    window = get_int_setting(helper, 'report_sharing_window', 0, minimum=0)
+    
+    if window == 0:
+        return None
+    
+    key = wiz_report_cache.report_key(client_id, url, project_id, entity_types)
+    
+    if not any(other != name and stanza_report_key(helper, other) == key for other in helper.get_input_stanza()):
+        return None
+    
+    try:
+        return wiz_report_cache.SharedReport(get_checkpoint_dir(helper), key, window)
+    except OSError as e:
+        helper.log_warning(f"Report sharing is not available for input {name}. {e}")
+        return None
+
+def obtain_report(helper, name, url, token, project_id, rn, entity_types, stats, entity_writer, shared_report=None):
+    """
+    Create the stanza's report, or take the one pre-warmed for this run, or the one an interrupted
+    run did not finish retrieving, then wait for it and download it. When a resumed or pre-warmed
+    report failed, its pending checkpoint is dropped and a new report is created.
     
-    global_account = helper.get_arg('global_account')
+    Returns:
+    tuple: (report ID, parsed VMs); the report ID is None if no report could be created and the
+    VMs are None if it could not be retrieved.
+    """
+    
+    params = report_params(url, project_id, entity_types)
+    pending = load_pending_report(helper, name, params)
+    prewarmed = take_prewarmed_report(helper, name, params) if pending is None else None
+    
+    if pending is not None:
+        report_id, rn = pending
+        helper.log_info(f"Resuming report {report_id} of input {name}, an earlier run did not finish retrieving it.")
+    elif prewarmed is not None:
+        report_id, rn = prewarmed
+        helper.log_info(f"Using pre-warmed report {report_id} for input {name}.")
+    else:
+        helper.log_info(f"Report creation phase begins here...")
+        report_id = create_cloud_resource_inventory_report(helper, url, token, project_id, rn, entity_types)
+    
+    if report_id is None:
+        return None, None
+    
+    if entity_writer is not None:
+        entity_writer.start_report(report_id)
+    
+    if pending is None:
+        save_pending_report(helper, name, params, report_id, rn)
+    
+    helper.log_info(f"Report creation was successful, now awaiting report run completion.")
+    
+    try:
+        return report_id, get_cloud_resource_inventory_report(helper, url, token, rn, report_id, stats, entity_types, entity_writer, shared_report)
+    except ReportRunFailed as e:
+        helper.delete_check_point(PENDING_REPORT_CHECKPOINT_PREFIX + name)
+        if pending is None and prewarmed is None:
+            helper.log_error(f"{e} This collection will end without success.")
+            return report_id, None
+        helper.log_warning(f"{e} Creating a new report for input {name}.")
+        return obtain_report(helper, name, url, token, project_id, report_name(name), entity_types, stats, entity_writer, shared_report)
+
+def report_read_failed(helper, name, report_id, data, stats):
+    """
+    Return True, after logging it, when a report streamed from disk (see
+    wiz_report_spill.SpilledRows) stopped before its end; its rows must not be taken as the whole
+    inventory.
+    """
+    
+    error = getattr(data, 'error', None)
+    
+    if error is None:
+        return False
+    
+    helper.log_error(f"Exiting input {name}: report {report_id} could not be read to the end, VM state is left unchanged. {error}")
+    stats['errors'] = stats.get('errors', 0) + 1
+    return True
+
+def collect_stanza(helper, ew, name, stats=None):
+    """
+    Run the full report lifecycle for a single input stanza.
+    
+    Args:
+    name (str): The input stanza name.
+    stats (dict): Optional dict that receives the run's rows, bytes, errors, change counts and summary.
+    
+    Returns:
+    bool: True if the report was collected and ingested, False if the collection failed, None if it
+    was skipped because a circuit breaker is open.
+    """
+    
+    global_account = helper.get_arg('global_account', name)
     CLIENT_ID = global_account['username']
     CLIENT_SECRET= global_account['password']
-    url = helper.get_arg("api_endpoint_url")
-    token_url = helper.get_arg("token_url")
-    project_id = helper.get_arg('project_id')
+    url = helper.get_arg("api_endpoint_url", name)
+    token_url = helper.get_arg("token_url", name)
+    project_id = helper.get_arg('project_id', name)
+    tenant = helper.get_arg('tenant_id', name)
     
     current_epoch = int(time.time())
-    this_hostname = socket.gethostname()
-    name = helper.get_input_stanza_names()
-    rn = f"from_Splunk_TA-wiz-discovered-vms_{this_hostname}_{name}_{str(current_epoch)}"
+    rn = report_name(name)
     
-    log_level = helper.get_log_level()
-    helper.set_log_level(log_level)
-    helper.log_info(f"Logging level is set to: {log_level}")
+    for endpoint in (token_url, url):
+        if not get_circuit_breaker(helper, endpoint).allow_request():
+            return None
+    
+    try:
+        routing_rules = wiz_routing.parse_rules(helper.get_arg('routing_rules', name))
+    except ValueError as e:
+        helper.log_error(f"Exiting input {name} due to invalid routing rules. {e}")
+        return False
     
-    helper.log_info(f"Wiz authentication begins here...")
+    try:
+        entity_types = wiz_entity_types.parse_entity_types(helper.get_arg('entity_types', name), helper.get_sourcetype(name))
+    except ValueError as e:
+        helper.log_error(f"Exiting input {name} due to invalid entity types. {e}")
+        return False
+    
+    helper.log_info(f"Wiz authentication begins here for input {name}...")
     token = get_wiz_access_token(helper, token_url, CLIENT_ID, CLIENT_SECRET)
     
-    helper.log_info(f"Report creation phase begins here...")
-    report_id = create_cloud_resource_inventory_report(helper, url, token, project_id, rn)
+    if token is None:
+        helper.log_error(f"Exiting input {name} due to failure to authenticate.")
+        return False
+    
+    stats = {} if stats is None else stats
+    entity_writer = wiz_entity_types.EntityEventWriter(helper, ew, _event_writer_lock, entity_types, helper.get_output_index(name), url, tenant)
+    shared_report = open_shared_report(helper, name, CLIENT_ID, url, project_id, entity_types)
+    
+    if shared_report is None:
+        report_id, data = obtain_report(helper, name, url, token, project_id, rn, entity_types, stats, entity_writer)
+    else:
+        with shared_report.lock(_shutdown_event):
+            shared = shared_report.load()
+            if shared is not None:
+                report_id, rn, path = shared
+                helper.log_info(f"Using report {report_id} shared by another input with the same account and project.")
+                entity_writer.start_report(report_id)
+                try:
+                    data = parse_report_file(helper, path, stats, entity_types, entity_writer)
+                except (OSError, ValueError, csv.Error) as e:
+                    helper.log_error(f"Failed to parse report {report_id} from {path}. {e}")
+                    data = None
+            else:
+                report_id, data = obtain_report(helper, name, url, token, project_id, rn, entity_types, stats, entity_writer, shared_report)
     
     if report_id is None:
-        helper.log_error(f"Exiting due to failure to create report.")
-        sys.exit(1)
+        helper.log_error(f"Exiting input {name} due to failure to create report.")
+        return False
     
     meta_source = f"wiz_report_id://{report_id}"
+        
+    if data is None:
+        helper.log_error(f"Exiting input {name} due to failure to retrieve report id {report_id}.")
+        return False
+        
+    helper.log_info(f"Event ingestion phase begins here...")
     
-    helper.log_info(f"Report creation was successful, now awaiting report run completion.")
+    index = helper.get_output_index(name)
+    summary = wiz_run_summary.RunSummary(name, report_id)
+    counts = None
+    run_id = None
+    enricher = None
     
-    data = get_cloud_resource_inventory_report(helper, url, token, rn, report_id)
+    if wiz_entity_types.VIRTUAL_MACHINE not in entity_types:
+        helper.log_info(f"Input {name} does not collect {wiz_entity_types.VIRTUAL_MACHINE}, VM state and inventory are left unchanged.")
+        for _ in data:
+            pass
+        if report_read_failed(helper, name, report_id, data, stats):
+            return False
+    else:
+        sourcetype = entity_types.get(wiz_entity_types.VIRTUAL_MACHINE) or helper.get_sourcetype(name)
+        routing = wiz_routing.RoutingTable(routing_rules, index, sourcetype)
+        enricher = open_enricher(helper, name)
+        needs_tags = routing.uses_tags or (enricher is not None and enricher.tag is not None)
+    
+        index_path = get_fingerprint_index_path(helper, name)
+        loaded = time.time()
+        previous_index = wiz_fingerprint_index.FingerprintIndex.load(index_path)
+        helper.log_debug(f"Loaded fingerprint index for input {name}: {len(previous_index)} VMs, "
+                         f"{previous_index.nbytes} bytes in {(time.time() - loaded) * 1000:.1f}ms.")
+        index_builder = wiz_fingerprint_index.FingerprintIndexBuilder()
+        status_counts = {wiz_fingerprint_index.STATUS_NEW: 0, wiz_fingerprint_index.STATUS_CHANGED: 0, wiz_fingerprint_index.STATUS_UNCHANGED: 0}
+        inventory = open_inventory_collection(helper, name)
+        lookup_builder = wiz_vm_lookup.LookupIndexBuilder(name)
         
-    if data is None:
-        helper.log_error(f"Exiting due to failure to retrieve report id {report_id}.")
-        sys.exit(1)
+        with wiz_state_store.VmStateStore(get_checkpoint_dir(helper), name) as state_store:
         
-    helper.log_info(f"Collected {len(data)} VMs. Event ingestion phase begins here...")
+            state_store.start_run(report_id)
+            previous_snapshot = open_previous_snapshot(helper, name)
+            snapshot = open_snapshot_writer(helper, name, state_store.run_id)
+            change_count = 0
+            
+            for resource_id, fingerprint, d in data:
+                id_hash = wiz_fingerprint_index.id_hash(resource_id)
+                status = previous_index.status(id_hash, fingerprint)
+                status_counts[status] += 1
+                index_builder.add(id_hash, fingerprint)
+                wiz_object = wiz_inventory_kvstore.parse_wiz_object(d)
+                document = wiz_inventory_kvstore.project_vm(name, resource_id, fingerprint, d, wiz_object)
+                tags = wiz_inventory_kvstore.vm_tags(d) if needs_tags else {}
+                route = routing.route(document, tags)
+                body = wiz_routing.project_fields(d, route.fields)
+                if enricher is not None:
+                    enrichment = enricher.lookup(document, tags)
+                    if enrichment:
+                        body = dict(body, **{wiz_enrichment.EVENT_FIELD: enrichment})
+                if tenant:
+                    body = dict(body, tenant=tenant)
+                data_event = json.dumps(body, separators=(',', ':'))
+                event = helper.new_event(source=meta_source, index=route.index, sourcetype=route.sourcetype, host=url, data=data_event)
+                with _event_writer_lock:
+                    ew.write_event(event)
+                state_store.record(resource_id, fingerprint)
+                lookup_builder.add(document, d, wiz_object)
+                summary.add(document, len(data_event))
+                if previous_snapshot is not None and status == wiz_fingerprint_index.STATUS_CHANGED:
+                    try:
+                        previous_vm = previous_snapshot.get(resource_id)
+                        operations = wiz_change_events.json_patch(previous_vm, d) if previous_vm is not None else []
+                    except (ValueError, zlib.error) as e:
+                        helper.log_error(f"Failed to read the previous version of {resource_id} for input {name}. {e}")
+                        stats['errors'] = stats.get('errors', 0) + 1
+                        operations = []
+                    if operations:
+                        change_event = json.dumps(wiz_change_events.change_event(name, report_id, resource_id, document, operations),
+                                                  separators=(',', ':'))
+                        event = helper.new_event(source=meta_source, index=route.index, sourcetype=CHANGE_SOURCETYPE, host=url, data=change_event)
+                        with _event_writer_lock:
+                            ew.write_event(event)
+                        change_count += 1
+                if snapshot is not None:
+                    try:
+                        attributes = wiz_snapshot.filter_attributes(document['cloud_platform'], document['region'], document['subscription_id'],
+                                                                    tags if needs_tags else wiz_inventory_kvstore.vm_tags(d))
+                        snapshot.add(resource_id, fingerprint, d, attributes)
+                    except (OSError, TypeError, ValueError) as e:
+                        helper.log_error(f"Failed to write the inventory snapshot for input {name}, discarding it. {e}")
+                        stats['errors'] = stats.get('errors', 0) + 1
+                        snapshot.abort()
+                        snapshot = None
+                if inventory is not None:
+                    try:
+                        inventory.upsert(document)
+                    except Exception as e:
+                        helper.log_error(f"Failed to update the VM inventory lookup for input {name}, skipping it for this run. {e}")
+                        stats['errors'] = stats.get('errors', 0) + 1
+                        inventory = None
+            
+            if report_read_failed(helper, name, report_id, data, stats):
+                if snapshot is not None:
+                    snapshot.abort()
+                if previous_snapshot is not None:
+                    previous_snapshot.close()
+                previous_index.close()
+                return False
+            
+            counts = state_store.finish_run()
+            
+            if previous_snapshot is not None:
+                previous_snapshot.close()
+                helper.log_info(f"Wrote {change_count} change events for input {name}.")
+            
+            if snapshot is not None:
+                try:
+                    size = snapshot.commit()
+                    helper.log_info(f"Inventory snapshot for input {name}: {len(snapshot)} VMs, {snapshot.raw_bytes} bytes "
+                                    f"compressed to {size} in {snapshot.path}.")
+                except OSError as e:
+                    helper.log_error(f"Failed to save the inventory snapshot for input {name}. {e}")
+                    stats['errors'] = stats.get('errors', 0) + 1
+                    snapshot.abort()
+                wiz_snapshot.prune_snapshots(get_checkpoint_dir(helper), name,
+                                             get_int_setting(helper, 'snapshot_retention', DEFAULT_SNAPSHOT_RETENTION, minimum=0))
+            
+            if inventory is not None:
+                try:
+                    inventory.flush()
+                    inventory.delete(state_store.iter_unseen())
+                    if inventory.remove_legacy_keys:
+                        helper.save_check_point(INVENTORY_KEYS_CHECKPOINT_PREFIX + name, {'keyed_by_input': True})
+                    helper.log_info(f"VM inventory lookup for input {name}: {inventory.stats()}.")
+                except Exception as e:
+                    helper.log_error(f"Failed to update the VM inventory lookup for input {name}. {e}")
+                    stats['errors'] = stats.get('errors', 0) + 1
+        
+            state_store.prune_tombstones(TOMBSTONE_RETENTION_SECONDS)
+            run_id = state_store.run_id
+        
+        try:
+            lookup_builder.save(wiz_vm_lookup.index_path(get_checkpoint_dir(helper), name))
+        except OSError as e:
+            helper.log_error(f"Failed to save the VM address index for input {name}. {e}")
+            stats['errors'] = stats.get('errors', 0) + 1
+        
+        previous_index.close()
+        index_builder.save(index_path)
+        helper.log_debug(f"Fingerprint index for input {name}: " + " ".join(f"{k}={v}" for k, v in status_counts.items()) + ".")
+        
+        helper.log_info(f"VM state for input {name}: seen={counts['seen']} added={counts['added']} changed={counts['changed']} "
+                        f"unchanged={counts['unchanged']} removed={counts['removed']}.")
+        
+        if routing:
+            helper.log_info(f"Routing for input {name}: {routing.stats()}.")
+    
+    entity_writer.flush()
+    entity_counts = dict(entity_writer.counts)
     
-    for d in data:
-        data_event = json.dumps(d, separators=(',', ':'))
-        event = helper.new_event(source=meta_source, index=helper.get_output_index(), sourcetype=helper.get_sourcetype(), host=url, data=data_event)
+    helper.log_info(f"Collected {summary.total} VMs" + "".join(f", {count} {entity_type}" for entity_type, count in entity_counts.items()) + ".")
+    stats.update({'rows': summary.total + sum(entity_counts.values()), 'counts': counts, 'summary': summary})
+    
+    summary_body = summary.to_event(run_id, counts, time.time() - current_epoch)
+    if tenant:
+        summary_body['tenant'] = tenant
+    if entity_counts:
+        summary_body['entity_types'] = entity_counts if counts is None else dict(entity_counts, **{wiz_entity_types.VIRTUAL_MACHINE: summary.total})
+    if enricher is not None:
+        summary_body['enrichment'] = enricher.stats()
+        helper.log_info(f"Enrichment for input {name}: {enricher.stats()}.")
+    summary_event = json.dumps(summary_body, separators=(',', ':'))
+    event = helper.new_event(source=meta_source, index=index, sourcetype=SUMMARY_SOURCETYPE, host=url, data=summary_event)
+    with _event_writer_lock:
         ew.write_event(event)
     
+    helper.delete_check_point(PENDING_REPORT_CHECKPOINT_PREFIX + name)
+    helper.log_info(f"Wiz API governor for {url}: {get_governor(helper, url).stats()}.")
     helper.log_info(f"End of collection for report {report_id}.")
     
+    try:
+        next_run_time = getattr(helper, 'next_run_time', None)
+        schedule_prewarm(helper, name, next_run_time(name) if next_run_time is not None else None)
+    except Exception as e:
+        helper.log_warning(f"Could not pre-warm the next report of input {name}. {e}")
+    
+    return True
+
+def write_metrics(helper, ew, name, measurements):
+    """
+    Write measurements as wiz:virtualmachines:metrics events to the metrics index configured on the
+    Add-on Settings page. Does nothing when no metrics index is configured.
+    """
+    
+    metrics_index = (helper.get_global_setting('metrics_index') or '').strip()
+    
+    if not metrics_index or not measurements:
+        return
+    
+    now = time.time()
+    
+    with _event_writer_lock:
+        for measurement in measurements:
+            event = helper.new_event(source=f"wiz_virtual_machines://{name}", index=metrics_index, sourcetype=METRICS_SOURCETYPE,
+                                     time=now, data=json.dumps(measurement, separators=(',', ':')))
+            ew.write_event(event)
+
+def get_account_slot(helper, account):
+    """
+    Return the semaphore limiting how many stanzas collect the same Wiz account at the same time,
+    or a no-op context when Max Runs per Account is not set and only max_concurrent_inputs applies.
+    """
+    
+    limit = get_int_setting(helper, 'max_runs_per_account', DEFAULT_MAX_RUNS_PER_ACCOUNT, minimum=0)
+    
+    if limit == 0:
+        return contextlib.nullcontext()
+    
+    key = ((account or {}).get('username'), limit)
+    
+    with _account_slots_lock:
+        slot = _account_slots.get(key)
+        if slot is None:
+            slot = threading.BoundedSemaphore(limit)
+            _account_slots[key] = slot
+    
+    return slot
+
+def run_stanza(helper, ew, name):
+    """
+    Collect one input stanza and report its inventory counts and collection health as metrics.
+    
+    Returns:
+    bool: The result of collect_stanza.
+    """
+    
+    stats = {}
+    started = time.time()
+    result = False
+    tenant = helper.get_arg('tenant_id', name)
+    
+    try:
+        with get_account_slot(helper, helper.get_arg('global_account', name)):
+            waited = time.time() - started
+            if waited >= 1:
+                helper.log_info(f"Input {name} waited {int(waited)}s for another collection of the same account to finish.")
+            result = collect_stanza(helper, ew, name, stats)
+        return result
+    finally:
+        try:
+            duration = time.time() - started
+            if tenant:
+                helper.log_info(f"Input {name} (tenant {tenant}) finished in {duration:.1f}s with result {result}.")
+            measurements = [wiz_metrics.run_health_measurement(name, result, duration, stats)]
+            if 'summary' in stats:
+                measurements.extend(wiz_metrics.vm_count_measurements(name, stats['summary']))
+            if tenant:
+                for measurement in measurements:
+                    measurement['tenant'] = tenant
+            write_metrics(helper, ew, name, measurements)
+        except Exception as e:
+            helper.log_error(f"Failed to write metrics for input {name}. {e}")
+
+def load_input_stanzas(helper, names=None):
+    """
+    Re-read enabled input stanzas from the add-on's global configuration, one stanza at a time.
+    
+    Used at the start of collect_events and by daemon mode to pick up inputs added, edited or
+    disabled after the process started. Account references are resolved per stanza, so a stanza
+    whose account cannot be found is logged and skipped instead of failing every stanza.
+    
+    Args:
+    names (set): Only read these stanzas; every enabled stanza if None.
+    
+    Returns:
+    dict: Stanza name to stanza parameters, in the same shape as helper.get_input_stanza().
+    """
+    
+    config_path = os.path.join(APP_DIR, 'appserver', 'static', 'js', 'build', 'globalConfig.json')
+    with open(config_path) as f:
+        config = json.load(f)
+    
+    for service in config['pages']['inputs']['services']:
+        for entity in service['entity']:
+            entity.get('options', {}).pop('referenceName', None)
+    
+    global_config = GlobalConfig(helper.context_meta['server_uri'], helper.context_meta['session_key'], GlobalConfigSchema(config))
+    input_type = helper.get_input_type()
+    all_stanzas = global_config.inputs.load(input_type=input_type).get(input_type, [])
+    
+    stanzas = {}
+    for stanza in all_stanzas:
+        name = stanza.get('name')
+        if (names is not None and name not in names) or sutils.is_true(stanza.get('disabled', False)):
+            continue
+        try:
+            params = {k: copy.deepcopy(v) for k, v in stanza.items()}
+            account_name = params.get('global_account')
+            if account_name:
+                params['global_account'] = resolve_account(helper, account_name)
+                if params['global_account'] is None:
+                    raise ValueError(f"Account {account_name} does not exist.")
+        except Exception as e:
+            helper.log_error(f"Input {name} is skipped, its configuration could not be read. {e}")
+            continue
+        stanzas[name] = params
+    
+    return stanzas
+
+def resolve_account(helper, account):
+    """
+    Return the credential dict of an account, given the dict itself or the account name.
+    """
+    
+    if isinstance(account, dict) or not account:
+        return account
+    
+    return helper.get_user_credential_by_id(account)
+
+def additional_accounts(value):
+    """
+    Return the Additional Accounts of an input as a list of account names or credential dicts.
+    
+    The setting is normally a comma-separated string of account names, but the framework hands
+    over the credential dict of a single resolved account, and a list of names or dicts is accepted
+    as well.
+    """
+    
+    if not value:
+        return []
+    
+    if isinstance(value, (str, dict)):
+        value = [value]
+    
+    accounts = []
+    
+    for entry in value:
+        if isinstance(entry, str):
+            accounts.extend(a.strip() for a in entry.split(',') if a.strip())
+        elif isinstance(entry, dict) and entry.get('name'):
+            accounts.append(entry)
+    
+    return accounts
+
+def expand_tenant_stanzas(helper, stanzas):
+    """
+    Expand inputs that collect several Wiz tenants into one stanza per account.
+    
+    An input whose Additional Accounts setting lists other accounts keeps its own stanza for its
+    Global Account and gets a virtual stanza <input>_<account> for each additional account. Every
+    stanza has its own state, snapshots and metrics, and takes its tenant ID and, when set on the
+    account, its API and token URLs from the account. An input whose accounts cannot be read is
+    skipped without affecting the others.
+    
+    Returns:
+    dict: Stanza name to stanza parameters, in the same shape as helper.get_input_stanza().
+    """
+    
+    expanded = {}
+    
+    for name, params in stanzas.items():
+        try:
+            expanded.update(expand_tenant_stanza(helper, name, params, stanzas))
+        except Exception as e:
+            helper.log_error(f"Input {name} is skipped, its accounts could not be read. {e}")
+        
+    return expanded
+        
+def expand_tenant_stanza(helper, name, params, stanzas):
+    """
+    Return the stanzas of one input, see expand_tenant_stanzas.
+    """
+    
+    params = dict(params)
+    accounts = additional_accounts(params.pop('accounts', None))
+    
+    params['global_account'] = account = resolve_account(helper, params.get('global_account'))
+    expanded = {name: params}
+    
+    if not accounts or not account:
+        return expanded
+    
+    tenants = [(name, account)]
+    seen = {account.get('name')}
+    
+    for entry in accounts:
+        account_name = entry['name'] if isinstance(entry, dict) else entry
+        if account_name in seen:
+            continue
+        seen.add(account_name)
+        tenant_name = f"{name}_{account_name}"
+        if tenant_name in stanzas:
+            helper.log_error(f"Input {name} cannot collect account {account_name}: an input named {tenant_name} already exists.")
+            continue
+        credential = resolve_account(helper, entry)
+        if credential is None:
+            helper.log_error(f"Input {name} cannot collect account {account_name}: the account does not exist.")
+            continue
+        expanded[tenant_name] = dict(params, global_account=credential)
+        tenants.append((tenant_name, credential))
+        
+    for tenant_name, credential in tenants:
+        tenant_params = expanded[tenant_name]
+        tenant_params['tenant_id'] = credential.get('tenant_id') or credential.get('name')
+        for key in ('api_endpoint_url', 'token_url'):
+            if credential.get(key):
+                tenant_params[key] = credential[key]
+        
+    helper.log_info(f"Input {name} collects {len(tenants)} tenants: {', '.join(n for n, _ in tenants)}.")
+    
+    return expanded
+
+def get_input_intervals(helper):
+    
+    intervals = {}
+    
+    for name in helper.get_input_stanza():
+        try:
+            intervals[name] = int(helper.get_arg('interval', name))
+        except (TypeError, ValueError):
+            helper.log_warning(f"Input {name} has no usable interval, it will only run once.")
+            intervals[name] = 0
+    
+    return intervals
+
+def get_due_stanzas(helper, names, launched):
+    """
+    Return the stanzas whose interval has elapsed since their last launch.
+    
+    Outside daemon mode splunkd launches this single-instance input on one schedule for every
+    stanza, so a stanza with a longer interval than that schedule is skipped until it is due. The
+    launch schedule is taken to be the shortest interval; a stanza whose interval is not a multiple
+    of it drifts to the next launch after its interval has elapsed, which is logged as a warning.
+    """
+    
+    intervals = get_input_intervals(helper)
+    launch_interval = min([i for i in intervals.values() if i > 0], default=0)
+    due = []
+    
+    for name in names:
+        interval = intervals.get(name, 0)
+        if launch_interval and interval % launch_interval:
+            helper.log_warning(f"Input {name} has an interval of {interval}s, which is not a multiple of the "
+                               f"launch interval of {launch_interval}s. It runs at the first launch after its "
+                               f"interval has elapsed.")
+        try:
+            state = helper.get_check_point(LAST_RUN_CHECKPOINT_PREFIX + name) or {}
+        except Exception as e:
+            helper.log_warning(f"Could not read the last run of input {name}, running it now. {e}")
+            state = {}
+        if wiz_scheduler.is_due(state.get('launched'), interval, launched):
+            due.append(name)
+        else:
+            next_run = int(state['launched'] + intervals[name] - launched)
+            helper.log_info(f"Input {name} is not due yet, it runs again in about {next_run}s.")
+    
+    return due
+
+def run_daemon(helper, ew, max_workers):
+    """
+    Keep the process resident and run every stanza at its own interval until splunkd goes away.
+    """
+    
+    def _reload_intervals():
+        helper.input_stanzas = expand_tenant_stanzas(helper, load_input_stanzas(helper))
+        return get_input_intervals(helper)
+    
+    watched_files = [os.path.join(APP_DIR, d, 'inputs.conf') for d in ('default', 'local')]
+    
+    scheduler = wiz_scheduler.StanzaScheduler(helper, lambda name: run_stanza(helper, ew, name), max_workers,
+                                              stop_event=_shutdown_event,
+                                              spread=get_schedule_spread(helper),
+                                              max_jitter=get_int_setting(helper, 'schedule_jitter', 0, minimum=0))
+    helper.next_run_time = scheduler.next_run_time
+    scheduler.run_forever(get_input_intervals(helper), watched_files, _reload_intervals)
+
+def get_startup_delays(helper, names):
+    """
+    Compute how long each stanza waits before starting when all of them are launched together.
+    
+    Stanzas are placed in the startup window with the configured spread strategy, plus an optional
+    random jitter, and returned in the order they should start.
+    
+    Returns:
+    list: (delay in seconds, stanza name) tuples sorted by delay.
+    """
+    
+    window = get_int_setting(helper, 'startup_window', 0, minimum=0)
+    max_jitter = get_int_setting(helper, 'schedule_jitter', 0, minimum=0)
+    offsets = wiz_scheduler.compute_offsets({name: window for name in names}, get_schedule_spread(helper))
+    
+    delays = []
+    for name in names:
+        delay = offsets.get(name, 0)
+        if max_jitter > 0:
+            delay += random.uniform(0, max_jitter)
+        delays.append((delay, name))
+    
+    return sorted(delays)
+
+def collect_events(helper, ew):
+    
+    checkpoint_buffer = install_checkpoint_buffer(helper)
+    
+    try:
+        _collect_events(helper, ew)
+    finally:
+        if checkpoint_buffer is not None:
+            checkpoint_buffer.close()
+
+def _collect_events(helper, ew):
+    
+    if os.environ.get('AOB_TEST', 'false') != 'true':
+        helper.input_stanzas = load_input_stanzas(helper, set(helper.get_input_stanza()))
+        if not helper.input_stanzas:
+            helper.log_warning(f"No usable stanza found for input type: {helper.get_input_type()}")
+            return
+    
+    helper.input_stanzas = expand_tenant_stanzas(helper, helper.get_input_stanza())
+    names = helper.get_input_stanza_names()
+    if isinstance(names, str):
+        names = [names]
+    
+    log_level = helper.get_log_level()
+    helper.set_log_level(log_level)
+    helper.log_info(f"Logging level is set to: {log_level}")
+    
+    max_workers = get_int_setting(helper, 'max_concurrent_inputs', DEFAULT_MAX_CONCURRENT_INPUTS)
+    
+    if is_daemon_mode(helper):
+        get_http_session(pool_size=get_http_pool_size(helper, max_workers))
+        run_daemon(helper, ew, max_workers)
+        return
+    
+    launched = time.time()
+    names = get_due_stanzas(helper, names, launched)
+    if not names:
+        return
+    
+    max_workers = min(max_workers, len(names))
+    get_http_session(pool_size=get_http_pool_size(helper, max_workers))
+    
+    helper.log_info(f"Collecting {len(names)} input(s), up to {max_workers} at a time: {', '.join(names)}")
+    
+    failed = []
+    
+    started = time.time()
+    futures = {}
+    
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wiz_vms") as executor:
+        for delay, name in get_startup_delays(helper, names):
+            if delay > 0:
+                helper.log_info(f"Input {name} starts in {int(delay)}s.")
+            if _shutdown_event.wait(max(0, started + delay - time.time())):
+                break
+            helper.save_check_point(LAST_RUN_CHECKPOINT_PREFIX + name, {'launched': launched})
+            futures[executor.submit(run_stanza, helper, ew, name)] = name
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                if future.result() is False:
+                    failed.append(name)
+            except Exception as e:
+                helper.log_error(f"Collection for input {name} failed with an unexpected error. {e}")
+                failed.append(name)
+    
+    if failed:
+        helper.log_error(f"Collection failed for input(s): {', '.join(failed)}.")
+        sys.exit(1)
+    
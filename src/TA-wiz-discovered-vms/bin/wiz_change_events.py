@@ -0,0 +1,98 @@
+# encoding = utf-8
+
+"""
+Compact change events for VMs whose content changed between two runs.
+
+The previous version of a VM comes from the input's latest snapshot. The difference is expressed
+as an RFC 6902 JSON Patch (add / remove / replace operations with JSON Pointer paths), so an
+audit search reads a few hundred bytes per change instead of the full VM document.
+
+The wizJsonObject member holds the Wiz object as a JSON string; it is compared as the document it
+encodes, so its operations have paths such as /wizJsonObject/status.
+"""
+
+import json
+
+IGNORED_PATHS = frozenset(["/lastSeen"])
+EMBEDDED_JSON_PATHS = frozenset(["/wizJsonObject"])
+
+
+def escape_pointer(key):
+    """
+    Escape an object key for use in a JSON Pointer (RFC 6901).
+    """
+
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def json_patch(old, new, path=""):
+    """
+    Return the JSON Patch operations that turn `old` into `new`.
+
+    Objects are compared key by key and lists of equal length item by item; anything else that
+    differs is replaced as a whole. Equal subtrees are recognised with a single deep comparison,
+    which stops at the first difference, so unchanged parts of a large document cost almost
+    nothing.
+    """
+
+    if old == new:
+        return []
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        operations = []
+
+        for key, old_value in old.items():
+            child = f"{path}/{escape_pointer(key)}"
+            if child in IGNORED_PATHS:
+                continue
+            if key not in new:
+                operations.append({"op": "remove", "path": child})
+            elif old_value != new[key]:
+                operations.extend(json_patch(old_value, new[key], child))
+
+        for key, new_value in new.items():
+            child = f"{path}/{escape_pointer(key)}"
+            if key not in old and child not in IGNORED_PATHS:
+                operations.append({"op": "add", "path": child, "value": new_value})
+
+        return operations
+
+    if isinstance(old, str) and isinstance(new, str) and path in EMBEDDED_JSON_PATHS:
+        try:
+            return json_patch(json.loads(old), json.loads(new), path)
+        except ValueError:
+            pass
+
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        operations = []
+        for i, (old_value, new_value) in enumerate(zip(old, new)):
+            if old_value != new_value:
+                operations.extend(json_patch(old_value, new_value, f"{path}/{i}"))
+        return operations
+
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def changed_paths(old, new):
+    """
+    Return the JSON Pointer paths that differ between two VM documents, as listed in the "paths"
+    field of a change event.
+    """
+
+    return [operation["path"] for operation in json_patch(old, new)]
+
+
+def change_event(name, report_id, resource_id, document, operations):
+    """
+    Return the body of a wiz:virtualmachines:change event.
+    """
+
+    return {
+        "resource_id": resource_id,
+        "input": name,
+        "name": document.get("name", ""),
+        "report_id": report_id,
+        "lastSeen": document.get("last_seen", ""),
+        "paths": [operation["path"] for operation in operations],
+        "patch": operations,
+    }
@@ -0,0 +1,134 @@
+# encoding = utf-8
+
+"""
+Write-behind buffer for the add-on's checkpointer.
+
+solnlib's KVStoreCheckpointer.update issues one batch_save REST call per key. This wrapper keeps
+the latest state of each key in memory and writes all dirty keys with a single batch_update
+once enough keys are pending or enough time has passed, so repeated updates of the same key
+cost one write.
+"""
+
+import threading
+
+DEFAULT_MAX_PENDING = 500
+DEFAULT_MAX_DELAY_SECONDS = 5
+KVSTORE_MAX_BATCH_SIZE = 1000
+
+
+class WriteBehindCheckpointer:
+    """
+    Coalescing, batching wrapper around a solnlib checkpointer.
+
+    It exposes the same update/batch_update/get/delete interface, so it can replace
+    BaseModInput.ckpt and stay invisible to get_check_point and save_check_point.
+
+    Args:
+    checkpointer: The wrapped solnlib checkpointer (KVStoreCheckpointer or FileCheckpointer).
+    logger: Object with log_debug/log_info/log_error methods, normally the modular input helper.
+    max_pending (int): Flush as soon as this many distinct keys are dirty.
+    max_delay (float): Flush dirty keys at least this often, in seconds, from a background thread.
+    """
+
+    def __init__(self, checkpointer, logger, max_pending=DEFAULT_MAX_PENDING, max_delay=DEFAULT_MAX_DELAY_SECONDS):
+        self.checkpointer = checkpointer
+        self.logger = logger
+        self.max_pending = max(int(max_pending), 1)
+        self.max_delay = max_delay
+        self.updates = 0
+        self.writes = 0
+        self.flushes = 0
+
+        self._pending = {}
+        self._lock = threading.RLock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._flush_periodically, name="wiz_vms_checkpoint_flush")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def update(self, key, state):
+        with self._lock:
+            self._pending[key] = state
+            self.updates += 1
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self.flush()
+
+    def batch_update(self, states):
+        for state in states:
+            self.update(state["_key"], state["state"])
+
+    def write_through(self, key, state):
+        """
+        Write one key immediately, bypassing the buffer, for state other processes must see at once.
+        """
+
+        with self._lock:
+            self._pending.pop(key, None)
+        self.checkpointer.update(key, state)
+        self.writes += 1
+
+    def get(self, key):
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+        return self.checkpointer.get(key)
+
+    def delete(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+        self.checkpointer.delete(key)
+
+    def flush(self):
+        """
+        Write every dirty key through the wrapped checkpointer's batch_update.
+        """
+
+        with self._lock:
+
+            if not self._pending:
+                return
+
+            pending = self._pending
+            self._pending = {}
+            states = [{"_key": key, "state": state} for key, state in pending.items()]
+
+            try:
+                for start in range(0, len(states), KVSTORE_MAX_BATCH_SIZE):
+                    self.checkpointer.batch_update(states[start:start + KVSTORE_MAX_BATCH_SIZE])
+            except Exception as e:
+                for key, state in pending.items():
+                    self._pending.setdefault(key, state)
+                self.logger.log_error(f"Failed to flush {len(states)} checkpoint(s), will retry on next flush. {e}")
+                return
+
+            self.writes += len(states)
+            self.flushes += 1
+
+        self.logger.log_debug(f"Flushed {len(states)} checkpoint(s). {self.stats()}")
+
+    def coalescing_ratio(self):
+        """
+        Return how many updates were received per document written.
+        """
+
+        return self.updates / self.writes if self.writes else 0.0
+
+    def stats(self):
+        return f"updates={self.updates} writes={self.writes} flushes={self.flushes} coalescing_ratio={self.coalescing_ratio():.2f}"
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.max_delay):
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.log_error(f"Periodic checkpoint flush failed. {e}")
+
+    def close(self):
+        """
+        Stop the background flusher and write everything still pending.
+        """
+
+        self._closed.set()
+        self.flush()
+        self.logger.log_info(f"Checkpoint write-behind buffer closed. {self.stats()}")
@@ -0,0 +1,151 @@
+# encoding = utf-8
+
+"""
+Circuit breaker for Wiz endpoints, persisted in the add-on's checkpoint store.
+
+Because the state is saved in the checkpoint store, every input (and every run) sees the same
+breaker: once an endpoint has failed repeatedly, later runs skip it with one log line instead of
+authenticating, creating a report and polling until they time out. Each process keeps the state
+in memory and only reads the checkpoint when a run starts or before a transition, so successful
+Wiz calls cost no checkpoint access. Breaker keys are written straight through the write-behind
+buffer, so stanzas and processes sharing an endpoint do not overwrite each other's transitions.
+"""
+
+import hashlib
+import threading
+import time
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+CHECKPOINT_PREFIX = "circuit_breaker_"
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one Wiz endpoint.
+
+    closed: calls go through; `threshold` consecutive failures open the breaker.
+    open: runs are skipped until `cooldown` seconds have passed, then one run is let through
+        as a half-open probe.
+    half_open: the probe's first success closes the breaker, its first failure opens it again.
+        Other runs keep skipping while the probe is in flight.
+
+    Args:
+    helper: The modular input helper, used for logging and checkpoint access.
+    endpoint (str): The endpoint URL this breaker guards.
+    threshold (int): Consecutive failures that open the breaker.
+    cooldown (int): Seconds the breaker stays open before a probe is allowed.
+    """
+
+    def __init__(self, helper, endpoint, threshold, cooldown):
+        self.helper = helper
+        self.endpoint = endpoint
+        self.threshold = max(int(threshold), 1)
+        self.cooldown = max(int(cooldown), 0)
+        self.key = CHECKPOINT_PREFIX + hashlib.sha1(endpoint.encode("utf-8")).hexdigest()[:16]
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _load(self):
+        try:
+            state = self.helper.get_check_point(self.key)
+        except Exception as e:
+            self.helper.log_warning(f"Could not read circuit breaker state for {self.endpoint}, assuming closed. {e}")
+            state = None
+
+        if not isinstance(state, dict):
+            state = {}
+
+        state.setdefault("endpoint", self.endpoint)
+        state.setdefault("state", STATE_CLOSED)
+        state.setdefault("failures", 0)
+        state.setdefault("opened_at", 0)
+        state.setdefault("probe_started", 0)
+        state.setdefault("last_error", "")
+        self._state = state
+        return state
+
+    def _save(self, state):
+        self._state = state
+        checkpointer = getattr(self.helper, "ckpt", None)
+        try:
+            if hasattr(checkpointer, "write_through"):
+                checkpointer.write_through(self.key, state)
+            else:
+                self.helper.save_check_point(self.key, state)
+        except Exception as e:
+            self.helper.log_warning(f"Could not save circuit breaker state for {self.endpoint}. {e}")
+
+    def allow_request(self):
+        """
+        Decide whether a run may call this endpoint. Called at the start of a run, so it re-reads
+        the shared state.
+
+        Returns:
+        bool: True if the run may proceed (breaker closed, or this run is the half-open probe).
+        """
+
+        with self._lock:
+
+            state = self._load()
+            now = time.time()
+
+            if state["state"] == STATE_CLOSED:
+                return True
+
+            if state["state"] == STATE_HALF_OPEN and now < state["probe_started"] + self.cooldown:
+                self.helper.log_info(f"Circuit breaker for {self.endpoint} is half-open and a probe is running. Skipping this run.")
+                return False
+
+            if state["state"] == STATE_OPEN and now < state["opened_at"] + self.cooldown:
+                retry_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(state["opened_at"] + self.cooldown))
+                self.helper.log_warning(f"Circuit breaker for {self.endpoint} is open after {state['failures']} consecutive failures "
+                                        f"(last error: {state['last_error']}). Skipping this run until {retry_at}.")
+                return False
+
+            state["state"] = STATE_HALF_OPEN
+            state["probe_started"] = now
+            self._save(state)
+            self.helper.log_info(f"Circuit breaker for {self.endpoint} is half-open, this run is the probe.")
+            return True
+
+    def record_success(self):
+        """
+        Close the breaker and reset its failure count. A breaker already known to be closed with no
+        failures is left alone without reading the checkpoint.
+        """
+
+        with self._lock:
+
+            state = self._state
+            if state is not None and state["state"] == STATE_CLOSED and state["failures"] == 0:
+                return
+
+            state = self._load()
+
+            if state["state"] == STATE_CLOSED and state["failures"] == 0:
+                return
+
+            if state["state"] != STATE_CLOSED:
+                self.helper.log_info(f"Circuit breaker for {self.endpoint} is closed again, normal operation restored.")
+
+            state.update({"state": STATE_CLOSED, "failures": 0, "opened_at": 0, "probe_started": 0, "last_error": ""})
+            self._save(state)
+
+    def record_failure(self, reason):
+
+        with self._lock:
+
+            state = self._load()
+            state["failures"] += 1
+            state["last_error"] = str(reason)[:512]
+
+            if state["state"] == STATE_HALF_OPEN or (state["state"] == STATE_CLOSED and state["failures"] >= self.threshold):
+                state["state"] = STATE_OPEN
+                state["opened_at"] = time.time()
+                self.helper.log_error(f"Circuit breaker for {self.endpoint} opened after {state['failures']} consecutive failures. "
+                                      f"Runs will be skipped for {self.cooldown}s. Last error: {state['last_error']}")
+
+            self._save(state)
@@ -0,0 +1,269 @@
+# encoding = utf-8
+
+"""
+Ingest-time enrichment of VM events from a CSV lookup file or a KV store collection.
+
+The lookup is loaded at most once per run into a dict keyed by the join value (resource ID, hostname or
+the value of one tag), each row stored as a tuple of interned strings so repeated values such as
+owners and cost centres are kept once. Loading stops at a memory cap. While the run is ingested,
+the lookup columns of the matching row are added to the event under "enrichment", and the share
+of VMs that found a row is reported at the end.
+"""
+
+import csv
+import glob
+import gzip
+import os
+import threading
+
+from solnlib import splunk_rest_client
+from solnlib import utils as sutils
+
+MATCH_RESOURCE_ID = "resource_id"
+MATCH_HOSTNAME = "hostname"
+MATCH_TAG_PREFIX = "tag:"
+
+EVENT_FIELD = "enrichment"
+DEFAULT_MAX_MB = 64
+KVSTORE_PAGE_SIZE = 10000
+ENTRY_OVERHEAD_BYTES = 200
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def parse_match(value):
+    """
+    Return (kind, tag name) for the enrichment_match setting.
+
+    Raises:
+    ValueError: If the value is not resource_id, hostname or tag:<name>.
+    """
+
+    value = (value or MATCH_RESOURCE_ID).strip()
+
+    if value in (MATCH_RESOURCE_ID, MATCH_HOSTNAME):
+        return value, None
+
+    if value.startswith(MATCH_TAG_PREFIX) and value[len(MATCH_TAG_PREFIX):].strip():
+        return MATCH_TAG_PREFIX, value[len(MATCH_TAG_PREFIX):].strip()
+
+    raise ValueError(f"Unsupported enrichment match {value}. Use resource_id, hostname or tag:<tag name>.")
+
+
+def is_csv_lookup(source):
+    return source.lower().endswith((".csv", ".csv.gz"))
+
+
+def find_lookup_file(app_dir, source):
+    """
+    Return the path of a CSV lookup file: an absolute path as is, otherwise the file of that name in
+    this add-on's lookups directory or, failing that, in another app's lookups directory.
+    """
+
+    if os.path.isabs(source):
+        return source if os.path.isfile(source) else None
+
+    if os.path.basename(source) != source:
+        raise ValueError(f"Lookup file {source} must be a file name or an absolute path.")
+
+    candidates = [os.path.join(app_dir, "lookups", source)]
+    candidates.extend(sorted(glob.glob(os.path.join(os.path.dirname(app_dir), "*", "lookups", source))))
+
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+
+    return None
+
+
+def normalize_key(value):
+    return str(value).strip().lower()
+
+
+class EnrichmentIndex:
+    """
+    Hash index over the rows of a lookup.
+
+    Args:
+    source (str): Where the rows came from, for logging.
+    key_field (str): The lookup column used as the join key.
+    max_bytes (int): Approximate memory cap; rows beyond it are not loaded.
+    """
+
+    def __init__(self, source, key_field, max_bytes):
+        self.source = source
+        self.key_field = key_field
+        self.max_bytes = max_bytes
+        self.columns = ()
+        self.rows = 0
+        self.nbytes = 0
+        self.truncated = False
+        self._index = {}
+        self._strings = {}
+
+    def __len__(self):
+        return len(self._index)
+
+    def _intern(self, value):
+        value = "" if value is None else str(value)
+        return self._strings.setdefault(value, value)
+
+    def load(self, records, columns=None):
+        """
+        Index an iterable of dicts, keeping the first row of each key.
+
+        Args:
+        records: The lookup rows.
+        columns (list): The lookup columns; taken from the first row if not given.
+        """
+
+        for record in records:
+            if not self.columns:
+                columns = [c for c in (columns or record.keys()) if not c.startswith("_")]
+                self.key_field = self.key_field or columns[0]
+                self.columns = tuple(c for c in columns if c != self.key_field)
+
+            self.rows += 1
+            key = record.get(self.key_field)
+            if key is None or not str(key).strip():
+                continue
+            key = normalize_key(key)
+            if key in self._index:
+                continue
+
+            size = ENTRY_OVERHEAD_BYTES + len(key) + sum(len(str(record.get(c) or "")) for c in self.columns)
+            if self.nbytes + size > self.max_bytes:
+                self.truncated = True
+                break
+
+            self.nbytes += size
+            self._index[key] = tuple(self._intern(record.get(c)) for c in self.columns)
+
+        self._strings = {}
+        return self
+
+    def get(self, key):
+        """
+        Return the lookup columns of a key as a dict, without empty values, or None.
+        """
+
+        row = self._index.get(normalize_key(key))
+        if row is None:
+            return None
+
+        return {column: value for column, value in zip(self.columns, row) if value != ""}
+
+
+def load_csv(path, key_field, max_bytes):
+
+    opener = gzip.open if path.lower().endswith(".gz") else open
+
+    with opener(path, "rt", newline="", encoding="utf-8-sig") as fp:
+        reader = csv.DictReader(fp)
+        return EnrichmentIndex(path, key_field, max_bytes).load(reader, reader.fieldnames)
+
+
+def iter_kvstore(helper, collection):
+    """
+    Yield every document of a KV store collection, one page at a time. The collection can be given
+    as <app>/<collection> when it does not belong to this add-on.
+    """
+
+    app, _, name = collection.rpartition("/")
+    scheme, host, port = sutils.extract_http_scheme_host_port(helper.context_meta['server_uri'])
+    service = splunk_rest_client.SplunkRestClient(helper.context_meta['session_key'], app or helper.get_app_name(),
+                                                  owner="nobody", scheme=scheme, host=host, port=port)
+    data = service.kvstore[name].data
+    skip = 0
+
+    while True:
+        page = data.query(skip=skip, limit=KVSTORE_PAGE_SIZE)
+        yield from page
+        if len(page) < KVSTORE_PAGE_SIZE:
+            break
+        skip += len(page)
+
+
+def load_index(helper, app_dir, source, key_field, max_bytes):
+    """
+    Return the EnrichmentIndex of a lookup. A CSV file is loaded once and reused by later runs until
+    it changes; a KV store collection is read again on every call.
+
+    Raises:
+    ValueError: If the lookup file cannot be found.
+    """
+
+    if not is_csv_lookup(source):
+        return EnrichmentIndex(source, key_field, max_bytes).load(iter_kvstore(helper, source))
+
+    path = find_lookup_file(app_dir, source)
+    if path is None:
+        raise ValueError(f"Lookup file {source} was not found.")
+
+    stat = os.stat(path)
+    cache_key = (path, stat.st_mtime, stat.st_size, key_field, max_bytes)
+
+    with _cache_lock:
+        index = _cache.get(path)
+        if index is None or index[0] != cache_key:
+            index = (cache_key, load_csv(path, key_field, max_bytes))
+            _cache[path] = index
+
+    return index[1]
+
+
+class Enricher:
+    """
+    Per-run join of VMs against an EnrichmentIndex, counting hits and misses.
+
+    Args:
+    index (EnrichmentIndex): The loaded lookup.
+    match (tuple): The (kind, tag name) returned by parse_match.
+    """
+
+    def __init__(self, index, match):
+        self.index = index
+        self.kind, self.tag = match
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, document, tags):
+        """
+        Return the enrichment fields of a VM, or None when the lookup has no row for it.
+
+        Args:
+        document (dict): The VM's inventory projection (see wiz_inventory_kvstore.project_vm).
+        tags (dict): The VM's tags (see wiz_inventory_kvstore.vm_tags), used by tag matches.
+        """
+
+        if self.kind == MATCH_RESOURCE_ID:
+            row = self.index.get(document["resource_id"])
+        elif self.kind == MATCH_HOSTNAME:
+            name = document.get("name") or ""
+            row = self.index.get(name) if name else None
+            if row is None and "." in name:
+                row = self.index.get(name.split(".", 1)[0])
+        else:
+            value = tags.get(self.tag)
+            row = self.index.get(value) if value else None
+
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return row
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "source": self.index.source,
+            "match": self.kind + (self.tag or ""),
+            "keys": len(self.index),
+            "bytes": self.index.nbytes,
+            "truncated": self.index.truncated,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,168 @@
+# encoding = utf-8
+
+"""
+Wiz entity types collected by an input and the sourcetype of each.
+
+The entity_types input setting is a comma-separated list of Wiz graph entity types, each
+optionally followed by `=<sourcetype>`:
+
+    VIRTUAL_MACHINE, SERVERLESS, CONTAINER_IMAGE=wiz:images
+
+All types are requested in the same report and the rows are split by their "Entity Type" column
+while the report is parsed. Virtual machines keep the input's sourcetype and go through the VM
+pipeline (state, snapshots, inventory); other types are written as events of their own sourcetype
+as they are reached, through an EntityEventWriter that holds at most one batch of them.
+"""
+
+import collections
+import json
+import re
+
+VIRTUAL_MACHINE = "VIRTUAL_MACHINE"
+DEFAULT_ENTITY_TYPES = VIRTUAL_MACHINE
+ENTITY_TYPE_COLUMN = "Entity Type"
+
+DEFAULT_SOURCETYPES = {
+    "VIRTUAL_MACHINE_IMAGE": "wiz:vmimages",
+    "SERVERLESS": "wiz:serverless",
+    "CONTAINER": "wiz:containers",
+    "CONTAINER_IMAGE": "wiz:containerimages",
+    "CONTAINER_HOST": "wiz:containerhosts",
+    "KUBERNETES_CLUSTER": "wiz:kubernetesclusters",
+}
+
+ENTITY_TYPE_PATTERN = re.compile(r"^[A-Z][A-Z0-9_]*$")
+EVENT_BATCH_SIZE = 500
+
+
+def default_sourcetype(entity_type):
+    return DEFAULT_SOURCETYPES.get(entity_type, "wiz:" + entity_type.lower().replace("_", ""))
+
+
+def parse_entity_types(value, vm_sourcetype=None):
+    """
+    Return an ordered {entity type: sourcetype} dict for the entity_types setting of an input.
+
+    Args:
+    value (str): The setting; empty means virtual machines only.
+    vm_sourcetype (str): The input's sourcetype, used for VIRTUAL_MACHINE unless overridden.
+
+    Raises:
+    ValueError: If an entry is not an upper-case entity type or has an empty sourcetype.
+    """
+
+    types = collections.OrderedDict()
+
+    for entry in (value or DEFAULT_ENTITY_TYPES).split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        entity_type, sep, sourcetype = (part.strip() for part in entry.partition("="))
+        entity_type = entity_type.upper()
+
+        if not ENTITY_TYPE_PATTERN.match(entity_type):
+            raise ValueError(f"Invalid entity type {entity_type}. Use Wiz entity types such as VIRTUAL_MACHINE or SERVERLESS.")
+        if sep and not sourcetype:
+            raise ValueError(f"Missing sourcetype after {entity_type}=.")
+
+        if not sourcetype:
+            sourcetype = vm_sourcetype if entity_type == VIRTUAL_MACHINE and vm_sourcetype else default_sourcetype(entity_type)
+
+        types[entity_type] = sourcetype
+
+    if not types:
+        types[VIRTUAL_MACHINE] = vm_sourcetype or default_sourcetype(VIRTUAL_MACHINE)
+
+    return types
+
+
+def check_columns(fieldnames, requested):
+    """
+    Raise ValueError when the rows of a report cannot be told apart: several types were requested
+    and the report has no "Entity Type" column.
+    """
+
+    if len(requested) > 1 and ENTITY_TYPE_COLUMN not in (fieldnames or ()):
+        raise ValueError(f"The report has no {ENTITY_TYPE_COLUMN} column to split {', '.join(requested)} rows.")
+
+
+def row_entity_type(row, requested):
+    """
+    Return the entity type of a report row: its "Entity Type" column, or the only requested type
+    when the report has no such column. Returns None when the type of the row is unknown.
+    """
+
+    entity_type = row.get(ENTITY_TYPE_COLUMN)
+
+    if entity_type:
+        return entity_type.strip().upper()
+
+    return next(iter(requested)) if len(requested) == 1 else None
+
+
+class EntityEventWriter:
+    """
+    Writes the rows of non-VM entity types as events while the report is parsed, counting them per
+    type. Events are written in batches of batch_size under the shared event writer lock.
+
+    Args:
+    helper: The modular input helper, used to build the events.
+    ew: The event writer.
+    lock (threading.Lock): The lock serialising writes to ew across inputs.
+    sourcetypes (dict): The requested {entity type: sourcetype} (see parse_entity_types).
+    index (str): The index of the events.
+    host (str): The host of the events.
+    tenant (str): Optional tenant added to every event.
+    batch_size (int): Number of events held before they are written.
+    """
+
+    def __init__(self, helper, ew, lock, sourcetypes, index, host, tenant=None, batch_size=EVENT_BATCH_SIZE):
+        self.helper = helper
+        self.ew = ew
+        self.lock = lock
+        self.sourcetypes = sourcetypes
+        self.index = index
+        self.host = host
+        self.tenant = tenant
+        self.batch_size = batch_size
+        self.source = None
+        self.counts = collections.Counter()
+        self._pending = []
+
+    def start_report(self, report_id):
+        """
+        Set the report whose rows follow; their events get it as source.
+        """
+
+        self.source = f"wiz_report_id://{report_id}"
+
+    def add(self, entity_type, row):
+        """
+        Queue the event of one row, writing the batch once it is full.
+        """
+
+        if self.tenant:
+            row["tenant"] = self.tenant
+
+        sourcetype = self.sourcetypes.get(entity_type) or default_sourcetype(entity_type)
+        self._pending.append(self.helper.new_event(source=self.source, index=self.index, sourcetype=sourcetype, host=self.host,
+                                                   data=json.dumps(row, separators=(",", ":"))))
+        self.counts[entity_type] += 1
+
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the queued events.
+        """
+
+        if not self._pending:
+            return
+
+        with self.lock:
+            for event in self._pending:
+                self.ew.write_event(event)
+
+        self._pending = []
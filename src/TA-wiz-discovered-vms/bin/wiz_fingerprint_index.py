@@ -0,0 +1,230 @@
+# encoding = utf-8
+
+"""
+Compact fingerprint index for change detection on very large inventories.
+
+Each VM costs 16 bytes: a 64-bit hash of its resource ID and a 64-bit hash of its content, held
+in two parallel array('Q') buffers sorted by ID hash and searched with bisect. On disk the index
+is a flat binary file (header, ID hashes, content hashes) that is memory-mapped on load, so there
+is no deserialization step before the first lookup.
+"""
+
+import array
+import bisect
+import hashlib
+import heapq
+import mmap
+import operator
+import os
+import struct
+import sys
+
+MAGIC = b"WZFP"
+VERSION = 1
+HEADER = struct.Struct("<4sII Q")
+BYTE_ORDER_FLAG = 0 if sys.byteorder == "little" else 1
+SORT_CHUNK_SIZE = 1 << 16
+
+STATUS_NEW = "new"
+STATUS_CHANGED = "changed"
+STATUS_UNCHANGED = "unchanged"
+
+
+def id_hash(resource_id):
+    """
+    Return the 64-bit hash used as the index key of a resource ID.
+    """
+
+    return int.from_bytes(hashlib.blake2b(resource_id.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class FingerprintIndex:
+    """
+    Read-only, sorted fingerprint index, usually memory-mapped from a file written by
+    FingerprintIndexBuilder.save().
+    """
+
+    def __init__(self, ids=None, contents=None):
+        self._ids = ids if ids is not None else array.array("Q")
+        self._contents = contents if contents is not None else array.array("Q")
+        self._file = None
+        self._mmap = None
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-map an index file. A missing or unreadable file gives an empty index.
+        """
+
+        try:
+            fp = open(path, "rb")
+        except OSError:
+            return cls()
+
+        try:
+            header = fp.read(HEADER.size)
+            if len(header) < HEADER.size:
+                fp.close()
+                return cls()
+
+            magic, version, byte_order, count = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION or byte_order != BYTE_ORDER_FLAG:
+                fp.close()
+                return cls()
+
+            if count == 0:
+                fp.close()
+                return cls()
+
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(mapped)
+            start = HEADER.size
+            ids = view[start:start + count * 8].cast("Q")
+            contents = view[start + count * 8:start + count * 16].cast("Q")
+        except (OSError, ValueError, TypeError):
+            fp.close()
+            return cls()
+
+        index = cls(ids, contents)
+        index._file = fp
+        index._mmap = mapped
+        return index
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def nbytes(self):
+        return len(self._ids) * 16
+
+    def get(self, key):
+        """
+        Return the content hash stored for an ID hash, or None.
+        """
+
+        ids = self._ids
+        i = bisect.bisect_left(ids, key)
+        if i < len(ids) and ids[i] == key:
+            return self._contents[i]
+        return None
+
+    def status(self, key, content):
+        """
+        Classify a VM against this index as new, changed or unchanged.
+        """
+
+        previous = self.get(key)
+        if previous is None:
+            return STATUS_NEW
+        return STATUS_UNCHANGED if previous == content else STATUS_CHANGED
+
+    def close(self):
+        """
+        Release the memory map. Must be called before the file is replaced on Windows.
+        """
+
+        if self._mmap is not None:
+            self._ids.release()
+            self._contents.release()
+            self._ids = array.array("Q")
+            self._contents = array.array("Q")
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FingerprintIndexBuilder:
+    """
+    Collects (ID hash, content hash) pairs for one run and writes them as a sorted index file.
+    """
+
+    def __init__(self):
+        self._ids = array.array("Q")
+        self._contents = array.array("Q")
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, key, content):
+        self._ids.append(key)
+        self._contents.append(content)
+
+    def _sort_chunks(self):
+        """
+        Stable-sort the collected pairs by ID hash in place, one chunk of SORT_CHUNK_SIZE at a time,
+        so only one chunk exists as Python objects at once.
+
+        Returns:
+        list: (start, end) bounds of the sorted chunks, in insertion order.
+        """
+
+        ids, contents = self._ids, self._contents
+        bounds = []
+
+        for start in range(0, len(ids), SORT_CHUNK_SIZE):
+            end = min(start + SORT_CHUNK_SIZE, len(ids))
+            pairs = sorted(zip(ids[start:end], contents[start:end]), key=operator.itemgetter(0))
+            ids[start:end] = array.array("Q", [pair[0] for pair in pairs])
+            contents[start:end] = array.array("Q", [pair[1] for pair in pairs])
+            bounds.append((start, end))
+
+        return bounds
+
+    def build(self):
+        """
+        Return a sorted in-memory FingerprintIndex. Duplicate IDs keep their last content hash.
+
+        The chunks sorted by _sort_chunks are merged straight into the output arrays through
+        zero-copy views; the merge is stable, so the last pair added for an ID comes out last.
+        """
+
+        bounds = self._sort_chunks()
+        id_view, content_view = memoryview(self._ids), memoryview(self._contents)
+        runs = [(id_view[start:end], content_view[start:end]) for start, end in bounds]
+
+        sorted_ids = array.array("Q")
+        sorted_contents = array.array("Q")
+
+        try:
+            merged = heapq.merge(*(zip(run_ids, run_contents) for run_ids, run_contents in runs),
+                                 key=operator.itemgetter(0))
+            for key, content in merged:
+                if sorted_ids and sorted_ids[-1] == key:
+                    sorted_contents[-1] = content
+                    continue
+                sorted_ids.append(key)
+                sorted_contents.append(content)
+        finally:
+            for run_ids, run_contents in runs:
+                run_ids.release()
+                run_contents.release()
+            id_view.release()
+            content_view.release()
+
+        return FingerprintIndex(sorted_ids, sorted_contents)
+
+    def save(self, path):
+        """
+        Sort the collected pairs and atomically write them to path.
+
+        Returns:
+        FingerprintIndex: The in-memory index that was written.
+        """
+
+        index = self.build()
+        tmp_path = path + ".tmp"
+
+        with open(tmp_path, "wb") as fp:
+            fp.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER_FLAG, len(index)))
+            index._ids.tofile(fp)
+            index._contents.tofile(fp)
+
+        os.replace(tmp_path, path)
+        return index
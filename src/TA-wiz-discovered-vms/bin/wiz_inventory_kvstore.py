@@ -0,0 +1,197 @@
+# encoding = utf-8
+
+"""
+Current-state VM inventory kept in a KV store collection.
+
+One document per VM and input, keyed by input and cloud resource ID, holding a compact
+projection of the VM. The
+collection is published as the `wiz_vm_inventory` lookup, so searches that need the current
+inventory can use `| inputlookup wiz_vm_inventory` instead of deduplicating events over a long
+time range. Documents are upserted with chunked batch_save calls while a run is ingested, and
+the VMs that disappeared from the report are deleted once the run has finished.
+"""
+
+import json
+
+from solnlib import splunk_rest_client
+from solnlib import utils as sutils
+
+COLLECTION_NAME = "wiz_vm_inventory"
+KVSTORE_MAX_BATCH_SIZE = 1000
+DELETE_BATCH_SIZE = 200
+
+NAME_KEYS = ("name", "Name", "InstanceId", "instanceId", "vmId")
+OS_KEYS = ("operatingSystem", "OperatingSystem", "osType", "OsType", "os", "PlatformDetails", "Platform")
+POWER_STATE_KEYS = ("powerState", "PowerState", "state", "State", "status", "Status")
+
+
+def _first(obj, keys):
+    for key in keys:
+        value = obj.get(key)
+        if isinstance(value, dict):
+            value = value.get("Name", value.get("name"))
+        if isinstance(value, (str, int)) and value != "":
+            return str(value)
+    return ""
+
+
+def document_key(name, resource_id):
+    """
+    Return the KV store key of a VM's document. The key includes the input, so a VM collected by
+    two inputs, or by two tenants of one input, keeps one document per input.
+    """
+
+    return f"{name}:{resource_id}"
+
+
+def parse_wiz_object(vm):
+    """
+    Return the parsed "Wiz JSON Object" column of a VM, or an empty dict.
+    """
+
+    try:
+        wiz_object = json.loads(vm.get("wizJsonObject") or "{}")
+    except ValueError:
+        return {}
+
+    return wiz_object if isinstance(wiz_object, dict) else {}
+
+
+def vm_tags(vm):
+    """
+    Return the tags of a VM as a dict, whatever the provider's representation: a mapping (Azure
+    "tags", GCP "labels") or a list of Key/Value pairs (AWS "Tags").
+    """
+
+    for key in ("tags", "Tags", "labels", "Labels"):
+        value = vm.get(key)
+
+        if isinstance(value, dict):
+            return {str(k): "" if v is None else str(v) for k, v in value.items()}
+
+        if isinstance(value, list):
+            tags = {}
+            for item in value:
+                if isinstance(item, dict):
+                    tag_key = item.get("Key", item.get("key"))
+                    if tag_key is not None:
+                        tag_value = item.get("Value", item.get("value"))
+                        tags[str(tag_key)] = "" if tag_value is None else str(tag_value)
+            return tags
+
+    return {}
+
+
+def project_vm(name, resource_id, fingerprint, vm, wiz_object=None):
+    """
+    Return the KV store document for one VM.
+
+    Args:
+    name (str): The input stanza that collected the VM.
+    resource_id (str): The VM's cloud resource ID.
+    fingerprint (int): The VM's 64-bit content hash.
+    vm (dict): The parsed Cloud Native JSON, enriched with the report columns.
+    wiz_object (dict): The parsed "Wiz JSON Object", if the caller already has it.
+    """
+
+    if wiz_object is None:
+        wiz_object = parse_wiz_object(vm)
+
+    return {
+        "_key": document_key(name, resource_id),
+        "resource_id": resource_id,
+        "input": name,
+        "name": _first(vm, NAME_KEYS) or _first(wiz_object, NAME_KEYS),
+        "native_type": _first(wiz_object, ("nativeType", "type")),
+        "cloud_platform": _first(wiz_object, ("cloudPlatform", "cloud_platform")),
+        "os": _first(vm, OS_KEYS) or _first(wiz_object, OS_KEYS),
+        "power_state": _first(vm, POWER_STATE_KEYS) or _first(wiz_object, POWER_STATE_KEYS),
+        "region": vm.get("region", ""),
+        "subscription_id": vm.get("subscriptionID", ""),
+        "projects": vm.get("projects", ""),
+        "last_seen": vm.get("lastSeen", ""),
+        "fingerprint": f"{fingerprint:016x}",
+    }
+
+
+class VmInventoryCollection:
+    """
+    Buffered writer for the VM inventory collection.
+
+    Args:
+    helper: The modular input helper, used for logging and for the splunkd session.
+    name (str): The input stanza being collected.
+    batch_size (int): Documents per batch_save call, capped at the KV store's default limit.
+    remove_legacy_keys (bool): Also delete the documents an older version keyed by resource ID
+        alone, for every VM written.
+    """
+
+    def __init__(self, helper, name, batch_size=KVSTORE_MAX_BATCH_SIZE, remove_legacy_keys=False):
+        self.helper = helper
+        self.name = name
+        self.batch_size = min(max(int(batch_size), 1), KVSTORE_MAX_BATCH_SIZE)
+        self.remove_legacy_keys = remove_legacy_keys
+        self.upserted = 0
+        self.deleted = 0
+        self.requests = 0
+        self._pending = []
+
+        scheme, host, port = sutils.extract_http_scheme_host_port(helper.context_meta['server_uri'])
+        service = splunk_rest_client.SplunkRestClient(helper.context_meta['session_key'], helper.get_app_name(),
+                                                      owner="nobody", scheme=scheme, host=host, port=port)
+        self._data = service.kvstore[COLLECTION_NAME].data
+
+    def upsert(self, document):
+        """
+        Queue one document from project_vm() for upsert. Written every batch_size documents.
+        """
+
+        self._pending.append(document)
+
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+
+        if not self._pending:
+            return
+
+        self._data.batch_save(*self._pending)
+        self.requests += 1
+        self.upserted += len(self._pending)
+
+        if self.remove_legacy_keys:
+            for start in range(0, len(self._pending), DELETE_BATCH_SIZE):
+                chunk = [{"_key": document["resource_id"]} for document in self._pending[start:start + DELETE_BATCH_SIZE]]
+                self._data.delete(json.dumps({"$and": [{"input": self.name}, {"$or": chunk}]}))
+                self.requests += 1
+
+        self._pending = []
+
+    def delete(self, resource_ids):
+        """
+        Delete the documents of VMs that are no longer in the inventory.
+
+        Args:
+        resource_ids (iterable): Resource IDs to remove. Only documents owned by this input are
+            deleted, whichever key they were stored under.
+        """
+
+        chunk = []
+
+        for resource_id in resource_ids:
+            chunk.append({"resource_id": resource_id})
+            if len(chunk) >= DELETE_BATCH_SIZE:
+                self._delete_chunk(chunk)
+                chunk = []
+
+        if chunk:
+            self._delete_chunk(chunk)
+
+    def _delete_chunk(self, chunk):
+        self._data.delete(json.dumps({"$and": [{"input": self.name}, {"$or": chunk}]}))
+        self.requests += 1
+        self.deleted += len(chunk)
+
+    def stats(self):
+        return f"upserted={self.upserted} deleted={self.deleted} requests={self.requests}"
@@ -0,0 +1,72 @@
+# encoding = utf-8
+
+"""
+Inventory and collection-health measurements for a Splunk metrics index.
+
+Each measurement is one JSON event of the wiz:virtualmachines:metrics sourcetype: the numeric
+wiz.* fields are turned into metric values at index time by the metric-schema:wiz_vm_metrics
+transform, every other field becomes a dimension. Trend searches then run on `mstats` instead of
+counting VM events.
+"""
+
+VM_COUNT = "wiz.vm.count"
+
+RUN_SUCCESS = "wiz.run.success"
+RUN_SKIPPED = "wiz.run.skipped"
+RUN_DURATION = "wiz.run.duration"
+RUN_ROWS = "wiz.run.rows"
+RUN_BYTES = "wiz.run.bytes"
+RUN_ERRORS = "wiz.run.errors"
+RUN_ADDED = "wiz.run.added"
+RUN_CHANGED = "wiz.run.changed"
+RUN_REMOVED = "wiz.run.removed"
+
+
+def vm_count_measurements(name, summary):
+    """
+    Return one wiz.vm.count measurement per (platform, region, subscription, power state) seen in a run.
+
+    Args:
+    name (str): The input stanza.
+    summary (RunSummary): The run's streaming aggregates.
+    """
+
+    return [
+        {
+            VM_COUNT: count,
+            "input": name,
+            "platform": platform,
+            "region": region,
+            "subscription": subscription,
+            "power_state": power_state,
+        }
+        for (platform, region, subscription, power_state), count in sorted(summary.by_combination.items())
+    ]
+
+
+def run_health_measurement(name, result, duration, stats):
+    """
+    Return the collection-health measurement of one run.
+
+    Args:
+    name (str): The input stanza.
+    result (bool): The result of collect_stanza: True, False, or None when the run was skipped.
+    duration (float): Wall-clock duration of the run in seconds.
+    stats (dict): Counters filled in by collect_stanza.
+    """
+
+    measurement = {
+        "input": name,
+        RUN_SUCCESS: 1 if result is True else 0,
+        RUN_SKIPPED: 1 if result is None else 0,
+        RUN_DURATION: round(duration, 3),
+        RUN_ROWS: stats.get("rows", 0),
+        RUN_BYTES: stats.get("bytes", 0),
+        RUN_ERRORS: stats.get("errors", 0) + (1 if result is False else 0),
+    }
+
+    counts = stats.get("counts")
+    if counts is not None:
+        measurement.update({RUN_ADDED: counts["added"], RUN_CHANGED: counts["changed"], RUN_REMOVED: counts["removed"]})
+
+    return measurement
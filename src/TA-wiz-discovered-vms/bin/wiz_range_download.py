@@ -0,0 +1,300 @@
+# encoding = utf-8
+
+"""
+Parallel HTTP Range download of a report into a preallocated spool file.
+
+When the download URL answers with `Accept-Ranges: bytes` and a Content-Length, the body is split
+into contiguous byte ranges that are fetched concurrently, each worker writing at its own offset of
+a `.part` file sized up front. A range that fails part way is requested again from the last byte
+written. The progress of every range is saved next to the file every PROGRESS_SAVE_BYTES and when
+a range attempt ends, so a later download of the same report (same spool path, size and ETag)
+resumes where an attempt interrupted by a failure, a shutdown or a killed process stopped.
+The file is only renamed to its final path and marked complete once every range is complete and
+its length matches the Content-Length. A server that answers a range request with the whole body
+raises RangesNotSupported and the caller falls back to a single stream.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import wiz_report_spill
+
+PART_SUFFIX = ".part"
+PROGRESS_SUFFIX = ".ranges"
+MIN_RANGE_BYTES = 8 * 1024 * 1024
+PROGRESS_SAVE_BYTES = 4 * 1024 * 1024
+DEFAULT_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 2
+REQUEST_TIMEOUT_SECONDS = 300
+
+
+class RangesNotSupported(IOError):
+    """
+    The server ignored or rejected a Range request; download the body in a single stream instead.
+    """
+
+
+def supports_ranges(response):
+    """
+    Return the size of a streamed response's body when it can be fetched in byte ranges, else None.
+    """
+
+    if response.headers.get("Accept-Ranges", "").strip().lower() != "bytes":
+        return None
+
+    if response.headers.get("Content-Encoding", "identity").strip().lower() != "identity":
+        return None
+
+    content_length = response.headers.get("Content-Length")
+    return int(content_length) if content_length and content_length.isdigit() else None
+
+
+def range_count(size, parts, min_range_bytes=None):
+    """
+    Return how many ranges a body of `size` bytes is split into: at most `parts`, each at least
+    `min_range_bytes` (default MIN_RANGE_BYTES) long. Below 2 the body is not worth splitting.
+    """
+
+    return max(1, min(parts, size // max(1, min_range_bytes or MIN_RANGE_BYTES)))
+
+
+def split_ranges(size, parts):
+    """
+    Return `parts` contiguous (first byte, last byte) pairs covering `size` bytes.
+    """
+
+    step, extra = divmod(size, parts)
+    ranges = []
+    start = 0
+
+    for position in range(parts):
+        end = start + step + (1 if position < extra else 0)
+        ranges.append((start, end - 1))
+        start = end
+
+    return ranges
+
+
+def validator(response):
+    return response.headers.get("ETag") or response.headers.get("Last-Modified")
+
+
+class RangedDownload:
+    """
+    One ranged download of a URL to a spool file.
+
+    Args:
+    get (callable): Sends a GET: get(url, headers=..., stream=True, timeout=...) -> requests.Response.
+    url (str): The download URL.
+    path (str): The final spool file path (see wiz_report_spill.spill_path).
+    size (int): The body size announced by the server.
+    parts (int): How many ranges to fetch concurrently.
+    etag (str): The ETag or Last-Modified of the body, if any; progress saved for a different
+    value is discarded.
+    attempts (int): How many times a range is requested before the download fails.
+    stop_event (threading.Event): Set on shutdown; the download stops and keeps its progress.
+    """
+
+    def __init__(self, get, url, path, size, parts, etag=None, attempts=DEFAULT_ATTEMPTS, stop_event=None):
+        self.get = get
+        self.url = url
+        self.path = path
+        self.part_path = path + PART_SUFFIX
+        self.progress_path = path + PROGRESS_SUFFIX
+        self.size = size
+        self.etag = etag
+        self.attempts = attempts
+        self.stop_event = stop_event
+        self.retries = 0
+        self.resumed_bytes = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._unsupported = threading.Event()
+        self._next = self._load_progress(parts)
+
+    def _load_progress(self, parts):
+        """
+        Return the [first byte, next byte to fetch, last byte] of every range, from the saved
+        progress of an earlier attempt when it is for the same body and its part file is intact.
+        """
+
+        try:
+            with open(self.progress_path) as fp:
+                progress = json.load(fp)
+            if (progress["size"] == self.size and progress["etag"] == self.etag
+                    and os.path.getsize(self.part_path) == self.size):
+                ranges = [[int(a), int(n), int(b)] for a, n, b in progress["ranges"]]
+                self.resumed_bytes = sum(n - a for a, n, b in ranges)
+                return ranges
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        return [[start, start, end] for start, end in split_ranges(self.size, parts)]
+
+    def _save_progress(self):
+        """
+        Save the progress of every range. Only bytes already written to the part file are counted.
+        """
+
+        with self._save_lock:
+            with self._lock:
+                progress = {"size": self.size, "etag": self.etag, "ranges": [list(r) for r in self._next]}
+            tmp_path = self.progress_path + ".tmp"
+            with open(tmp_path, "w") as fp:
+                json.dump(progress, fp)
+            os.replace(tmp_path, self.progress_path)
+
+    def _preallocate(self):
+
+        mode = "r+b" if os.path.isfile(self.part_path) else "w+b"
+        with open(self.part_path, mode) as fp:
+            if os.fstat(fp.fileno()).st_size != self.size:
+                fp.truncate(self.size)
+                if hasattr(os, "posix_fallocate") and self.size:
+                    try:
+                        os.posix_fallocate(fp.fileno(), 0, self.size)
+                    except OSError:
+                        pass
+
+    def _stopped(self):
+        return self._unsupported.is_set() or (self.stop_event is not None and self.stop_event.is_set())
+
+    def _fetch_once(self, index, fp):
+        """
+        Request the rest of one range and write it at its offset. Returns when the range is
+        complete; raises on a failed or short response.
+        """
+
+        start, offset, end = self._next[index]
+        response = self.get(self.url, headers={"Range": f"bytes={offset}-{end}"}, stream=True,
+                            timeout=REQUEST_TIMEOUT_SECONDS)
+
+        try:
+            if response.status_code == 200:
+                self._unsupported.set()
+                raise RangesNotSupported(f"{self.url} answered a Range request with the whole body.")
+
+            content_range = response.headers.get("Content-Range", "")
+            if response.status_code != 206 or not content_range.startswith(f"bytes {offset}-{end}/"):
+                raise IOError(f"Range {offset}-{end} failed: HTTP {response.status_code}, Content-Range '{content_range}'.")
+
+            fp.seek(offset)
+            saved = offset
+            for chunk in response.iter_content(chunk_size=wiz_report_spill.CHUNK_SIZE):
+                if self._stopped():
+                    raise IOError("Download stopped.")
+                chunk = chunk[:end + 1 - offset]
+                fp.write(chunk)
+                offset += len(chunk)
+                if offset > end:
+                    break
+                if offset - saved >= PROGRESS_SAVE_BYTES:
+                    self._advance(index, fp, offset)
+                    self._save_progress()
+                    saved = offset
+        finally:
+            response.close()
+            self._advance(index, fp, offset)
+
+        if offset <= end:
+            raise IOError(f"Range {start}-{end} ended at byte {offset}.")
+
+    def _advance(self, index, fp, offset):
+        """
+        Flush the part file and move a range's next byte to `offset`, so saved progress never
+        counts bytes still in the write buffer.
+        """
+
+        fp.flush()
+        with self._lock:
+            self._next[index][1] = offset
+
+    def _fetch(self, index):
+        """
+        Download one range, resuming it from the last byte written after a failure.
+        """
+
+        if self._next[index][1] > self._next[index][2]:
+            return
+
+        last_error = None
+
+        with open(self.part_path, "r+b") as fp:
+            for attempt in range(self.attempts):
+                if self._stopped():
+                    break
+                if attempt:
+                    with self._lock:
+                        self.retries += 1
+                    if self.stop_event is not None and self.stop_event.wait(RETRY_DELAY_SECONDS * attempt):
+                        break
+                try:
+                    self._fetch_once(index, fp)
+                    return
+                except RangesNotSupported:
+                    raise
+                except Exception as e:
+                    last_error = e
+                finally:
+                    self._save_progress()
+
+        if self._unsupported.is_set():
+            raise RangesNotSupported(f"{self.url} does not serve byte ranges.")
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise IOError("Shutdown requested during the report download.")
+        raise IOError(f"Range {self._next[index][0]}-{self._next[index][2]} failed after {self.attempts} attempts. {last_error}")
+
+    def download(self):
+        """
+        Fetch every incomplete range concurrently, verify the file and move it to its final path.
+
+        Returns:
+        int: The number of bytes fetched by this attempt.
+
+        Raises:
+        RangesNotSupported: If the server does not honour Range requests (nothing is kept).
+        IOError: If a range still fails after its attempts, or shutdown was requested (progress is kept).
+        """
+
+        self._preallocate()
+        self._save_progress()
+        pending = [i for i, (start, offset, end) in enumerate(self._next) if offset <= end]
+
+        try:
+            if pending:
+                with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                    futures = [executor.submit(self._fetch, i) for i in pending]
+                    errors = [f.exception() for f in futures]
+                errors = [e for e in errors if e is not None]
+                if errors:
+                    raise next((e for e in errors if isinstance(e, RangesNotSupported)), errors[0])
+        except RangesNotSupported:
+            self.discard()
+            raise
+
+        covered = sum(offset - start for start, offset, end in self._next)
+        written = os.path.getsize(self.part_path)
+        if covered != self.size or written != self.size:
+            self.discard()
+            raise IOError(f"Downloaded {covered} of {self.size} bytes, file has {written} bytes.")
+
+        os.replace(self.part_path, self.path)
+        wiz_report_spill.mark_complete(self.path)
+        self._remove(self.progress_path)
+        return self.size - self.resumed_bytes
+
+    def discard(self):
+        self._remove(self.part_path)
+        self._remove(self.progress_path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        return {"ranges": len(self._next), "retries": self.retries, "resumed_bytes": self.resumed_bytes}
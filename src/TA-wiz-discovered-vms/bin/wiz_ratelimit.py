@@ -0,0 +1,234 @@
+# encoding = utf-8
+
+"""
+Node-wide Wiz API governor shared by every collector process on this host.
+
+The governor keeps a token bucket, a set of concurrency leases and a back-off deadline in a small
+JSON state file under the modular input's checkpoint directory. Every read-modify-write of that
+file happens under an exclusive file lock, so separate input processes see the same limits.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+STATE_FILE_PREFIX = "wiz_api_governor_"
+MIN_RATE = 0.05
+INCREASE_FRACTION = 0.05
+DECREASE_FACTOR = 0.5
+DEFAULT_RETRY_AFTER_SECONDS = 30
+LEASE_TTL_SECONDS = 1800
+MAX_WAIT_STEP_SECONDS = 1.0
+THROTTLED_STATUS_CODES = (429, 503)
+
+
+@contextlib.contextmanager
+def _locked(path):
+    with open(path, "a+") as fp:
+        if os.name == "nt":
+            fp.seek(0)
+            msvcrt.locking(fp.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                fp.seek(0)
+                msvcrt.locking(fp.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+
+
+def parse_retry_after(response, default=DEFAULT_RETRY_AFTER_SECONDS):
+    """
+    Return the Retry-After delay of a response in seconds. Only the delta-seconds form is honoured.
+    """
+
+    value = response.headers.get("Retry-After")
+
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return float(default)
+
+
+class WizApiGovernor:
+    """
+    Cross-process token bucket and concurrency limiter for one Wiz API endpoint.
+
+    The refill rate adapts AIMD style: every successful call adds a small fraction of the
+    configured rate back, every throttled (429/503) call halves it and blocks all callers until
+    the server's Retry-After has passed.
+
+    Args:
+    helper: The modular input helper, used for logging.
+    state_dir (str): Directory holding the shared state file, normally the checkpoint directory.
+    endpoint (str): URL of the API endpoint; its host and path select the state file.
+    rate (float): Maximum sustained requests per second across all processes.
+    max_concurrency (int): Maximum number of requests in flight across all processes.
+    """
+
+    def __init__(self, helper, state_dir, endpoint, rate, max_concurrency):
+        self.helper = helper
+        self.endpoint = endpoint
+        self.max_rate = max(float(rate), MIN_RATE)
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.capacity = max(self.max_rate, 1.0)
+
+        parsed = urlparse(endpoint)
+        key = hashlib.sha1(f"{parsed.netloc}{parsed.path}".encode("utf-8")).hexdigest()[:16]
+        self.state_path = os.path.join(state_dir, f"{STATE_FILE_PREFIX}{key}.json")
+        self.lock_path = self.state_path + ".lock"
+
+        self._thread_lock = threading.Lock()
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.throttled = 0
+
+    def _load(self, now):
+        try:
+            with open(self.state_path) as fp:
+                state = json.load(fp)
+        except (OSError, ValueError):
+            state = {}
+
+        state.setdefault("rate", self.max_rate)
+        state.setdefault("tokens", self.capacity)
+        state.setdefault("updated", now)
+        state.setdefault("backoff_until", 0)
+        state.setdefault("leases", {})
+
+        state["rate"] = min(state["rate"], self.max_rate)
+        elapsed = max(0.0, now - state["updated"])
+        state["tokens"] = min(self.capacity, state["tokens"] + elapsed * state["rate"])
+        state["updated"] = now
+        state["leases"] = {k: v for k, v in state["leases"].items() if v > now}
+
+        return state
+
+    def _save(self, state):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(state, fp)
+        os.replace(tmp_path, self.state_path)
+
+    def _try_acquire(self, lease_id):
+        """
+        Take one token and one concurrency lease if both are available.
+
+        Returns:
+        float: 0 if acquired, otherwise the number of seconds worth waiting before trying again.
+        """
+
+        with self._thread_lock, _locked(self.lock_path):
+
+            now = time.time()
+            state = self._load(now)
+
+            if state["backoff_until"] > now:
+                wait = state["backoff_until"] - now
+            elif len(state["leases"]) >= self.max_concurrency:
+                wait = MAX_WAIT_STEP_SECONDS
+            elif state["tokens"] < 1:
+                wait = (1 - state["tokens"]) / state["rate"]
+            else:
+                state["tokens"] -= 1
+                state["leases"][lease_id] = now + LEASE_TTL_SECONDS
+                wait = 0
+
+            self._save(state)
+
+        return wait
+
+    def _release(self, lease_id):
+
+        with self._thread_lock, _locked(self.lock_path):
+            state = self._load(time.time())
+            state["leases"].pop(lease_id, None)
+            self._save(state)
+
+    @contextlib.contextmanager
+    def slot(self, kind, stop_event=None):
+        """
+        Block until the endpoint's rate and concurrency limits allow one more call.
+
+        Args:
+        kind (str): Label of the call, used in log messages (e.g. "createReport").
+        stop_event (threading.Event): Optional event that aborts the wait when set.
+        """
+
+        lease_id = uuid.uuid4().hex
+        started = time.time()
+
+        while True:
+            wait = self._try_acquire(lease_id)
+            if wait <= 0:
+                break
+            step = min(wait, MAX_WAIT_STEP_SECONDS)
+            if stop_event is None:
+                time.sleep(step)
+            elif stop_event.wait(step):
+                raise RuntimeError(f"Shutdown requested while waiting for the Wiz API governor ({kind}).")
+
+        waited = time.time() - started
+
+        if waited > 0.01:
+            self.waits += 1
+            self.wait_seconds += waited
+            log = self.helper.log_info if waited >= MAX_WAIT_STEP_SECONDS else self.helper.log_debug
+            log(f"Waited {waited:.2f}s for the Wiz API governor before {kind} on {urlparse(self.endpoint).netloc}.")
+
+        try:
+            yield
+        finally:
+            self._release(lease_id)
+
+    def record_response(self, kind, response):
+        """
+        Adapt the shared rate to the outcome of a call.
+
+        Returns:
+        float: The Retry-After delay in seconds when the call was throttled, otherwise 0.
+        """
+
+        throttled = response.status_code in THROTTLED_STATUS_CODES
+
+        with self._thread_lock, _locked(self.lock_path):
+
+            now = time.time()
+            state = self._load(now)
+            old_rate = state["rate"]
+
+            if throttled:
+                retry_after = parse_retry_after(response)
+                state["rate"] = max(MIN_RATE, old_rate * DECREASE_FACTOR)
+                state["tokens"] = min(state["tokens"], 0)
+                state["backoff_until"] = max(state["backoff_until"], now + retry_after)
+            else:
+                retry_after = 0
+                state["rate"] = min(self.max_rate, old_rate + self.max_rate * INCREASE_FRACTION)
+
+            self._save(state)
+
+        if throttled:
+            self.throttled += 1
+            self.helper.log_warning(f"Wiz API throttled {kind} with status {response.status_code}. "
+                                    f"Rate lowered from {old_rate:.2f}/s to {state['rate']:.2f}/s, "
+                                    f"backing off for {retry_after:.0f}s (max {self.max_rate:.2f}/s, "
+                                    f"concurrency {self.max_concurrency}).")
+
+        return retry_after
+
+    def stats(self):
+        return f"waits={self.waits} wait_seconds={self.wait_seconds:.1f} throttled={self.throttled}"
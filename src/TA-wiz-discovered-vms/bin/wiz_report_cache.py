@@ -0,0 +1,171 @@
+# encoding = utf-8
+
+"""
+Node-wide sharing of downloaded Wiz reports between inputs that ask for the same report.
+
+Inputs that only differ by index, routing or enrichment would otherwise each create, poll and
+download an identical report. The report is identified by the Wiz account, API endpoint, project
+and report parameters. The first input to need it takes an exclusive lock for that key, obtains the
+report and spools the CSV to the checkpoint directory; inputs that arrive while it is working wait
+on the lock, then find the spooled copy and parse it instead of calling Wiz, as long as it is
+within the sharing window.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+SPOOL_DIR_NAME = "wiz_report_spool"
+FILE_PREFIX = "wiz_report_"
+LOCK_POLL_SECONDS = 1.0
+
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+
+def report_key(client_id, api_url, project_id, entity_types):
+    """
+    Return the identifier of a report: a hash of everything that determines its content.
+    """
+
+    params = json.dumps([client_id, api_url, project_id, sorted(entity_types)], separators=(',', ':'))
+    return hashlib.sha1(params.encode("utf-8")).hexdigest()[:20]
+
+
+def _thread_lock(key):
+    with _thread_locks_lock:
+        return _thread_locks.setdefault(key, threading.Lock())
+
+
+@contextlib.contextmanager
+def _file_lock(path, stop_event=None):
+    """
+    Hold an exclusive lock on a file for as long as a report takes to obtain, which can be minutes.
+    """
+
+    with open(path, "a+") as fp:
+        if os.name == "nt":
+            while True:
+                try:
+                    fp.seek(0)
+                    msvcrt.locking(fp.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if stop_event is None:
+                        time.sleep(LOCK_POLL_SECONDS)
+                    elif stop_event.wait(LOCK_POLL_SECONDS):
+                        raise InterruptedError(f"Shutdown requested while waiting for {path}.")
+        else:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                fp.seek(0)
+                msvcrt.locking(fp.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+
+
+class SharedReport:
+    """
+    The spooled copy of one report, shared by every input asking for the same key.
+
+    Args:
+    checkpoint_dir (str): The modular input's checkpoint directory.
+    key (str): The report key (see report_key).
+    window (int): How many seconds a spooled report may be reused after it was downloaded.
+    """
+
+    def __init__(self, checkpoint_dir, key, window):
+        self.key = key
+        self.window = window
+        self.spool_dir = os.path.join(checkpoint_dir, SPOOL_DIR_NAME)
+        os.makedirs(self.spool_dir, exist_ok=True)
+        base = os.path.join(self.spool_dir, FILE_PREFIX + key)
+        self.csv_path = base + ".csv"
+        self.meta_path = base + ".json"
+        self.lock_path = base + ".lock"
+
+    @contextlib.contextmanager
+    def lock(self, stop_event=None):
+        """
+        Hold the report's lock: threads of this process queue on a thread lock, other processes on
+        a file lock.
+        """
+
+        with _thread_lock(self.key), _file_lock(self.lock_path, stop_event):
+            yield
+
+    def load(self):
+        """
+        Return (report ID, report name, CSV path) of the spooled report, or None when there is
+        none or it is older than the sharing window. Call with the lock held.
+        """
+
+        try:
+            with open(self.meta_path) as fp:
+                meta = json.load(fp)
+            if time.time() - meta["downloaded"] > self.window or os.path.getsize(self.csv_path) != meta["size"]:
+                return None
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return meta["report_id"], meta["report_name"], self.csv_path
+
+    def store(self, report_id, report_name, content):
+        """
+        Spool a downloaded report. The CSV is written before its metadata, so readers never see
+        metadata pointing at a partial file.
+        """
+
+        tmp_path = self.csv_path + ".tmp"
+        with open(tmp_path, "wb") as fp:
+            fp.write(content)
+        os.replace(tmp_path, self.csv_path)
+
+        self._store_meta(report_id, report_name, len(content))
+
+    def store_file(self, report_id, report_name, path):
+        """
+        Spool a report that was downloaded to a file, by moving the file. It must be on the same
+        filesystem as the checkpoint directory.
+        """
+
+        os.replace(path, self.csv_path)
+
+        self._store_meta(report_id, report_name, os.path.getsize(self.csv_path))
+
+    def _store_meta(self, report_id, report_name, size):
+
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump({"report_id": report_id, "report_name": report_name, "downloaded": time.time(), "size": size}, fp)
+        os.replace(tmp_path, self.meta_path)
+
+        self.prune()
+
+    def prune(self):
+        """
+        Delete the spooled reports of every key, this one excepted, that are past the sharing window.
+        """
+
+        now = time.time()
+
+        for file_name in os.listdir(self.spool_dir):
+            if not file_name.startswith(FILE_PREFIX) or file_name.startswith(FILE_PREFIX + self.key):
+                continue
+            path = os.path.join(self.spool_dir, file_name)
+            try:
+                if file_name.endswith((".csv", ".json")) and now - os.path.getmtime(path) > self.window:
+                    os.remove(path)
+            except OSError:
+                continue
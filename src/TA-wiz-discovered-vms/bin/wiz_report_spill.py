@@ -0,0 +1,228 @@
+# encoding = utf-8
+
+"""
+Spill-to-disk handling of large report downloads.
+
+A report whose size exceeds the configured memory budget is streamed to a spool file in the
+checkpoint directory instead of being held in memory, then parsed through a read-only mmap. While
+the file is mapped, a row-offset index (the start of every CSV record, quoted line breaks
+included) is built from it, so records can be read in order or by position without copying the
+file. The rows are parsed from the mmap while the caller ingests them (see SpilledRows), so the
+parsed report is never held in memory as a whole either. The spool file is named after the report,
+marked complete once its size has been checked, and kept until the report has been parsed: an
+attempt that fails after the download leaves it for the next attempt at the same report, which
+parses it again without downloading it.
+"""
+
+import array
+import csv
+import mmap
+import os
+import shutil
+import time
+
+FILE_PREFIX = "wiz_spill_"
+FILE_SUFFIX = ".csv"
+COMPLETE_SUFFIX = ".complete"
+CHUNK_SIZE = 1024 * 1024
+FREE_SPACE_MARGIN = 1.1
+STALE_SECONDS = 86400
+
+
+def spill_path(checkpoint_dir, report_id):
+    safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(report_id))
+    return os.path.join(checkpoint_dir, f"{FILE_PREFIX}{safe_id}{FILE_SUFFIX}")
+
+
+def is_complete(path):
+    """
+    Return True when a spool file was downloaded in full and still has the size recorded then.
+    """
+
+    try:
+        with open(path + COMPLETE_SUFFIX) as fp:
+            return int(fp.read()) == os.path.getsize(path)
+    except (OSError, ValueError):
+        return False
+
+
+def mark_complete(path):
+    with open(path + COMPLETE_SUFFIX, "w") as fp:
+        fp.write(str(os.path.getsize(path)))
+
+
+def remove(path):
+    for file_path in (path + COMPLETE_SUFFIX, path):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+
+def prune(checkpoint_dir, max_age=STALE_SECONDS):
+    """
+    Delete spool files left behind by runs that failed long ago.
+    """
+
+    now = time.time()
+
+    for file_name in os.listdir(checkpoint_dir):
+        if file_name.startswith(FILE_PREFIX):
+            path = os.path.join(checkpoint_dir, file_name)
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.remove(path)
+            except OSError:
+                continue
+
+
+def should_spill(size, budget_bytes):
+    """
+    Return True when a download of `size` bytes (None if unknown) must go to disk.
+    """
+
+    return size is None or size > budget_bytes
+
+
+def has_free_space(directory, size):
+    return size is None or shutil.disk_usage(directory).free > size * FREE_SPACE_MARGIN
+
+
+def stream_to_file(response, path, expected_size=None, stop_event=None):
+    """
+    Write the body of a streamed requests response to a spool file and mark it complete.
+
+    Raises:
+    IOError: If the body is shorter or longer than its Content-Length, or shutdown was requested.
+    """
+
+    tmp_path = path + ".part"
+    written = 0
+
+    with open(tmp_path, "wb") as fp:
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if stop_event is not None and stop_event.is_set():
+                raise IOError("Shutdown requested during the report download.")
+            fp.write(chunk)
+            written += len(chunk)
+
+    if expected_size is not None and written != expected_size:
+        os.remove(tmp_path)
+        raise IOError(f"Downloaded {written} bytes, expected {expected_size}.")
+
+    os.replace(tmp_path, path)
+    mark_complete(path)
+    return written
+
+
+class SpilledReport:
+    """
+    Read-only mmap of a spooled report CSV with an index of record start offsets.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fp = open(path, "rb")
+        self.size = os.fstat(self._fp.fileno()).st_size
+
+        if self.size == 0:
+            self._mmap = None
+            self.offsets = array.array("Q")
+        else:
+            self._mmap = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self.offsets = self._index_records()
+
+    def _index_records(self):
+        """
+        Return the start offset of every CSV record. A line with an odd number of quote characters
+        opens (or closes) a quoted field, so the record continues on the next line.
+
+        Raises:
+        ValueError: If the file ends inside a quoted field, i.e. it was cut short.
+        """
+
+        offsets = array.array("Q")
+        mapped = self._mmap
+        mapped.seek(0)
+        position = 0
+        in_quotes = False
+
+        while position < self.size:
+            line = mapped.readline()
+            if not in_quotes:
+                offsets.append(position)
+            if line.count(b'"') % 2:
+                in_quotes = not in_quotes
+            position += len(line)
+
+        if in_quotes:
+            self.close()
+            raise ValueError(f"{self.path} ends inside a quoted field, the file is incomplete.")
+
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def record(self, position):
+        """
+        Return the raw bytes of one record (the header is record 0).
+        """
+
+        end = self.offsets[position + 1] if position + 1 < len(self.offsets) else self.size
+        return self._mmap[self.offsets[position]:end]
+
+    def iter_text(self, start=0):
+        """
+        Yield the records from a position onwards as decoded text, one record per item, for csv.reader.
+        """
+
+        for position in range(start, len(self.offsets)):
+            yield self.record(position).decode("utf-8-sig" if position == 0 else "utf-8")
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SpilledRows:
+    """
+    Rows parsed from a SpilledReport while the caller iterates over them.
+
+    The report is closed when the iteration ends or is abandoned; `on_complete` is only called once
+    every row has been read. A read or CSV error ends the iteration early and is kept in `error`,
+    for the caller to check before it treats the rows it got as the whole report.
+
+    Args:
+    report (SpilledReport): The mapped report, closed by this object.
+    rows (iterator): The parsed rows, read from report.iter_text().
+    on_complete (callable): Optional, e.g. deletes the spool file.
+    """
+
+    def __init__(self, report, rows, on_complete=None):
+        self.report = report
+        self.error = None
+        self._rows = rows
+        self._on_complete = on_complete
+
+    def __iter__(self):
+
+        try:
+            yield from self._rows
+        except (OSError, ValueError, csv.Error) as e:
+            self.error = e
+        finally:
+            self.report.close()
+
+        if self.error is None and self._on_complete is not None:
+            self._on_complete()
@@ -0,0 +1,260 @@
+# encoding = utf-8
+
+"""
+Collection-time routing of VM events to indexes and sourcetypes.
+
+An input's routing_rules setting holds an ordered JSON list of rules. The first rule whose
+conditions all match a VM decides the index and sourcetype of its event and, optionally, which
+top-level fields the event keeps; VMs that match no rule use the input's index and sourcetype.
+
+    [
+      {"match": {"platform": "AWS", "tag": "env=prod"}, "index": "aws_prod"},
+      {"match": {"subscription": ["1234*", "5678*"]}, "index": "azure_nonprod", "fields": ["id", "name", "tags"]}
+    ]
+
+Conditions are matched case-insensitively, accept `*` wildcards and a list of alternatives:
+`platform`, `subscription`, `region`, `project` (any of the VM's projects) and `tag` (`key=value`,
+or `key` alone for "has this tag"). The rules are compiled once per run into a table keyed by
+platform, and routes of VMs that differ only in attributes no rule looks at are cached, so
+routing adds a dictionary lookup to most events.
+"""
+
+import collections
+import fnmatch
+import json
+import re
+
+CONDITIONS = ("platform", "subscription", "region", "project", "tag")
+ALWAYS_KEPT_FIELDS = ("lastSeen",)
+MAX_CACHED_ROUTES = 4096
+
+Route = collections.namedtuple("Route", ["index", "sourcetype", "fields"])
+
+
+def _compile_pattern(value):
+    """
+    Return a predicate for one condition value: an equality test, or a regex match for wildcards.
+    """
+
+    value = str(value).strip().lower()
+
+    if "*" in value or "?" in value:
+        return re.compile(fnmatch.translate(value)).match
+
+    return value.__eq__
+
+
+def _compile_tag(value):
+
+    key, sep, tag_value = str(value).partition("=")
+    key_match = _compile_pattern(key)
+
+    if not sep:
+        return lambda tags: any(key_match(k) for k in tags)
+
+    value_match = _compile_pattern(tag_value)
+    return lambda tags: any(key_match(k) and value_match(v) for k, v in tags.items())
+
+
+def _alternatives(value):
+    return value if isinstance(value, list) else [value]
+
+
+class Rule:
+    """
+    One compiled routing rule.
+    """
+
+    def __init__(self, position, spec):
+
+        if not isinstance(spec, dict):
+            raise ValueError(f"Routing rule {position} must be a JSON object.")
+
+        match = spec.get("match", {})
+        if not isinstance(match, dict):
+            raise ValueError(f"The match of routing rule {position} must be a JSON object.")
+
+        unknown = set(match) - set(CONDITIONS)
+        if unknown:
+            raise ValueError(f"Routing rule {position} has unknown conditions: {', '.join(sorted(unknown))}. "
+                             f"Supported: {', '.join(CONDITIONS)}.")
+
+        fields = spec.get("fields")
+        if fields is not None and not (isinstance(fields, list) and all(isinstance(f, str) for f in fields)):
+            raise ValueError(f"The fields of routing rule {position} must be a list of field names.")
+
+        if not any(spec.get(key) for key in ("index", "sourcetype", "fields")):
+            raise ValueError(f"Routing rule {position} must set an index, a sourcetype or fields.")
+
+        self.position = position
+        self.index = spec.get("index") or None
+        self.sourcetype = spec.get("sourcetype") or None
+        self.fields = tuple(dict.fromkeys(list(ALWAYS_KEPT_FIELDS) + fields)) if fields else None
+        self.platforms = [str(p).strip().lower() for p in _alternatives(match["platform"])] if "platform" in match else None
+        self.uses_tags = "tag" in match
+
+        self._checks = []
+        for condition in CONDITIONS:
+            if condition in match and condition != "platform":
+                if condition == "tag":
+                    predicates = [_compile_tag(v) for v in _alternatives(match[condition])]
+                else:
+                    predicates = [_compile_pattern(v) for v in _alternatives(match[condition])]
+                self._checks.append((condition, predicates))
+
+        self._platform_checks = [_compile_pattern(p) for p in self.platforms] if self.platforms else None
+
+    def matches_platform(self, platform):
+        return self._platform_checks is None or any(check(platform) for check in self._platform_checks)
+
+    def matches(self, attributes):
+        """
+        Match the non-platform conditions against the attributes returned by RoutingTable.attributes.
+        """
+
+        for condition, predicates in self._checks:
+            value = attributes[condition]
+            if condition == "project":
+                if not any(predicate(project) for project in value for predicate in predicates):
+                    return False
+            elif not any(predicate(value) for predicate in predicates):
+                return False
+
+        return True
+
+
+def parse_rules(text):
+    """
+    Compile the routing_rules setting of an input.
+
+    Returns:
+    list: The compiled rules, empty when the setting is blank.
+
+    Raises:
+    ValueError: If the setting is not a JSON list of valid rules.
+    """
+
+    if text is None or not str(text).strip():
+        return []
+
+    try:
+        specs = json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"Routing rules are not valid JSON. {e}")
+
+    if not isinstance(specs, list):
+        raise ValueError("Routing rules must be a JSON list of rules.")
+
+    return [Rule(position, spec) for position, spec in enumerate(specs, 1)]
+
+
+class RoutingTable:
+    """
+    Dispatch structure built once per run from the compiled rules of an input.
+
+    Args:
+    rules (list): Compiled rules, in priority order.
+    default_index (str): The input's index, used when no rule matches or a rule sets no index.
+    default_sourcetype (str): The input's sourcetype, likewise.
+    """
+
+    def __init__(self, rules, default_index, default_sourcetype):
+        self.rules = rules
+        self.default = Route(default_index, default_sourcetype, None)
+        self.uses_tags = any(rule.uses_tags for rule in rules)
+        self._by_platform = {}
+        self._cache = {}
+        self.hits = collections.Counter()
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def _candidates(self, platform):
+        """
+        Return the rules whose platform condition accepts a platform, computed once per platform.
+        """
+
+        candidates = self._by_platform.get(platform)
+
+        if candidates is None:
+            candidates = [rule for rule in self.rules if rule.matches_platform(platform)]
+            self._by_platform[platform] = candidates
+
+        return candidates
+
+    @staticmethod
+    def attributes(document, tags):
+        """
+        Return the routing attributes of a VM from its inventory projection and tags.
+        """
+
+        projects = document.get("projects") or ""
+        if not isinstance(projects, list):
+            projects = str(projects).split(",")
+
+        return {
+            "subscription": str(document.get("subscription_id") or "").lower(),
+            "region": str(document.get("region") or "").lower(),
+            "project": tuple(p.strip().lower() for p in projects if p.strip()),
+            "tag": {str(k).lower(): str(v).lower() for k, v in tags.items()},
+        }
+
+    def route(self, document, tags):
+        """
+        Return the Route of a VM.
+
+        Args:
+        document (dict): The VM's inventory projection (see wiz_inventory_kvstore.project_vm).
+        tags (dict): The VM's tags (see wiz_inventory_kvstore.vm_tags).
+        """
+
+        if not self.rules:
+            return self.default
+
+        platform = str(document.get("cloud_platform") or "").lower()
+        candidates = self._candidates(platform)
+
+        if not candidates:
+            self.hits[0] += 1
+            return self.default
+
+        attributes = self.attributes(document, tags if self.uses_tags else {})
+        key = None
+
+        if not self.uses_tags:
+            key = (platform, attributes["subscription"], attributes["region"], attributes["project"])
+            cached = self._cache.get(key)
+            if cached is not None:
+                self.hits[cached[0]] += 1
+                return cached[1]
+
+        position, route = 0, self.default
+        for rule in candidates:
+            if rule.matches(attributes):
+                position = rule.position
+                route = Route(rule.index or self.default.index, rule.sourcetype or self.default.sourcetype, rule.fields)
+                break
+
+        if key is not None and len(self._cache) < MAX_CACHED_ROUTES:
+            self._cache[key] = (position, route)
+
+        self.hits[position] += 1
+        return route
+
+    def stats(self):
+        """
+        Return the number of VMs routed by each rule, with "default" for VMs that matched none.
+        """
+
+        return {("default" if position == 0 else f"rule{position}"): count for position, count in sorted(self.hits.items())}
+
+
+def project_fields(vm, fields):
+    """
+    Return the event body of a VM restricted to the fields of its route.
+    """
+
+    if fields is None:
+        return vm
+
+    return {field: vm[field] for field in fields if field in vm}
@@ -0,0 +1,110 @@
+# encoding = utf-8
+
+"""
+Per-run inventory summary, accumulated while the rows of a report are ingested.
+
+Counters are updated once per VM as it is emitted, so the summary needs no second pass over the
+data. At the end of the run it becomes a single wiz:virtualmachines:summary event carrying the
+totals, the change counts and top-N breakdowns, which dashboards can read instead of counting
+every VM event.
+"""
+
+import collections
+
+DEFAULT_TOP_N = 20
+UNKNOWN = "unknown"
+
+DIMENSIONS = (
+    ("platform", "cloud_platform"),
+    ("region", "region"),
+    ("subscription", "subscription_id"),
+    ("os", "os"),
+    ("power_state", "power_state"),
+)
+
+
+class RunSummary:
+    """
+    Streaming aggregates of one run.
+
+    Args:
+    name (str): The input stanza.
+    report_id (str): The Wiz report the run ingested.
+    top_n (int): Number of values kept per breakdown; the rest are folded into "other".
+    """
+
+    def __init__(self, name, report_id, top_n=DEFAULT_TOP_N):
+        self.name = name
+        self.report_id = report_id
+        self.top_n = top_n
+        self.total = 0
+        self.bytes = 0
+        self.counters = {dimension: collections.Counter() for dimension, _ in DIMENSIONS}
+        self.by_platform_state = collections.Counter()
+        self.by_combination = collections.Counter()
+
+    def add(self, document, event_bytes=0):
+        """
+        Count one VM from its inventory projection (see wiz_inventory_kvstore.project_vm).
+        """
+
+        self.total += 1
+        self.bytes += event_bytes
+
+        for dimension, field in DIMENSIONS:
+            self.counters[dimension][document.get(field) or UNKNOWN] += 1
+
+        platform = document.get("cloud_platform") or UNKNOWN
+        power_state = document.get("power_state") or UNKNOWN
+        self.by_platform_state[(platform, power_state)] += 1
+        self.by_combination[(platform, document.get("region") or UNKNOWN, document.get("subscription_id") or UNKNOWN, power_state)] += 1
+
+    def breakdown(self, dimension):
+        """
+        Return the top-N values of a dimension as a dict, with the remainder under "other".
+        """
+
+        counter = self.counters[dimension]
+        top = dict(counter.most_common(self.top_n))
+        other = self.total - sum(top.values())
+
+        if other:
+            top["other"] = other
+
+        return top
+
+    def to_event(self, run_id, counts=None, duration=None):
+        """
+        Return the summary event body.
+
+        Args:
+        run_id (int): The run identifier from the state store.
+        counts (dict): Added/changed/unchanged/removed counts of the run, if known.
+        duration (float): Run duration in seconds, if known.
+        """
+
+        event = {
+            "input": self.name,
+            "report_id": self.report_id,
+            "run_id": run_id,
+            "total": self.total,
+            "bytes": self.bytes,
+            "distinct": {dimension: len(counter) for dimension, counter in self.counters.items()},
+            "top_n": self.top_n,
+        }
+
+        if counts is not None:
+            event.update({k: counts[k] for k in ("added", "changed", "unchanged", "removed")})
+
+        if duration is not None:
+            event["duration"] = round(duration, 3)
+
+        for dimension, _ in DIMENSIONS:
+            event[f"by_{dimension}"] = self.breakdown(dimension)
+
+        event["by_platform_power_state"] = [
+            {"platform": platform, "power_state": state, "count": count}
+            for (platform, state), count in self.by_platform_state.most_common(self.top_n)
+        ]
+
+        return event
@@ -0,0 +1,315 @@
+# encoding = utf-8
+
+"""
+Stanza scheduling for the collector.
+
+Each input stanza gets a phase offset inside its interval window, so stanzas sharing an interval
+do not all hit the Wiz API at the same moment. In daemon mode every stanza gets a periodic timer
+on a solnlib TimerQueue; expired timers only hand the stanza to a worker pool, so a slow report
+never delays the other stanzas' timers.
+"""
+
+import functools
+import hashlib
+import os
+import random
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from solnlib import file_monitor
+from solnlib import orphan_process_monitor
+from solnlib import timer_queue
+
+CONFIG_CHECK_INTERVAL_SECONDS = 10
+ORPHAN_CHECK_INTERVAL_SECONDS = 5
+DUE_TOLERANCE_SECONDS = 60
+
+SPREAD_NONE = "none"
+SPREAD_HASH = "hash"
+SPREAD_EVEN = "even"
+
+
+def phase_offset(name, interval):
+    """
+    Return a deterministic offset in [0, interval) derived from a hash of the stanza name.
+
+    The same stanza always lands on the same slot, across restarts and across forwarders.
+    """
+
+    if interval <= 0:
+        return 0
+
+    digest = hashlib.sha1(name.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % interval
+
+
+def even_offsets(names, interval):
+    """
+    Spread the given stanzas evenly across one interval window, ordered by name.
+    """
+
+    names = sorted(names)
+
+    if interval <= 0 or not names:
+        return {name: 0 for name in names}
+
+    step = interval / len(names)
+    return {name: int(i * step) for i, name in enumerate(names)}
+
+
+def compute_offsets(intervals, spread):
+    """
+    Compute the phase offset of every stanza for the given spread strategy.
+
+    Args:
+    intervals (dict): Stanza name to interval in seconds.
+    spread (str): One of "none", "hash" or "even". Even spreading is done per group of stanzas
+        sharing the same interval.
+
+    Returns:
+    dict: Stanza name to offset in seconds.
+    """
+
+    if spread == SPREAD_HASH:
+        return {name: phase_offset(name, interval) for name, interval in intervals.items()}
+
+    if spread == SPREAD_EVEN:
+        offsets = {}
+        groups = {}
+        for name, interval in intervals.items():
+            groups.setdefault(interval, []).append(name)
+        for interval, names in groups.items():
+            offsets.update(even_offsets(names, interval))
+        return offsets
+
+    return {name: 0 for name in intervals}
+
+
+def next_aligned_time(now, interval, offset):
+    """
+    Return the first epoch at or after now that sits on the stanza's phase, that is
+    k * interval + offset for some integer k.
+    """
+
+    if interval <= 0:
+        return now + offset
+
+    base = now - ((now - offset) % interval)
+    return base if base >= now else base + interval
+
+
+def is_due(last_launched, interval, now, tolerance=DUE_TOLERANCE_SECONDS):
+    """
+    Return True when a stanza last launched at `last_launched` (None if never) is due at `now`.
+    A stanza without a positive interval is always due. The tolerance absorbs the jitter of the
+    launcher, so a stanza whose interval equals the launch schedule is not skipped every other time.
+    """
+
+    if last_launched is None or interval <= 0:
+        return True
+
+    return now - last_launched >= interval - tolerance
+
+
+class StanzaScheduler:
+    """
+    Run input stanzas at their own interval inside a single long-lived process.
+
+    Args:
+    helper: The modular input helper, used for logging.
+    run_stanza (callable): Called with a stanza name to run one collection cycle.
+    max_workers (int): Maximum number of stanzas collected at the same time.
+    stop_event (threading.Event): Set when the scheduler shuts down, so running
+        collections can give up early.
+    spread (str): How first runs are placed in the interval window: "hash" (deterministic slot
+        per stanza name), "even" (evenly spaced) or "none" (run immediately).
+    max_jitter (int): Upper bound in seconds of the random delay added to every run.
+    """
+
+    def __init__(self, helper, run_stanza, max_workers, stop_event=None, spread=SPREAD_HASH, max_jitter=0):
+        self.helper = helper
+        self._run_stanza = run_stanza
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wiz_vms")
+        self._timer_queue = timer_queue.TimerQueue()
+        self._timers = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop_event = stop_event or threading.Event()
+        self._spread = spread
+        self._max_jitter = max_jitter
+        self._offsets = {}
+        self._generation = 0
+
+    def first_run_time(self, name, interval):
+        """
+        Return the epoch at which a newly scheduled stanza runs for the first time.
+        """
+
+        now = time.time()
+
+        if self._spread == SPREAD_NONE:
+            return now
+
+        return next_aligned_time(now, interval, self._offsets.get(name, 0))
+
+    def schedule(self, intervals):
+        """
+        Add, reschedule or remove timers so that they match the given stanzas.
+
+        Args:
+        intervals (dict): Stanza name to interval in seconds. An interval of 0 or less runs the
+            stanza once.
+        """
+
+        with self._lock:
+
+            offsets = compute_offsets(intervals, self._spread)
+            moved = {name for name, offset in offsets.items() if self._offsets.get(name, offset) != offset}
+            self._offsets = offsets
+
+            for name in list(self._timers):
+                timer, interval, _ = self._timers[name]
+                if intervals.get(name) != interval or name in moved:
+                    self._remove_timer(timer)
+                    del self._timers[name]
+                    self.helper.log_info(f"Unscheduled input {name} (interval={interval}).")
+
+            for name, interval in intervals.items():
+                if name in self._timers:
+                    continue
+                when = self.first_run_time(name, interval)
+                self._generation += 1
+                callback = functools.partial(self._dispatch, name, self._generation)
+                timer = self._timer_queue.add_timer(callback, when, max(interval, 0))
+                self._timers[name] = (timer, interval, self._generation)
+                self.helper.log_info(f"Scheduled input {name} every {interval}s, first run at {int(when)}.")
+
+    def next_run_time(self, name):
+        """
+        Return the epoch at which the timer of a stanza next fires, or None when the stanza is not
+        scheduled to run again. The queue re-arms a periodic timer only after dispatching it, and a
+        firing that finds the stanza still running is skipped, so an expiration in the past stands
+        for the one an interval later.
+        """
+
+        with self._lock:
+            timer, interval, _ = self._timers.get(name, (None, 0, None))
+
+        if timer is None or interval <= 0:
+            return None
+
+        when = timer.when
+        now = time.time()
+
+        if when <= now:
+            when += (int((now - when) // interval) + 1) * interval
+
+        return when
+
+    def _remove_timer(self, timer):
+
+        try:
+            self._timer_queue.remove_timer(timer)
+        except KeyError:
+            # A one-shot timer that already fired, or a periodic timer that is firing right now and
+            # gets re-armed by the queue. _dispatch ignores the latter by its generation.
+            pass
+
+    def _dispatch(self, name, generation):
+
+        with self._lock:
+            if self._timers.get(name, (None, None, None))[2] != generation or self._stop_event.is_set():
+                return
+            if name in self._running:
+                self.helper.log_warning(f"Input {name} is still running from the previous interval, skipping this run.")
+                return
+            self._running.add(name)
+
+        self._executor.submit(self._run, name)
+
+    def _run(self, name):
+
+        if self._max_jitter > 0:
+            delay = random.uniform(0, self._max_jitter)
+            self.helper.log_debug(f"Delaying input {name} by {delay:.1f}s of jitter.")
+            if self._stop_event.wait(delay):
+                with self._lock:
+                    self._running.discard(name)
+                return
+
+        started = time.time()
+
+        try:
+            self._run_stanza(name)
+        except Exception as e:
+            self.helper.log_error(f"Scheduled collection for input {name} failed with an unexpected error. {e}")
+        finally:
+            with self._lock:
+                self._running.discard(name)
+            self.helper.log_info(f"Scheduled collection for input {name} finished in {int(time.time() - started)}s.")
+
+    def stop(self):
+        """
+        Ask the scheduler to shut down. Safe to call from signal handlers and monitor threads.
+        """
+
+        self._stop_event.set()
+
+    def run_forever(self, intervals, watched_files=(), reload_intervals=None):
+        """
+        Schedule the stanzas and block until the process is told to stop.
+
+        Args:
+        intervals (dict): Initial stanza name to interval mapping.
+        watched_files (list): Configuration files whose changes trigger reload_intervals.
+        reload_intervals (callable): Returns a fresh stanza name to interval mapping.
+        """
+
+        def _on_config_change(changed_files):
+            self.helper.log_info(f"Detected configuration change in {', '.join(changed_files)}, reloading inputs.")
+            try:
+                self.schedule(reload_intervals())
+            except Exception as e:
+                self.helper.log_error(f"Failed to reload inputs after configuration change. {e}")
+
+        def _on_orphan():
+            self.helper.log_info("Parent splunkd process is gone, shutting down.")
+            self.stop()
+
+        config_monitor = None
+        if reload_intervals is not None and watched_files:
+            config_monitor = file_monitor.FileMonitor(_on_config_change, list(watched_files), CONFIG_CHECK_INTERVAL_SECONDS)
+
+        orphan_monitor = orphan_process_monitor.OrphanProcessMonitor(_on_orphan, ORPHAN_CHECK_INTERVAL_SECONDS)
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+
+        self._timer_queue.start()
+        self.schedule(intervals)
+        orphan_monitor.start()
+        if config_monitor is not None:
+            config_monitor.start()
+
+        self.helper.log_info(f"Daemon mode started with {len(intervals)} input(s), pid={os.getpid()}.")
+
+        while not self._stop_event.wait(1):
+            pass
+
+        self.helper.log_info("Daemon mode is stopping, waiting for running collections to finish.")
+
+        if config_monitor is not None:
+            config_monitor.stop()
+        orphan_monitor.stop()
+
+        with self._lock:
+            for timer, _, _ in self._timers.values():
+                self._remove_timer(timer)
+            self._timers.clear()
+
+        self._timer_queue.stop()
+        self._executor.shutdown(wait=True)
+
+        self.helper.log_info("Daemon mode stopped.")
@@ -0,0 +1,525 @@
+# encoding = utf-8
+
+"""
+Per-run inventory snapshots kept under the modular input's checkpoint directory.
+
+A snapshot holds every VM of one run so it can be diffed, replayed or looked up later without
+calling the Wiz API again. The file is a header, one length-prefixed, zlib-compressed JSON record
+per VM, a filter block, and an offset index at the end: three parallel array('Q') blocks (ID hash,
+content hash, record offset) sorted by ID hash. Readers memory-map the file, so opening a snapshot
+costs no parsing and a lookup by resource ID decompresses a single record.
+
+The filter block holds the location attributes searches filter on (platform, region,
+subscription): a JSON list of the distinct location sets followed by an array('I') giving the set
+of every record in index order. Tags are kept apart in a tag block, an inverted index: a JSON list
+of the distinct [key, value] pairs, an array('I') of where each pair's postings start, and the
+postings themselves (record positions in index order). A filtered read evaluates the location
+filter once per distinct set and each tag filter once per distinct pair, and only decompresses the
+records that match. Version 1 snapshots (no filter block) and version 2 snapshots (tags inside the
+filter sets) can still be read.
+"""
+
+import array
+import bisect
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+
+from wiz_fingerprint_index import id_hash
+
+MAGIC = b"WZSN"
+VERSION = 3
+VERSION_WITHOUT_FILTERS = 1
+VERSION_WITH_TAGS_IN_FILTERS = 2
+PREFIX = struct.Struct("<4sII")
+HEADER = struct.Struct("<4sII QQ QQ QQ")
+HEADERS = {
+    VERSION: HEADER,
+    VERSION_WITH_TAGS_IN_FILTERS: struct.Struct("<4sII QQ QQ"),
+    VERSION_WITHOUT_FILTERS: struct.Struct("<4sII QQ"),
+}
+RECORD_LENGTH = struct.Struct("<I")
+BYTE_ORDER_FLAG = 0 if sys.byteorder == "little" else 1
+COMPRESSION_LEVEL = 6
+
+CHANGE_ADDED = "add"
+CHANGE_REMOVED = "remove"
+CHANGE_CHANGED = "change"
+
+FILE_PREFIX = "wiz_snapshot_"
+FILE_SUFFIX = ".snap"
+FILE_PATTERN = re.compile(re.escape(FILE_PREFIX) + r"(.+)_(\d+)" + re.escape(FILE_SUFFIX) + "$")
+MODINPUT_NAME = "wiz_virtual_machines"
+
+
+def default_checkpoint_dir():
+    """
+    Return the checkpoint directory of the wiz_virtual_machines modular input on this instance
+    ($SPLUNK_DB/modinputs/wiz_virtual_machines), for search commands that read the collector's
+    local state.
+    """
+
+    splunk_db = os.environ.get("SPLUNK_DB") or os.path.join(os.environ.get("SPLUNK_HOME", ""), "var", "lib", "splunk")
+    return os.path.join(splunk_db, "modinputs", MODINPUT_NAME)
+
+
+def filter_attributes(platform, region, subscription, tags):
+    """
+    Return the filter attributes of a VM. The snapshot stores the tags in the tag block and the
+    rest in the filter block.
+    """
+
+    return {"platform": platform or "", "region": region or "", "subscription": subscription or "", "tags": tags or {}}
+
+
+def tags_match(tags, tag_filters):
+    """
+    Return True if a tag dict satisfies every (key, value predicate) pair of tag_filters.
+    """
+
+    return all(key in tags and match(str(tags[key])) for key, match in tag_filters)
+
+
+def _and_bitmaps(left, right):
+    size = len(left)
+    return bytearray((int.from_bytes(left, "little") & int.from_bytes(right, "little")).to_bytes(size, "little"))
+
+
+def snapshot_path(checkpoint_dir, stanza, run_id):
+    return os.path.join(checkpoint_dir, f"{FILE_PREFIX}{stanza}_{run_id}{FILE_SUFFIX}")
+
+
+def list_snapshots(checkpoint_dir, stanza):
+    """
+    Return the (run_id, path) of every complete snapshot of an input, oldest first.
+    """
+
+    pattern = re.compile(re.escape(f"{FILE_PREFIX}{stanza}_") + r"(\d+)" + re.escape(FILE_SUFFIX) + "$")
+    snapshots = []
+
+    try:
+        names = os.listdir(checkpoint_dir)
+    except OSError:
+        return snapshots
+
+    for file_name in names:
+        match = pattern.match(file_name)
+        if match:
+            snapshots.append((int(match.group(1)), os.path.join(checkpoint_dir, file_name)))
+
+    return sorted(snapshots)
+
+
+def latest_snapshots(checkpoint_dir, stanza=None):
+    """
+    Return {input name: (run_id, path)} of the newest snapshot of every input, or of one input.
+    """
+
+    latest = {}
+
+    try:
+        names = os.listdir(checkpoint_dir)
+    except OSError:
+        return latest
+
+    for file_name in names:
+        match = FILE_PATTERN.match(file_name)
+        if not match or (stanza is not None and match.group(1) != stanza):
+            continue
+        run_id = int(match.group(2))
+        if run_id > latest.get(match.group(1), (0, None))[0]:
+            latest[match.group(1)] = (run_id, os.path.join(checkpoint_dir, file_name))
+
+    return latest
+
+
+def prune_snapshots(checkpoint_dir, stanza, keep):
+    """
+    Delete all but the newest `keep` snapshots of an input.
+
+    Returns:
+    int: The number of snapshots deleted.
+    """
+
+    snapshots = list_snapshots(checkpoint_dir, stanza)
+    expired = snapshots[:-keep] if keep > 0 else snapshots
+
+    for _, path in expired:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    return len(expired)
+
+
+class SnapshotWriter:
+    """
+    Streams the VMs of one run into a snapshot file. The file only appears under its final name
+    once commit() has written the index.
+
+    Args:
+    path (str): Final path of the snapshot, normally from snapshot_path().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.raw_bytes = 0
+        self._ids = array.array("Q")
+        self._contents = array.array("Q")
+        self._offsets = array.array("Q")
+        self._filters = array.array("I")
+        self._filter_sets = {}
+        self._tag_pairs = {}
+        self._record_tags = array.array("I")
+        self._record_tag_ends = array.array("Q")
+        self._fp = open(self.tmp_path, "wb")
+        self._fp.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER_FLAG, 0, 0, 0, 0, 0, 0))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, resource_id, fingerprint, vm, attributes=None):
+        """
+        Append one VM. `vm` must be JSON serialisable.
+
+        Args:
+        attributes (dict): The VM's filter attributes (see filter_attributes).
+        """
+
+        raw = json.dumps({"id": resource_id, "fingerprint": fingerprint, "vm": vm}, separators=(',', ':')).encode("utf-8")
+        record = zlib.compress(raw, COMPRESSION_LEVEL)
+
+        self._ids.append(id_hash(resource_id))
+        self._contents.append(fingerprint)
+        self._offsets.append(self._fp.tell())
+        attributes = attributes or filter_attributes(None, None, None, None)
+        location = {"platform": attributes["platform"], "region": attributes["region"], "subscription": attributes["subscription"]}
+        filter_key = json.dumps(location, sort_keys=True, separators=(',', ':'))
+        self._filters.append(self._filter_sets.setdefault(filter_key, len(self._filter_sets)))
+        for key, value in sorted(attributes["tags"].items()):
+            pair_key = json.dumps([str(key), str(value)], separators=(',', ':'))
+            self._record_tags.append(self._tag_pairs.setdefault(pair_key, len(self._tag_pairs)))
+        self._record_tag_ends.append(len(self._record_tags))
+        self._fp.write(RECORD_LENGTH.pack(len(record)))
+        self._fp.write(record)
+        self.raw_bytes += len(raw)
+
+    def commit(self):
+        """
+        Write the offset index and header, then move the file to its final name.
+
+        Returns:
+        int: Size of the snapshot in bytes.
+        """
+
+        ids, contents, offsets, filters = self._ids, self._contents, self._offsets, self._filters
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+
+        filter_offset = self._fp.tell()
+        filter_sets = sorted(self._filter_sets, key=self._filter_sets.__getitem__)
+        self._fp.write(("[" + ",".join(filter_sets) + "]").encode("utf-8"))
+        filter_length = self._fp.tell() - filter_offset
+        array.array("I", (filters[i] for i in order)).tofile(self._fp)
+
+        tag_offset = self._fp.tell()
+        tag_pairs = sorted(self._tag_pairs, key=self._tag_pairs.__getitem__)
+        self._fp.write(("[" + ",".join(tag_pairs) + "]").encode("utf-8"))
+        tag_length = self._fp.tell() - tag_offset
+        self._write_postings(order)
+
+        index_offset = self._fp.tell()
+
+        array.array("Q", (ids[i] for i in order)).tofile(self._fp)
+        array.array("Q", (contents[i] for i in order)).tofile(self._fp)
+        array.array("Q", (offsets[i] for i in order)).tofile(self._fp)
+
+        size = self._fp.tell()
+        self._fp.seek(0)
+        self._fp.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER_FLAG, len(ids), index_offset, filter_offset, filter_length,
+                                   tag_offset, tag_length))
+        self._fp.close()
+
+        os.replace(self.tmp_path, self.path)
+        return size
+
+    def _write_postings(self, order):
+        """
+        Write the tag block's postings: where each pair's postings start, then the index positions
+        of the records carrying each pair, grouped by pair and ascending within a pair.
+        """
+
+        record_tags, ends = self._record_tags, self._record_tag_ends
+        starts = array.array("I", [0]) * (len(self._tag_pairs) + 1)
+
+        for pair in record_tags:
+            starts[pair + 1] += 1
+        for pair in range(len(self._tag_pairs)):
+            starts[pair + 1] += starts[pair]
+
+        fill = array.array("I", starts)
+        postings = array.array("I", [0]) * len(record_tags)
+
+        for position, i in enumerate(order):
+            for j in range(ends[i - 1] if i else 0, ends[i]):
+                pair = record_tags[j]
+                postings[fill[pair]] = position
+                fill[pair] += 1
+
+        starts.tofile(self._fp)
+        postings.tofile(self._fp)
+
+    def abort(self):
+        """
+        Discard a snapshot that will not be committed.
+        """
+
+        self._fp.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+class Snapshot:
+    """
+    Read-only, memory-mapped view of a snapshot file.
+
+    Raises ValueError from open() if the file is not a complete snapshot.
+    """
+
+    def __init__(self, fp, mapped, count, index_offset, filter_offset=None, filter_length=0, tag_offset=None, tag_length=0):
+        self._fp = fp
+        self._mmap = mapped
+        view = memoryview(mapped)
+        size = count * 8
+        self._ids = view[index_offset:index_offset + size].cast("Q")
+        self._contents = view[index_offset + size:index_offset + 2 * size].cast("Q")
+        self._offsets = view[index_offset + 2 * size:index_offset + 3 * size].cast("Q")
+        self._filter_sets = None
+        self._filters = None
+        self._tags = None
+
+        if filter_offset is not None:
+            self._filter_sets = (filter_offset, filter_length)
+            self._filters = view[filter_offset + filter_length:filter_offset + filter_length + count * 4].cast("I")
+
+        if tag_offset is not None:
+            self._tags = (tag_offset, tag_length)
+
+    @classmethod
+    def open(cls, path):
+
+        fp = open(path, "rb")
+
+        try:
+            prefix = fp.read(PREFIX.size)
+            if len(prefix) < PREFIX.size:
+                raise ValueError(f"{path} is not a snapshot file.")
+
+            magic, version, byte_order = PREFIX.unpack(prefix)
+            if magic != MAGIC or version not in HEADERS or byte_order != BYTE_ORDER_FLAG:
+                raise ValueError(f"{path} is not a snapshot file of version {VERSION}.")
+
+            header = HEADERS[version]
+            fp.seek(0)
+            fields = header.unpack(fp.read(header.size))
+            count, index_offset = fields[3:5]
+            filters = fields[5:]
+
+            if os.fstat(fp.fileno()).st_size != index_offset + count * 24:
+                raise ValueError(f"{path} is truncated.")
+
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except struct.error:
+            fp.close()
+            raise ValueError(f"{path} is truncated.")
+        except Exception:
+            fp.close()
+            raise
+
+        return cls(fp, mapped, count, index_offset, *filters)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _read(self, offset):
+        (length,) = RECORD_LENGTH.unpack_from(self._mmap, offset)
+        start = offset + RECORD_LENGTH.size
+        return json.loads(zlib.decompress(self._mmap[start:start + length]))
+
+    def fingerprints(self):
+        """
+        Yield (ID hash, content hash) pairs sorted by ID hash, without decompressing any record.
+        """
+
+        return zip(self._ids, self._contents)
+
+    def get(self, resource_id):
+        """
+        Return the VM stored for a resource ID, or None.
+        """
+
+        key = id_hash(resource_id)
+        i = bisect.bisect_left(self._ids, key)
+
+        while i < len(self._ids) and self._ids[i] == key:
+            record = self._read(self._offsets[i])
+            if record["id"] == resource_id:
+                return record["vm"]
+            i += 1
+
+        return None
+
+    def record_at(self, position):
+        """
+        Return the (resource ID, fingerprint, VM) record at a position of the ID-sorted index.
+        """
+
+        record = self._read(self._offsets[position])
+        return record["id"], record["fingerprint"], record["vm"]
+
+    def __iter__(self):
+        """
+        Yield (resource ID, fingerprint, VM) for every record, in the order of the original report.
+        """
+
+        for offset in sorted(self._offsets):
+            record = self._read(offset)
+            yield record["id"], record["fingerprint"], record["vm"]
+
+    def select(self, predicate, tag_filters=(), attributes_of=None):
+        """
+        Yield (resource ID, fingerprint, VM) for every record whose filter attributes satisfy a
+        predicate and whose tags satisfy every tag filter, in the order of the original report.
+        The predicate is called once per distinct location set, each tag filter once per distinct
+        tag pair, and only matching records are decompressed.
+
+        Args:
+        predicate (callable): Called with a dict of platform, region and subscription (see
+            filter_attributes). Version 2 snapshots pass the tags as well.
+        tag_filters (list): (key, value predicate) pairs, all of which must match.
+        attributes_of (callable): Returns the filter attributes of a VM, for version 1 snapshots,
+            which have no filter block; every record is then decompressed.
+        """
+
+        if self._filters is None:
+            for resource_id, fingerprint, vm in self:
+                if attributes_of is None:
+                    yield resource_id, fingerprint, vm
+                    continue
+                attributes = attributes_of(vm)
+                if predicate(attributes) and tags_match(attributes["tags"], tag_filters):
+                    yield resource_id, fingerprint, vm
+            return
+
+        start, length = self._filter_sets
+        filter_sets = json.loads(self._mmap[start:start + length])
+        if self._tags is None:
+            matching = [predicate(attributes) and tags_match(attributes["tags"], tag_filters) for attributes in filter_sets]
+            selected = None
+        else:
+            matching = [predicate(attributes) for attributes in filter_sets]
+            selected = self._select_tags(tag_filters) if tag_filters and any(matching) else None
+
+        if not any(matching):
+            return
+
+        offsets = self._offsets
+        positions = (i for i, filter_set in enumerate(self._filters)
+                     if matching[filter_set] and (selected is None or selected[i]))
+
+        for offset in sorted(offsets[i] for i in positions):
+            record = self._read(offset)
+            yield record["id"], record["fingerprint"], record["vm"]
+
+    def _select_tags(self, tag_filters):
+        """
+        Return a bytearray with a non-zero byte at the index position of every record whose tags
+        satisfy all tag filters, read from the tag block's postings.
+        """
+
+        start, length = self._tags
+        pairs = json.loads(self._mmap[start:start + length])
+        view = memoryview(self._mmap)
+        starts_offset = start + length
+        postings_offset = starts_offset + (len(pairs) + 1) * 4
+        starts = view[starts_offset:postings_offset].cast("I")
+        postings = view[postings_offset:postings_offset + starts[-1] * 4].cast("I")
+        selected = None
+
+        try:
+            for key, match in tag_filters:
+                hits = bytearray(len(self))
+                for pair, (pair_key, value) in enumerate(pairs):
+                    if pair_key == key and match(value):
+                        for j in range(starts[pair], starts[pair + 1]):
+                            hits[postings[j]] = 1
+                selected = hits if selected is None else _and_bitmaps(selected, hits)
+        finally:
+            starts.release()
+            postings.release()
+            view.release()
+
+        return selected
+
+    def close(self):
+        if self._mmap is not None:
+            if self._filters is not None:
+                self._filters.release()
+            self._ids.release()
+            self._contents.release()
+            self._offsets.release()
+            self._mmap.close()
+            self._fp.close()
+            self._mmap = None
+            self._fp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def diff_snapshots(old, new):
+    """
+    Merge-join the ID-sorted indexes of two snapshots.
+
+    Only the index blocks are read, so memory use does not depend on the size of the inventory.
+
+    Yields:
+    tuple: (change, position in old, position in new) for every added, removed or changed VM, in ID
+    hash order. The position of the side that does not hold the VM is None.
+    """
+
+    old_ids, old_contents = old._ids, old._contents
+    new_ids, new_contents = new._ids, new._contents
+    old_count, new_count = len(old_ids), len(new_ids)
+    i = j = 0
+
+    while i < old_count and j < new_count:
+        old_key, new_key = old_ids[i], new_ids[j]
+
+        if old_key == new_key:
+            if old_contents[i] != new_contents[j]:
+                yield CHANGE_CHANGED, i, j
+            i += 1
+            j += 1
+        elif old_key < new_key:
+            yield CHANGE_REMOVED, i, None
+            i += 1
+        else:
+            yield CHANGE_ADDED, None, j
+            j += 1
+
+    for i in range(i, old_count):
+        yield CHANGE_REMOVED, i, None
+
+    for j in range(j, new_count):
+        yield CHANGE_ADDED, None, j
@@ -0,0 +1,220 @@
+# encoding = utf-8
+
+"""
+Local SQLite store for per-VM collection state.
+
+The KV store checkpointer costs one splunkd REST round-trip per key, which does not scale to
+hundreds of thousands of VMs. This store keeps one row per (input, resource ID) in a WAL-mode
+SQLite database under the modular input's checkpoint directory. Rows seen during a run are
+buffered into a temporary table in batches and merged into the state table with set-based SQL
+when the run finishes, so diffing and tombstoning run at local-disk speed.
+"""
+
+import os
+import sqlite3
+import time
+from urllib.request import pathname2url
+
+DATABASE_NAME = "wiz_vm_state.sqlite"
+DEFAULT_BATCH_SIZE = 5000
+BUSY_TIMEOUT_MS = 60000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vm_state (
+    stanza TEXT NOT NULL,
+    resource_id TEXT NOT NULL,
+    fingerprint INTEGER NOT NULL,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    run_id INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    deleted_run_id INTEGER,
+    PRIMARY KEY (stanza, resource_id)
+);
+CREATE INDEX IF NOT EXISTS vm_state_resource_id ON vm_state (resource_id);
+CREATE INDEX IF NOT EXISTS vm_state_run ON vm_state (stanza, run_id);
+CREATE TABLE IF NOT EXISTS runs (
+    stanza TEXT NOT NULL,
+    run_id INTEGER NOT NULL,
+    report_id TEXT,
+    started INTEGER NOT NULL,
+    finished INTEGER,
+    seen INTEGER,
+    added INTEGER,
+    changed INTEGER,
+    removed INTEGER,
+    PRIMARY KEY (stanza, run_id)
+);
+"""
+
+
+def to_signed64(value):
+    """
+    Map an unsigned 64-bit hash onto SQLite's signed INTEGER range.
+    """
+
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def find_run_by_report(checkpoint_dir, stanza, report_id):
+    """
+    Return the run_id that collected a Wiz report, or None. Opens the database read-only.
+    """
+
+    path = os.path.join(checkpoint_dir, DATABASE_NAME)
+
+    if not os.path.exists(path):
+        return None
+
+    conn = sqlite3.connect(f"file:{pathname2url(path)}?mode=ro", uri=True, timeout=BUSY_TIMEOUT_MS / 1000.0)
+
+    try:
+        row = conn.execute("SELECT run_id FROM runs WHERE stanza = ? AND report_id = ? ORDER BY run_id DESC LIMIT 1",
+                           (stanza, report_id)).fetchone()
+    finally:
+        conn.close()
+
+    return row[0] if row else None
+
+
+class VmStateStore:
+    """
+    Per-VM fingerprints and history for one input stanza.
+
+    Use one instance per thread; SQLite connections are not shared between threads.
+
+    Args:
+    checkpoint_dir (str): Directory holding the database file.
+    stanza (str): The input stanza whose VMs are tracked.
+    batch_size (int): Number of buffered rows written per executemany call.
+    """
+
+    def __init__(self, checkpoint_dir, stanza, batch_size=DEFAULT_BATCH_SIZE):
+        self.path = os.path.join(checkpoint_dir, DATABASE_NAME)
+        self.stanza = stanza
+        self.batch_size = batch_size
+        self.run_id = None
+        self._pending = []
+
+        self._conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000.0)
+        self._conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS run_seen (resource_id TEXT PRIMARY KEY, fingerprint INTEGER NOT NULL)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def start_run(self, report_id=None):
+        """
+        Start tracking a new run and return its identifier (epoch milliseconds).
+        """
+
+        self.run_id = int(time.time() * 1000)
+        self._pending = []
+
+        with self._conn:
+            self._conn.execute("DELETE FROM run_seen")
+            self._conn.execute("INSERT OR REPLACE INTO runs (stanza, run_id, report_id, started) VALUES (?, ?, ?, ?)",
+                               (self.stanza, self.run_id, report_id, int(time.time())))
+
+        return self.run_id
+
+    def record(self, resource_id, fingerprint):
+        """
+        Buffer one VM seen in the current run. Written to disk every batch_size rows.
+        """
+
+        self._pending.append((resource_id, to_signed64(fingerprint)))
+
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+
+        if not self._pending:
+            return
+
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO run_seen (resource_id, fingerprint) VALUES (?, ?)", self._pending)
+
+        self._pending = []
+
+    def finish_run(self):
+        """
+        Merge the VMs seen in this run into the state table in one transaction.
+
+        VMs not seen in this run are tombstoned (deleted = 1, deleted_run_id = this run).
+
+        Returns:
+        dict: Counts of seen, added, changed, unchanged and removed VMs.
+        """
+
+        self._flush()
+        now = int(time.time())
+        stanza, run_id = self.stanza, self.run_id
+
+        with self._conn:
+
+            seen = self._conn.execute("SELECT COUNT(*) FROM run_seen").fetchone()[0]
+
+            added = self._conn.execute(
+                "SELECT COUNT(*) FROM run_seen s LEFT JOIN vm_state v ON v.stanza = ? AND v.resource_id = s.resource_id "
+                "WHERE v.resource_id IS NULL OR v.deleted = 1", (stanza,)).fetchone()[0]
+
+            changed = self._conn.execute(
+                "SELECT COUNT(*) FROM run_seen s JOIN vm_state v ON v.stanza = ? AND v.resource_id = s.resource_id "
+                "WHERE v.deleted = 0 AND v.fingerprint != s.fingerprint", (stanza,)).fetchone()[0]
+
+            self._conn.execute(
+                "INSERT INTO vm_state (stanza, resource_id, fingerprint, first_seen, last_seen, run_id, deleted) "
+                "SELECT ?, resource_id, fingerprint, ?, ?, ?, 0 FROM run_seen WHERE true "
+                "ON CONFLICT (stanza, resource_id) DO UPDATE SET "
+                "fingerprint = excluded.fingerprint, last_seen = excluded.last_seen, run_id = excluded.run_id, "
+                "first_seen = CASE WHEN vm_state.deleted = 1 THEN excluded.first_seen ELSE vm_state.first_seen END, "
+                "deleted = 0, deleted_run_id = NULL",
+                (stanza, now, now, run_id))
+
+            removed = self._conn.execute(
+                "UPDATE vm_state SET deleted = 1, deleted_run_id = ? WHERE stanza = ? AND run_id != ? AND deleted = 0",
+                (run_id, stanza, run_id)).rowcount
+
+            self._conn.execute(
+                "UPDATE runs SET finished = ?, seen = ?, added = ?, changed = ?, removed = ? WHERE stanza = ? AND run_id = ?",
+                (now, seen, added, changed, removed, stanza, run_id))
+
+            self._conn.execute("DELETE FROM run_seen")
+
+        return {"seen": seen, "added": added, "changed": changed, "unchanged": seen - added - changed, "removed": removed}
+
+    def iter_unseen(self, run_id=None):
+        """
+        Yield the resource IDs that were tombstoned by a run (default: the current run).
+        """
+
+        run_id = self.run_id if run_id is None else run_id
+        cursor = self._conn.execute("SELECT resource_id FROM vm_state WHERE stanza = ? AND deleted_run_id = ?",
+                                    (self.stanza, run_id))
+
+        for (resource_id,) in cursor:
+            yield resource_id
+
+    def prune_tombstones(self, older_than_seconds):
+        """
+        Drop tombstoned VMs whose last sighting is older than the given age.
+        """
+
+        cutoff = int(time.time()) - older_than_seconds
+
+        with self._conn:
+            return self._conn.execute("DELETE FROM vm_state WHERE stanza = ? AND deleted = 1 AND last_seen < ?",
+                                      (self.stanza, cutoff)).rowcount
@@ -50,6 +50,10 @@ class ModInputwiz_virtual_machines(modinput_wrapper.base_modinput.BaseModInput):
                                          description="",
                                          required_on_create=True,
                                          required_on_edit=False))
+        scheme.add_argument(smi.Argument("accounts", title="Additional Accounts",
+                                         description="Optional. Other accounts (Wiz tenants) collected by this input.",
+                                         required_on_create=False,
+                                         required_on_edit=False))
         scheme.add_argument(smi.Argument("project_id", title="Project ID",
                                          description="Enter the Wiz Project ID to narrow down your report. Leave the asterisk (*) to select all projects.",
                                          required_on_create=True,
@@ -62,6 +66,14 @@ class ModInputwiz_virtual_machines(modinput_wrapper.base_modinput.BaseModInput):
                                          description="https://auth.app.wiz.io/oauth/token",
                                          required_on_create=True,
                                          required_on_edit=False))
+        scheme.add_argument(smi.Argument("entity_types", title="Entity Types",
+                                         description="Comma-separated Wiz entity types collected in one report, each optionally followed by =<sourcetype>.",
+                                         required_on_create=False,
+                                         required_on_edit=False))
+        scheme.add_argument(smi.Argument("routing_rules", title="Routing Rules",
+                                         description="Optional JSON list of rules that route VMs to other indexes and sourcetypes.",
+                                         required_on_create=False,
+                                         required_on_edit=False))
         return scheme
 
     def get_app_name(self):
@@ -0,0 +1,353 @@
+# encoding = utf-8
+
+"""
+Address index behind the wiz_vm_by_address external lookup.
+
+Every run, the collector writes one index file per input (wiz_vm_lookup_<input>.json) mapping the
+IP addresses, hostnames and instance IDs found in each VM's JSON to that VM. CIDR ranges are only
+taken from the keys clouds use for prefixes delegated to a VM (not from security rules or subnet
+definitions) and must be at least a /8 (IPv4) or /32 (IPv6); they are saved sorted by start
+address, widest first. The lookup script loads the files once per invocation into hash maps for
+exact keys and merges the sorted range lists of every input. Because CIDR ranges are either nested
+or disjoint, one pass over the merged list links every range to the nearest range enclosing it, so
+an address is resolved by a binary search and a walk up at most one range per prefix length.
+
+The merged index is cached, keyed by the name, modification time and size of every index file: in
+memory for the life of the process, and in one pickle file next to the index files, so a lookup
+invocation only parses the JSON files again after the collector has rewritten one of them.
+"""
+
+import bisect
+import heapq
+import ipaddress
+import json
+import os
+import pickle
+import re
+
+FILE_PREFIX = "wiz_vm_lookup_"
+FILE_SUFFIX = ".json"
+VERSION = 2
+CACHE_FILE_NAME = "wiz_vm_lookup.cache"
+
+KEY_IP = "ip"
+KEY_HOSTNAME = "hostname"
+KEY_INSTANCE_ID = "instance_id"
+
+VM_FIELDS = ("resource_id", "name", "input", "region", "subscription_id", "cloud_platform")
+
+ADDRESS_VALUE_PATTERN = re.compile(r"^(\d{1,3}(\.\d{1,3}){3}|[0-9a-fA-F]*:[0-9a-fA-F:.]+)(/\d{1,3})?$")
+HOSTNAME_KEY_PATTERN = re.compile(r"host ?name|dns ?name|computer ?name|fqdn", re.IGNORECASE)
+RANGE_KEYS = ("ipv4prefix", "ipv6prefix", "ipcidrrange", "ipprefix")
+MIN_PREFIX_LENGTH = {4: 8, 6: 32}
+INSTANCE_ID_KEYS = ("InstanceId", "instanceId", "vmId", "VmId", "instance_id", "providerUniqueId", "externalId")
+MAX_DEPTH = 8
+
+
+_loaded = {}
+
+
+def index_path(checkpoint_dir, stanza):
+    return os.path.join(checkpoint_dir, f"{FILE_PREFIX}{stanza}{FILE_SUFFIX}")
+
+
+def index_files_signature(checkpoint_dir):
+    """
+    Return a sorted tuple of (file name, mtime in ns, size) of the index files in a directory, or
+    None if the directory cannot be read.
+    """
+
+    try:
+        names = sorted(os.listdir(checkpoint_dir))
+    except OSError:
+        return None
+
+    signature = []
+
+    for file_name in names:
+        if file_name.startswith(FILE_PREFIX) and file_name.endswith(FILE_SUFFIX):
+            try:
+                stat = os.stat(os.path.join(checkpoint_dir, file_name))
+            except OSError:
+                continue
+            signature.append((file_name, stat.st_mtime_ns, stat.st_size))
+
+    return tuple(signature)
+
+
+def _walk(value, key="", depth=0):
+    """
+    Yield (key, string value) for every scalar string in a JSON document, with the nearest object key.
+    """
+
+    if depth > MAX_DEPTH:
+        return
+
+    if isinstance(value, dict):
+        for child_key, child in value.items():
+            yield from _walk(child, str(child_key), depth + 1)
+    elif isinstance(value, list):
+        for child in value:
+            yield from _walk(child, key, depth + 1)
+    elif isinstance(value, str) and value:
+        yield key, value
+
+
+def parse_address(value):
+    """
+    Return an ip_address or ip_network for a string, or None if it is neither.
+    """
+
+    try:
+        if "/" in value:
+            return ipaddress.ip_network(value, strict=False)
+        return ipaddress.ip_address(value)
+    except ValueError:
+        return None
+
+
+def range_order(entry):
+    """
+    Sort key of a [start, end, position] range: by start address, enclosing ranges first.
+    """
+
+    return entry[0], -entry[1], entry[2]
+
+
+def enclosing_ranges(ranges):
+    """
+    Return, for every range of a list sorted by range_order, the position of the nearest range
+    enclosing it, or -1.
+    """
+
+    parents = []
+    stack = []
+
+    for start, end, _ in ranges:
+        while stack and ranges[stack[-1]][1] < start:
+            stack.pop()
+        parents.append(stack[-1] if stack else -1)
+        stack.append(len(parents) - 1)
+
+    return parents
+
+
+class LookupIndexBuilder:
+    """
+    Collects the lookup keys of one input's VMs during a run and writes them as an index file.
+    """
+
+    def __init__(self, stanza):
+        self.stanza = stanza
+        self._vms = []
+        self._exact = {KEY_IP: {}, KEY_HOSTNAME: {}, KEY_INSTANCE_ID: {}}
+        self._ranges = {4: [], 6: []}
+
+    def __len__(self):
+        return len(self._vms)
+
+    def add(self, document, vm, wiz_object):
+        """
+        Index one VM.
+
+        Args:
+        document (dict): The VM's inventory projection (see wiz_inventory_kvstore.project_vm).
+        vm (dict): The VM's JSON, enriched with the report columns.
+        wiz_object (dict): The VM's parsed "Wiz JSON Object".
+        """
+
+        position = len(self._vms)
+        self._vms.append([document.get(field, "") for field in VM_FIELDS])
+
+        self._exact[KEY_INSTANCE_ID][document["resource_id"].lower()] = position
+        if document.get("name"):
+            self._exact[KEY_HOSTNAME].setdefault(document["name"].lower(), position)
+
+        for source in (vm, wiz_object):
+            for key in INSTANCE_ID_KEYS:
+                value = source.get(key)
+                if isinstance(value, str) and value:
+                    self._exact[KEY_INSTANCE_ID][value.lower()] = position
+
+            for key, value in _walk(source):
+                if ADDRESS_VALUE_PATTERN.match(value) and "version" not in key.lower():
+                    address = parse_address(value)
+                    if address is None:
+                        continue
+                    if isinstance(address, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+                        if key.lower() not in RANGE_KEYS or address.prefixlen < MIN_PREFIX_LENGTH[address.version]:
+                            continue
+                        if address.num_addresses > 1:
+                            self._ranges[address.version].append([int(address.network_address), int(address.broadcast_address), position])
+                            continue
+                        address = address.network_address
+                    self._exact[KEY_IP][str(address)] = position
+                elif HOSTNAME_KEY_PATTERN.search(key):
+                    hostname = value.lower().rstrip(".")
+                    self._exact[KEY_HOSTNAME][hostname] = position
+                    short_name = hostname.split(".", 1)[0]
+                    self._exact[KEY_HOSTNAME].setdefault(short_name, position)
+
+    def save(self, path):
+        """
+        Atomically write the index file.
+        """
+
+        tmp_path = path + ".tmp"
+
+        with open(tmp_path, "w") as fp:
+            ranges = {str(version): sorted(ranges, key=range_order) for version, ranges in self._ranges.items()}
+            json.dump({"version": VERSION, "input": self.stanza, "vms": self._vms, "exact": self._exact, "ranges": ranges},
+                      fp, separators=(',', ':'))
+
+        os.replace(tmp_path, path)
+
+
+class LookupIndex:
+    """
+    In-memory index over the lookup files of every input, loaded once per lookup invocation.
+    """
+
+    def __init__(self):
+        self._vms = []
+        self._exact = {KEY_IP: {}, KEY_HOSTNAME: {}, KEY_INSTANCE_ID: {}}
+        self._ranges = {4: [], 6: []}
+        self._starts = {4: [], 6: []}
+        self._parents = {4: [], 6: []}
+
+    @classmethod
+    def load(cls, checkpoint_dir):
+        """
+        Return the index over every input's index file, from the in-memory or on-disk cache when
+        no index file changed since it was built.
+        """
+
+        signature = index_files_signature(checkpoint_dir)
+        if signature is None:
+            return cls()
+
+        cached = _loaded.get(checkpoint_dir)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        cache_path = os.path.join(checkpoint_dir, CACHE_FILE_NAME)
+        index = cls._load_cache(cache_path, signature)
+
+        if index is None:
+            index = cls._build(checkpoint_dir, signature)
+            index._save_cache(cache_path, signature)
+
+        _loaded[checkpoint_dir] = (signature, index)
+        return index
+
+    @classmethod
+    def _load_cache(cls, path, signature):
+        try:
+            with open(path, "rb") as fp:
+                cached_signature, state = pickle.load(fp)
+        except Exception:
+            return None
+
+        if cached_signature != signature:
+            return None
+
+        index = cls()
+        index.__dict__.update(state)
+        return index
+
+    def _save_cache(self, path, signature):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as fp:
+                pickle.dump((signature, self.__dict__), fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    @classmethod
+    def _build(cls, checkpoint_dir, signature):
+
+        index = cls()
+        sorted_ranges = {4: [], 6: []}
+
+        for file_name, _, _ in signature:
+            try:
+                with open(os.path.join(checkpoint_dir, file_name)) as fp:
+                    index._merge(json.load(fp), sorted_ranges)
+            except (OSError, ValueError, KeyError):
+                continue
+
+        for version, lists in sorted_ranges.items():
+            ranges = lists[0] if len(lists) == 1 else list(heapq.merge(*lists, key=range_order))
+            index._ranges[version] = ranges
+            index._starts[version] = [entry[0] for entry in ranges]
+            index._parents[version] = enclosing_ranges(ranges)
+
+        return index
+
+    def _merge(self, data, sorted_ranges):
+        """
+        Add the VMs and exact keys of one index file, and its sorted range lists to sorted_ranges
+        for load to merge.
+        """
+
+        if data.get("version") != VERSION:
+            return
+
+        base = len(self._vms)
+        self._vms.extend(data["vms"])
+
+        for kind, keys in data["exact"].items():
+            target = self._exact.setdefault(kind, {})
+            for key, position in keys.items():
+                target[key] = base + position
+
+        for version, ranges in data["ranges"].items():
+            version = int(version)
+            for entry in ranges:
+                entry[2] += base
+            sorted_ranges[version].append(ranges)
+
+    def __len__(self):
+        return len(self._vms)
+
+    def _vm(self, position):
+        return dict(zip(VM_FIELDS, self._vms[position]))
+
+    def find_ip(self, value):
+        """
+        Return the VM owning an IP address: an exact match first, otherwise the most specific
+        CIDR range that contains it.
+        """
+
+        address = parse_address(value.strip())
+        if address is None or not isinstance(address, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            return None
+
+        position = self._exact[KEY_IP].get(str(address))
+        if position is not None:
+            return self._vm(position)
+
+        ranges = self._ranges[address.version]
+        parents = self._parents[address.version]
+        number = int(address)
+        i = bisect.bisect_right(self._starts[address.version], number) - 1
+
+        while i >= 0:
+            start, end, position = ranges[i]
+            if end >= number:
+                return self._vm(position)
+            i = parents[i]
+
+        return None
+
+    def find_hostname(self, value):
+        position = self._exact[KEY_HOSTNAME].get(value.strip().lower().rstrip("."))
+        return self._vm(position) if position is not None else None
+
+    def find_instance_id(self, value):
+        position = self._exact[KEY_INSTANCE_ID].get(value.strip().lower())
+        return self._vm(position) if position is not None else None
@@ -0,0 +1,139 @@
+# encoding = utf-8
+
+"""
+wizexpand: streaming search command that extracts selected JSON paths from the wizJsonObject
+string of wiz:virtualmachines events. Unlike `spath input=wizJsonObject`, it only extracts the
+listed paths.
+
+    ... | wizexpand [field=wizJsonObject] [prefix=<string>] <path> [<path> ...]
+
+Paths use JSONPath syntax (for example `name`, `$.network.privateIp`, `tags[*].key`). Each path is
+compiled once per process with jsonpath_ng. Before parsing an event, the command checks that every
+key a path needs appears in the raw string; events that cannot match are passed through unparsed.
+The result field of a path is named like spath would name it: the path without its leading `$.`,
+with array subscripts written as `{}` (`tags[*].key` becomes `tags{}.key`), optionally prefixed.
+"""
+
+import ta_wiz_discovered_vms_declare
+
+import functools
+import json
+import re
+import sys
+
+from jsonpath_ng import jsonpath, parse
+from splunklib.searchcommands import dispatch, StreamingCommand, Configuration, Option, validators
+
+
+@functools.lru_cache(maxsize=256)
+def compile_path(path):
+    """
+    Return the compiled jsonpath_ng expression of a path. Compiling is expensive, so results are cached.
+    """
+
+    return parse(path)
+
+
+def required_keys(expression):
+    """
+    Return the object keys that must all be present in a document for the expression to match.
+
+    A Fields node naming several keys (`a,b`) matches when any one of them is present, so it
+    requires none of them in particular.
+    """
+
+    if isinstance(expression, (jsonpath.Child, jsonpath.Descendants)):
+        return required_keys(expression.left) | required_keys(expression.right)
+
+    if isinstance(expression, jsonpath.Where):
+        return required_keys(expression.left)
+
+    if isinstance(expression, jsonpath.Fields):
+        if len(expression.fields) != 1:
+            return set()
+        return {field for field in expression.fields if field != "*"}
+
+    return set()
+
+
+def key_markers(keys):
+    """
+    Return, for each key, the quoted forms it can take in raw JSON text.
+    """
+
+    return [{json.dumps(key), json.dumps(key, ensure_ascii=False)} for key in keys]
+
+
+def output_field(prefix, path):
+    if path.startswith("$."):
+        path = path[2:]
+    return prefix + re.sub(r"\[[^\]]*\]", "{}", path)
+
+
+def to_field_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(',', ':'))
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+@Configuration()
+class WizExpandCommand(StreamingCommand):
+    """
+    Extract the requested JSON paths from a JSON string field.
+    """
+
+    field = Option(require=False, default="wizJsonObject", validate=validators.Fieldname(),
+                   doc="The field holding the JSON string (default: wizJsonObject).")
+    prefix = Option(require=False, default="", doc="Prefix added to every extracted field name.")
+
+    def prepare(self):
+
+        if not self.fieldnames:
+            raise ValueError("wizexpand requires at least one JSON path, for example: wizexpand name network.privateIp")
+
+        self._extractors = []
+        self._output_fields = []
+
+        for path in self.fieldnames:
+            try:
+                expression = compile_path(path)
+            except Exception as e:
+                raise ValueError(f"Invalid JSON path {path}: {e}")
+            name = output_field(self.prefix, path)
+            self._extractors.append((name, expression, key_markers(required_keys(expression))))
+            self._output_fields.append(name)
+
+    def stream(self, records):
+
+        field = self.field
+
+        for record in records:
+
+            # Every record carries every output field: splunklib takes the output columns from the first record.
+            for name in self._output_fields:
+                record.setdefault(name, None)
+
+            raw = record.get(field)
+
+            if isinstance(raw, str) and raw:
+                candidates = [(name, expression) for name, expression, markers in self._extractors
+                              if all(any(marker in raw for marker in forms) for forms in markers)]
+
+                if candidates:
+                    try:
+                        document = json.loads(raw)
+                    except ValueError:
+                        document = None
+
+                    if document is not None:
+                        for name, expression in candidates:
+                            values = [to_field_value(match.value) for match in expression.find(document)]
+                            if values:
+                                record[name] = values[0] if len(values) == 1 else values
+
+            yield record
+
+
+dispatch(WizExpandCommand, sys.argv, sys.stdin, sys.stdout, __name__)
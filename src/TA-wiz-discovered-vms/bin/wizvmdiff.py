@@ -0,0 +1,133 @@
+# encoding = utf-8
+
+"""
+wizvmdiff: generating search command that lists the VMs added, removed and changed between two
+collection runs of an input, computed from the collector's local snapshots.
+
+    | wizvmdiff [input=<name>] [from=<run>] [to=<run>] [fields=<bool>]
+
+A run is "latest", "previous", a Wiz report ID, or an epoch timestamp in seconds or milliseconds
+(the newest run started at or before it). Both snapshots are merge-joined on their ID-sorted
+index, so memory use stays flat however large the inventory is; only the records of VMs that
+were added, removed or changed are decompressed.
+"""
+
+import ta_wiz_discovered_vms_declare
+
+import contextlib
+import sys
+
+from splunklib.searchcommands import dispatch, GeneratingCommand, Configuration, Option, validators
+
+import wiz_change_events
+import wiz_snapshot
+import wiz_state_store
+
+RUN_LATEST = "latest"
+RUN_PREVIOUS = "previous"
+
+
+def resolve_run(checkpoint_dir, stanza, snapshots, run):
+    """
+    Map a run specification to one of the input's snapshots.
+
+    Args:
+    snapshots (list): (run_id, path) pairs of the input, oldest first.
+    run (str): "latest", "previous", a report ID or an epoch timestamp.
+
+    Returns:
+    tuple: The (run_id, path) of the snapshot.
+
+    Raises:
+    ValueError: If no snapshot matches.
+    """
+
+    if run == RUN_LATEST:
+        if snapshots:
+            return snapshots[-1]
+    elif run == RUN_PREVIOUS:
+        if len(snapshots) > 1:
+            return snapshots[-2]
+    elif run.isdigit():
+        run_id = int(run) if len(run) >= 13 else int(run) * 1000
+        candidates = [snapshot for snapshot in snapshots if snapshot[0] <= run_id]
+        if candidates:
+            return candidates[-1]
+    else:
+        run_id = wiz_state_store.find_run_by_report(checkpoint_dir, stanza, run)
+        for snapshot in snapshots:
+            if snapshot[0] == run_id:
+                return snapshot
+
+    raise ValueError(f"No snapshot of input {stanza} matches run {run}. Available runs: "
+                     f"{', '.join(str(run_id) for run_id, _ in snapshots) or 'none'}.")
+
+
+@Configuration()
+class WizVmDiffCommand(GeneratingCommand):
+    """
+    Emit one result per VM added, removed or changed between two runs.
+    """
+
+    input = Option(require=False, doc="The input whose runs are compared. Required when several inputs have snapshots.")
+    from_run = Option(name="from", require=False, default=RUN_PREVIOUS, doc="The older run (default: previous).")
+    to_run = Option(name="to", require=False, default=RUN_LATEST, doc="The newer run (default: latest).")
+    fields = Option(require=False, default=False, validate=validators.Boolean(),
+                    doc="Also list the changed fields of each changed VM.")
+
+    def generate(self):
+
+        checkpoint_dir = wiz_snapshot.default_checkpoint_dir()
+        stanza = self.input
+
+        if stanza is None:
+            inputs = sorted(wiz_snapshot.latest_snapshots(checkpoint_dir))
+            if len(inputs) != 1:
+                self.write_error(f"Specify input=<name>. Inputs with snapshots: {', '.join(inputs) or 'none'}.")
+                return
+            stanza = inputs[0]
+
+        snapshots = wiz_snapshot.list_snapshots(checkpoint_dir, stanza)
+
+        try:
+            old_run, old_path = resolve_run(checkpoint_dir, stanza, snapshots, str(self.from_run))
+            new_run, new_path = resolve_run(checkpoint_dir, stanza, snapshots, str(self.to_run))
+        except ValueError as e:
+            self.write_error(str(e))
+            return
+
+        with contextlib.ExitStack() as stack:
+
+            try:
+                old = stack.enter_context(wiz_snapshot.Snapshot.open(old_path))
+                new = stack.enter_context(wiz_snapshot.Snapshot.open(new_path))
+            except (OSError, ValueError) as e:
+                self.write_error(f"Could not read the snapshots of input {stanza}: {e}")
+                return
+
+            for change, old_position, new_position in wiz_snapshot.diff_snapshots(old, new):
+
+                old_record = old.record_at(old_position) if old_position is not None else None
+                new_record = new.record_at(new_position) if new_position is not None else None
+                resource_id, _, vm = new_record or old_record
+
+                result = {
+                    "_time": new_run / 1000.0,
+                    "change": change,
+                    "resource_id": resource_id,
+                    "input": stanza,
+                    "name": vm.get("name", ""),
+                    "from_run": old_run,
+                    "to_run": new_run,
+                    "old_fingerprint": f"{old_record[1]:016x}" if old_record else "",
+                    "new_fingerprint": f"{new_record[1]:016x}" if new_record else "",
+                }
+
+                if self.fields:
+                    # Every result carries the field: splunklib takes the output columns from the first result.
+                    result["changed_fields"] = wiz_change_events.changed_paths(old_record[2], new_record[2]) if change == wiz_snapshot.CHANGE_CHANGED else None
+
+                yield result
+
+
+dispatch(WizVmDiffCommand, sys.argv, sys.stdin, sys.stdout, __name__)
@@ -0,0 +1,55 @@
+# encoding = utf-8
+
+"""
+External lookup wiz_vm_by_address: resolves an IP address, hostname or instance ID to the Wiz VM
+that owns it, from the address index the collector writes every run.
+
+Splunk sends the whole batch of lookup rows as CSV on stdin; the index is loaded once, every row
+is resolved in memory and the batch is written back as CSV on stdout.
+"""
+
+import ta_wiz_discovered_vms_declare
+
+import csv
+import sys
+
+import wiz_snapshot
+import wiz_vm_lookup
+
+
+def resolve(index, row):
+    """
+    Return the VM matching the first of ip, instance_id and hostname that is set in a row, or None.
+    """
+
+    if row.get("ip"):
+        return index.find_ip(row["ip"])
+    if row.get("instance_id"):
+        return index.find_instance_id(row["instance_id"])
+    if row.get("hostname"):
+        return index.find_hostname(row["hostname"])
+    return None
+
+
+def main():
+
+    reader = csv.DictReader(sys.stdin)
+    rows = list(reader)
+    fieldnames = reader.fieldnames or []
+
+    index = wiz_vm_lookup.LookupIndex.load(wiz_snapshot.default_checkpoint_dir())
+
+    writer = csv.DictWriter(sys.stdout, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+
+    for row in rows:
+        vm = resolve(index, row)
+        if vm is not None:
+            for field, value in vm.items():
+                if field in row and not row[field]:
+                    row[field] = value
+        writer.writerow(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# encoding = utf-8
+
+"""
+wizvms: generating search command that returns the current VM inventory from the collector's
+latest local snapshot of each input, instead of searching weeks of wiz:virtualmachines events.
+
+    | wizvms [input=<name>] [platform=<glob>] [region=<glob>] [subscription=<glob>] [tag="<key>=<glob>,..."]
+
+Filters are case-insensitive and accept * wildcards. The command runs on the instance where the
+wiz_virtual_machines input collects. Filters are matched against the snapshot's filter and tag
+blocks, so only the VMs that match are decompressed.
+"""
+
+import ta_wiz_discovered_vms_declare
+
+import calendar
+import fnmatch
+import json
+import sys
+import time
+
+from splunklib.searchcommands import dispatch, GeneratingCommand, Configuration, Option
+
+import wiz_inventory_kvstore
+import wiz_snapshot
+
+LAST_SEEN_FORMATS = ('%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def parse_last_seen(value):
+    """
+    Return the epoch time of a Wiz "Last Seen" timestamp, or None.
+    """
+
+    for time_format in LAST_SEEN_FORMATS:
+        try:
+            return calendar.timegm(time.strptime(value, time_format))
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def make_matcher(pattern):
+    """
+    Return a case-insensitive wildcard predicate for a filter option, or None if it is not set.
+    """
+
+    if pattern is None or pattern == "":
+        return None
+
+    pattern = pattern.lower()
+    if "*" not in pattern and "?" not in pattern:
+        return lambda value: value.lower() == pattern
+    return lambda value: fnmatch.fnmatchcase(value.lower(), pattern)
+
+
+def parse_tag_filter(value):
+    """
+    Parse "env=prod,owner=team*" into a list of (key, value matcher) pairs.
+    """
+
+    filters = []
+
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, tag_value = item.partition("=")
+        filters.append((key.strip(), make_matcher(tag_value.strip() or "*")))
+
+    return filters
+
+
+def vm_attributes(vm):
+    """
+    Return the filter attributes of a VM from a snapshot written without them.
+    """
+
+    document = wiz_inventory_kvstore.project_vm("", "", 0, vm)
+    return wiz_snapshot.filter_attributes(document["cloud_platform"], document["region"], document["subscription_id"],
+                                          wiz_inventory_kvstore.vm_tags(vm))
+
+
+def vm_record(name, run_id, resource_id, fingerprint, vm, tags):
+    """
+    Build the search result for one VM: the inventory lookup projection plus tags and the raw JSON.
+    """
+
+    record = wiz_inventory_kvstore.project_vm(name, resource_id, fingerprint, vm)
+    del record["_key"]
+    record["run_id"] = run_id
+    record["tags"] = [f"{k}={v}" for k, v in sorted(tags.items())]
+    record["_raw"] = json.dumps(vm, separators=(',', ':'))
+
+    record["_time"] = parse_last_seen(record["last_seen"])
+
+    return record
+
+
+@Configuration()
+class WizVmsCommand(GeneratingCommand):
+    """
+    Stream the VMs of the latest snapshot of every input, filtered on the collector's side.
+    """
+
+    input = Option(require=False, doc="Only return VMs collected by this input.")
+    platform = Option(require=False, doc="Cloud platform, e.g. AWS, Azure, GCP. Wildcards allowed.")
+    region = Option(require=False, doc="Region. Wildcards allowed.")
+    subscription = Option(require=False, doc="Subscription, account or project ID. Wildcards allowed.")
+    tag = Option(require=False, doc="Comma-separated key=value tag filters, all of which must match. Wildcards allowed in values.")
+
+    def generate(self):
+
+        platform = make_matcher(self.platform)
+        region = make_matcher(self.region)
+        subscription = make_matcher(self.subscription)
+        tag_filters = parse_tag_filter(self.tag)
+
+        def matches(attributes):
+            if platform is not None and not platform(str(attributes["platform"])):
+                return False
+            if region is not None and not region(str(attributes["region"])):
+                return False
+            return subscription is None or subscription(str(attributes["subscription"]))
+
+        snapshots = wiz_snapshot.latest_snapshots(wiz_snapshot.default_checkpoint_dir(), self.input)
+
+        if not snapshots:
+            self.write_warning("No inventory snapshot found. Make sure this search runs on the instance that collects "
+                               "the wiz_virtual_machines input and that Snapshots to Keep is not 0.")
+            return
+
+        for name, (run_id, path) in sorted(snapshots.items()):
+
+            try:
+                snapshot = wiz_snapshot.Snapshot.open(path)
+            except (OSError, ValueError) as e:
+                self.write_warning(f"Skipping the snapshot of input {name}: {e}")
+                continue
+
+            with snapshot:
+                for resource_id, fingerprint, vm in snapshot.select(matches, tag_filters, vm_attributes):
+                    yield vm_record(name, run_id, resource_id, fingerprint, vm, wiz_inventory_kvstore.vm_tags(vm))
+
+
+dispatch(WizVmsCommand, sys.argv, sys.stdin, sys.stdout, __name__)
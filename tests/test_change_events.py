@@ -0,0 +1,44 @@
+import json
+import os
+import sys
+import unittest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import wiz_change_events  # noqa: E402
+
+
+def vm(**fields):
+    document = {"name": "web-1", "lastSeen": "2026-10-01T00:00:00Z", "tags": {"env": "prod"},
+                "wizJsonObject": json.dumps({"status": "Active", "region": "eu-west-1"})}
+    document.update(fields)
+    return document
+
+
+class JsonPatchTest(unittest.TestCase):
+
+    def test_last_seen_is_ignored(self):
+        self.assertEqual(wiz_change_events.json_patch(vm(), vm(lastSeen="2026-10-02T00:00:00Z")), [])
+
+    def test_nested_objects_are_compared_key_by_key(self):
+        operations = wiz_change_events.json_patch(vm(), vm(tags={"env": "dev", "owner": "x"}))
+        self.assertEqual(operations, [{"op": "replace", "path": "/tags/env", "value": "dev"},
+                                      {"op": "add", "path": "/tags/owner", "value": "x"}])
+
+    def test_wiz_json_object_is_expanded(self):
+        new = vm(wizJsonObject=json.dumps({"status": "Inactive", "region": "eu-west-1"}))
+        self.assertEqual(wiz_change_events.changed_paths(vm(), new), ["/wizJsonObject/status"])
+
+    def test_keys_are_escaped(self):
+        self.assertEqual(wiz_change_events.changed_paths({"a/b": 1, "c~d": 1}, {"a/b": 2, "c~d": 2}), ["/a~1b", "/c~0d"])
+
+    def test_change_event_lists_patch_paths(self):
+        operations = wiz_change_events.json_patch(vm(), vm(name="web-2"))
+        event = wiz_change_events.change_event("wiz", "r1", "i-1", {"name": "web-2", "last_seen": "x"}, operations)
+        self.assertEqual(event["paths"], ["/name"])
+
+
+if __name__ == "__main__":
+    unittest.main()
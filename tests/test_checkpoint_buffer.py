@@ -0,0 +1,137 @@
+import os
+import sys
+import unittest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import wiz_checkpoint_buffer  # noqa: E402
+
+
+class FakeCheckpointer:
+
+    def __init__(self):
+        self.data = {}
+        self.batches = []
+        self.updates = []
+        self.fail = False
+
+    def update(self, key, state):
+        self.updates.append(key)
+        self.data[key] = state
+
+    def batch_update(self, states):
+        if self.fail:
+            raise RuntimeError("KV store unavailable")
+        self.batches.append([state["_key"] for state in states])
+        for state in states:
+            self.data[state["_key"]] = state["state"]
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class FakeLogger:
+
+    def __init__(self):
+        self.errors = []
+
+    def log_debug(self, message):
+        pass
+
+    def log_info(self, message):
+        pass
+
+    def log_error(self, message):
+        self.errors.append(message)
+
+
+class WriteBehindCheckpointerTest(unittest.TestCase):
+
+    def buffer(self, max_pending=100, max_delay=3600):
+        self.inner = FakeCheckpointer()
+        self.logger = FakeLogger()
+        buffer = wiz_checkpoint_buffer.WriteBehindCheckpointer(self.inner, self.logger, max_pending, max_delay)
+        self.addCleanup(buffer.close)
+        return buffer
+
+    def test_updates_of_one_key_are_coalesced(self):
+        buffer = self.buffer()
+        for i in range(10):
+            buffer.update("a", {"n": i})
+        buffer.update("b", {"n": 0})
+
+        self.assertEqual(self.inner.data, {})
+        self.assertEqual(buffer.get("a"), {"n": 9})
+
+        buffer.flush()
+
+        self.assertEqual(self.inner.batches, [["a", "b"]])
+        self.assertEqual(self.inner.data["a"], {"n": 9})
+        self.assertAlmostEqual(buffer.coalescing_ratio(), 11 / 2)
+
+    def test_flushes_when_enough_keys_are_pending(self):
+        buffer = self.buffer(max_pending=3)
+        buffer.update("a", 1)
+        buffer.update("b", 2)
+        self.assertEqual(self.inner.batches, [])
+        buffer.update("c", 3)
+        self.assertEqual(self.inner.batches, [["a", "b", "c"]])
+
+    def test_large_flush_is_split_into_kvstore_batches(self):
+        buffer = self.buffer(max_pending=5000)
+        for i in range(2500):
+            buffer.update(f"k{i}", i)
+        buffer.flush()
+        self.assertEqual([len(batch) for batch in self.inner.batches], [1000, 1000, 500])
+
+    def test_failed_flush_keeps_keys_without_overwriting_newer_state(self):
+        buffer = self.buffer()
+        buffer.update("a", 1)
+        self.inner.fail = True
+        buffer.flush()
+        self.assertEqual(len(self.logger.errors), 1)
+
+        buffer.update("a", 2)
+        self.inner.fail = False
+        buffer.flush()
+
+        self.assertEqual(self.inner.data, {"a": 2})
+
+    def test_write_through_bypasses_and_drops_pending(self):
+        buffer = self.buffer()
+        buffer.update("a", 1)
+        buffer.write_through("a", 2)
+        buffer.flush()
+
+        self.assertEqual(self.inner.updates, ["a"])
+        self.assertEqual(self.inner.batches, [])
+        self.assertEqual(self.inner.data, {"a": 2})
+
+    def test_delete_drops_pending(self):
+        buffer = self.buffer()
+        buffer.update("a", 1)
+        buffer.delete("a")
+        buffer.flush()
+        self.assertIsNone(buffer.get("a"))
+        self.assertEqual(self.inner.batches, [])
+
+    def test_close_flushes(self):
+        buffer = self.buffer()
+        buffer.update("a", 1)
+        buffer.close()
+        self.assertEqual(self.inner.data, {"a": 1})
+
+    def test_background_flush(self):
+        buffer = self.buffer(max_delay=0.05)
+        buffer.update("a", 1)
+        buffer._closed.wait(0.5)
+        self.assertEqual(self.inner.data, {"a": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import wiz_circuit_breaker  # noqa: E402
+from wiz_circuit_breaker import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN  # noqa: E402
+
+ENDPOINT = "https://api.example.wiz.io/graphql"
+
+
+class FakeHelper:
+
+    def __init__(self, checkpoints=None):
+        self.checkpoints = {} if checkpoints is None else checkpoints
+        self.reads = 0
+        self.writes = 0
+
+    def get_check_point(self, key):
+        self.reads += 1
+        return self.checkpoints.get(key)
+
+    def save_check_point(self, key, state):
+        self.writes += 1
+        self.checkpoints[key] = dict(state)
+
+    def log_info(self, message):
+        pass
+
+    def log_warning(self, message):
+        pass
+
+    def log_error(self, message):
+        pass
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def breaker(self, helper=None, threshold=3, cooldown=60):
+        return wiz_circuit_breaker.CircuitBreaker(helper or FakeHelper(), ENDPOINT, threshold, cooldown)
+
+    def state(self, breaker):
+        return breaker.helper.checkpoints[breaker.key]["state"]
+
+    def open(self, breaker):
+        for _ in range(breaker.threshold):
+            breaker.record_failure("HTTP 500")
+
+    def test_opens_after_threshold_consecutive_failures(self):
+        breaker = self.breaker()
+        breaker.record_failure("HTTP 500")
+        breaker.record_failure("HTTP 500")
+        self.assertEqual(self.state(breaker), STATE_CLOSED)
+        self.assertTrue(breaker.allow_request())
+
+        breaker.record_failure("HTTP 500")
+
+        self.assertEqual(self.state(breaker), STATE_OPEN)
+        self.assertFalse(breaker.allow_request())
+
+    def test_success_resets_failure_count(self):
+        breaker = self.breaker()
+        breaker.record_failure("HTTP 500")
+        breaker.record_failure("HTTP 500")
+        breaker.record_success()
+        breaker.record_failure("HTTP 500")
+        self.assertEqual(self.state(breaker), STATE_CLOSED)
+
+    def test_half_open_probe_after_cooldown(self):
+        breaker = self.breaker()
+        self.open(breaker)
+
+        with mock.patch("time.time", return_value=breaker.helper.checkpoints[breaker.key]["opened_at"] + 61):
+            self.assertTrue(breaker.allow_request())
+            self.assertEqual(self.state(breaker), STATE_HALF_OPEN)
+            self.assertFalse(breaker.allow_request())
+
+    def test_probe_success_closes(self):
+        breaker = self.breaker(cooldown=0)
+        self.open(breaker)
+        self.assertTrue(breaker.allow_request())
+
+        breaker.record_success()
+
+        self.assertEqual(self.state(breaker), STATE_CLOSED)
+        self.assertEqual(breaker.helper.checkpoints[breaker.key]["failures"], 0)
+
+    def test_probe_failure_reopens(self):
+        breaker = self.breaker(cooldown=0)
+        self.open(breaker)
+        self.assertTrue(breaker.allow_request())
+
+        breaker.record_failure("HTTP 502")
+
+        self.assertEqual(self.state(breaker), STATE_OPEN)
+
+    def test_state_is_shared_through_checkpoint(self):
+        checkpoints = {}
+        self.open(self.breaker(FakeHelper(checkpoints)))
+        self.assertFalse(self.breaker(FakeHelper(checkpoints)).allow_request())
+
+    def test_successful_calls_do_not_read_checkpoint(self):
+        helper = FakeHelper()
+        breaker = self.breaker(helper)
+        self.assertTrue(breaker.allow_request())
+        reads, writes = helper.reads, helper.writes
+
+        for _ in range(100):
+            breaker.record_success()
+
+        self.assertEqual((helper.reads, helper.writes), (reads, writes))
+
+    def test_run_start_rereads_state(self):
+        checkpoints = {}
+        breaker = self.breaker(FakeHelper(checkpoints))
+        self.assertTrue(breaker.allow_request())
+
+        self.open(self.breaker(FakeHelper(checkpoints)))
+
+        self.assertFalse(breaker.allow_request())
+
+    def test_write_through_bypasses_buffer(self):
+        helper = FakeHelper()
+        helper.ckpt = mock.Mock()
+        breaker = self.breaker(helper, threshold=1)
+
+        breaker.record_failure("HTTP 500")
+
+        helper.ckpt.write_through.assert_called_once()
+        self.assertEqual(helper.writes, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import wiz_scheduler  # noqa: E402
+
+
+class FakeHelper:
+
+    def __init__(self):
+        self.warnings = []
+
+    def log_info(self, message):
+        pass
+
+    def log_warning(self, message):
+        self.warnings.append(message)
+
+    def log_error(self, message):
+        pass
+
+    def log_debug(self, message):
+        pass
+
+
+class Recorder:
+
+    def __init__(self, block=None):
+        self.runs = []
+        self.block = block
+        self.lock = threading.Lock()
+
+    def __call__(self, name):
+        with self.lock:
+            self.runs.append(name)
+        if self.block is not None:
+            self.block.wait(5)
+
+    def count(self, name):
+        with self.lock:
+            return self.runs.count(name)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class StanzaSchedulerTest(unittest.TestCase):
+
+    def start(self, run_stanza, intervals, max_workers=2):
+        helper = FakeHelper()
+        scheduler = wiz_scheduler.StanzaScheduler(helper, run_stanza, max_workers, spread=wiz_scheduler.SPREAD_NONE)
+        thread = threading.Thread(target=scheduler.run_forever, args=(intervals,), daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 10)
+        self.addCleanup(scheduler.stop)
+        return scheduler, helper
+
+    def test_runs_every_stanza_at_its_interval(self):
+        recorder = Recorder()
+        self.start(recorder, {"fast": 1, "slow": 60})
+
+        self.assertTrue(wait_until(lambda: recorder.count("fast") >= 3))
+        self.assertEqual(recorder.count("slow"), 1)
+
+    def test_interval_of_zero_runs_once(self):
+        recorder = Recorder()
+        self.start(recorder, {"once": 0, "fast": 1})
+
+        self.assertTrue(wait_until(lambda: recorder.count("fast") >= 3))
+        self.assertEqual(recorder.count("once"), 1)
+
+    def test_overlapping_run_is_skipped(self):
+        release = threading.Event()
+        recorder = Recorder(block=release)
+        scheduler, helper = self.start(recorder, {"slow": 1})
+        self.addCleanup(release.set)
+
+        self.assertTrue(wait_until(lambda: helper.warnings))
+        self.assertEqual(recorder.count("slow"), 1)
+        self.assertIn("still running", helper.warnings[0])
+
+    def test_reschedule_removes_and_adds_stanzas(self):
+        recorder = Recorder()
+        scheduler, _ = self.start(recorder, {"old": 60})
+        self.assertTrue(wait_until(lambda: recorder.count("old") == 1))
+
+        scheduler.schedule({"new": 1})
+
+        self.assertTrue(wait_until(lambda: recorder.count("new") >= 2))
+        self.assertEqual(recorder.count("old"), 1)
+        self.assertEqual(set(scheduler._timers), {"new"})
+
+    def test_changed_interval_is_rescheduled(self):
+        recorder = Recorder()
+        scheduler, _ = self.start(recorder, {"a": 60})
+        self.assertTrue(wait_until(lambda: recorder.count("a") == 1))
+
+        scheduler.schedule({"a": 1})
+
+        self.assertTrue(wait_until(lambda: recorder.count("a") >= 3))
+        self.assertEqual(scheduler._timers["a"][1], 1)
+
+    def test_next_run_time_during_a_run(self):
+        next_runs = []
+        scheduler = None
+
+        def run_stanza(name):
+            next_runs.append((time.time(), scheduler.next_run_time(name)))
+
+        scheduler, _ = self.start(run_stanza, {"a": 60, "once": 0})
+        self.assertTrue(wait_until(lambda: len(next_runs) == 2))
+
+        for started, next_run in next_runs:
+            if next_run is not None:
+                self.assertAlmostEqual(next_run - started, 60, delta=2)
+        self.assertEqual(sorted(next_run is None for _, next_run in next_runs), [False, True])
+        self.assertIsNone(scheduler.next_run_time("missing"))
+
+    def test_stop_ends_run_forever(self):
+        recorder = Recorder()
+        helper = FakeHelper()
+        scheduler = wiz_scheduler.StanzaScheduler(helper, recorder, 1, spread=wiz_scheduler.SPREAD_NONE)
+        thread = threading.Thread(target=scheduler.run_forever, args=({"a": 60},), daemon=True)
+        thread.start()
+
+        self.assertTrue(wait_until(lambda: recorder.count("a") == 1))
+        scheduler.stop()
+        thread.join(10)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(scheduler._timers, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
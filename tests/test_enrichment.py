@@ -0,0 +1,153 @@
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import wiz_enrichment  # noqa: E402
+
+CSV = "resource_id,owner,cost_center\ni-1,alice,CC1\nI-2 ,bob,\ni-1,carol,CC9\n,dave,CC2\nweb,erin,CC1\n"
+
+
+def document(resource_id="i-1", name=""):
+    return {"resource_id": resource_id, "name": name}
+
+
+class ParseMatchTest(unittest.TestCase):
+
+    def test_supported_values(self):
+        self.assertEqual(wiz_enrichment.parse_match(None), (wiz_enrichment.MATCH_RESOURCE_ID, None))
+        self.assertEqual(wiz_enrichment.parse_match("hostname"), (wiz_enrichment.MATCH_HOSTNAME, None))
+        self.assertEqual(wiz_enrichment.parse_match("tag: Name "), (wiz_enrichment.MATCH_TAG_PREFIX, "Name"))
+
+    def test_unsupported_values(self):
+        for value in ("ip", "tag:", "tag: "):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                wiz_enrichment.parse_match(value)
+
+
+class EnrichmentIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app_dir = os.path.join(tempfile.mkdtemp(), "TA-wiz-discovered-vms")
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.app_dir))
+        os.makedirs(os.path.join(self.app_dir, "lookups"))
+        wiz_enrichment._cache.clear()
+        self.addCleanup(wiz_enrichment._cache.clear)
+
+    def write(self, name, text=CSV, app_dir=None):
+        path = os.path.join(app_dir or self.app_dir, "lookups", name)
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(path, "wt", encoding="utf-8") as fp:
+            fp.write(text)
+        return path
+
+    def test_first_row_of_each_key_is_kept(self):
+        index = wiz_enrichment.load_csv(self.write("owners.csv"), "resource_id", 1 << 20)
+
+        self.assertEqual((len(index), index.rows, index.columns), (3, 5, ("owner", "cost_center")))
+        self.assertEqual(index.get("I-1"), {"owner": "alice", "cost_center": "CC1"})
+        self.assertEqual(index.get("i-2"), {"owner": "bob"})
+        self.assertIsNone(index.get("i-3"))
+        self.assertIs(index._index["i-1"][1], index._index["web"][1])
+
+    def test_key_field_defaults_to_first_column(self):
+        index = wiz_enrichment.load_csv(self.write("owners.csv.gz"), "", 1 << 20)
+        self.assertEqual(index.key_field, "resource_id")
+        self.assertEqual(index.get("web")["owner"], "erin")
+
+    def test_memory_cap_truncates(self):
+        index = wiz_enrichment.load_csv(self.write("owners.csv"), "resource_id", wiz_enrichment.ENTRY_OVERHEAD_BYTES + 20)
+        self.assertEqual(len(index), 1)
+        self.assertTrue(index.truncated)
+
+    def test_find_lookup_file(self):
+        other_app = os.path.join(os.path.dirname(self.app_dir), "search")
+        os.makedirs(os.path.join(other_app, "lookups"))
+        shared = self.write("shared.csv", app_dir=other_app)
+        local = self.write("owners.csv")
+
+        self.assertEqual(wiz_enrichment.find_lookup_file(self.app_dir, "owners.csv"), local)
+        self.assertEqual(wiz_enrichment.find_lookup_file(self.app_dir, "shared.csv"), shared)
+        self.assertEqual(wiz_enrichment.find_lookup_file(self.app_dir, shared), shared)
+        self.assertIsNone(wiz_enrichment.find_lookup_file(self.app_dir, "missing.csv"))
+        with self.assertRaises(ValueError):
+            wiz_enrichment.find_lookup_file(self.app_dir, "../owners.csv")
+
+    def test_csv_index_is_reused_until_the_file_changes(self):
+        path = self.write("owners.csv")
+        first = wiz_enrichment.load_index(None, self.app_dir, "owners.csv", "resource_id", 1 << 20)
+        self.assertIs(wiz_enrichment.load_index(None, self.app_dir, "owners.csv", "resource_id", 1 << 20), first)
+
+        self.write("owners.csv", "resource_id,owner\ni-1,frank\n")
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        index = wiz_enrichment.load_index(None, self.app_dir, "owners.csv", "resource_id", 1 << 20)
+        self.assertEqual(index.get("i-1"), {"owner": "frank"})
+
+    def test_missing_csv_is_an_error(self):
+        with self.assertRaises(ValueError):
+            wiz_enrichment.load_index(None, self.app_dir, "missing.csv", "resource_id", 1 << 20)
+
+    def test_kvstore_collection_is_paged(self):
+        pages = [[{"_key": "a", "_user": "nobody", "id": f"i-{n}", "owner": "x"} for n in range(3)],
+                 [{"_key": "b", "_user": "nobody", "id": "i-9", "owner": "y"}]]
+        data = mock.Mock()
+        data.query.side_effect = pages
+        client = mock.Mock()
+        client.return_value.kvstore.__getitem__ = mock.Mock(return_value=mock.Mock(data=data))
+        helper = mock.Mock(context_meta={"server_uri": "https://127.0.0.1:8089", "session_key": "key"})
+
+        with mock.patch.object(wiz_enrichment, "KVSTORE_PAGE_SIZE", 3), \
+                mock.patch.object(wiz_enrichment.splunk_rest_client, "SplunkRestClient", client):
+            index = wiz_enrichment.load_index(helper, self.app_dir, "other_app/owners", "id", 1 << 20)
+
+        self.assertEqual(client.call_args[0][1], "other_app")
+        self.assertEqual([c[1]["skip"] for c in data.query.call_args_list], [0, 3])
+        self.assertEqual((len(index), index.columns), (4, ("owner",)))
+
+
+class EnricherTest(unittest.TestCase):
+
+    def index(self, rows):
+        return wiz_enrichment.EnrichmentIndex("test", "key", 1 << 20).load(
+            [{"key": key, "owner": owner} for key, owner in rows])
+
+    def test_resource_id_match(self):
+        enricher = wiz_enrichment.Enricher(self.index([("i-1", "alice")]), ("resource_id", None))
+        self.assertEqual(enricher.lookup(document("i-1"), {}), {"owner": "alice"})
+        self.assertIsNone(enricher.lookup(document("i-2"), {}))
+        self.assertEqual((enricher.hits, enricher.misses), (1, 1))
+
+    def test_hostname_match_falls_back_to_short_name(self):
+        enricher = wiz_enrichment.Enricher(self.index([("web-1", "alice"), ("db.example.com", "bob")]),
+                                           ("hostname", None))
+        self.assertEqual(enricher.lookup(document(name="web-1.eu.internal"), {}), {"owner": "alice"})
+        self.assertEqual(enricher.lookup(document(name="DB.example.com"), {}), {"owner": "bob"})
+        self.assertIsNone(enricher.lookup(document(name=""), {}))
+
+    def test_tag_match(self):
+        enricher = wiz_enrichment.Enricher(self.index([("app-7", "alice")]), ("tag:", "Application"))
+        self.assertEqual(enricher.lookup(document(), {"Application": "APP-7"}), {"owner": "alice"})
+        self.assertIsNone(enricher.lookup(document(), {"application": "app-7"}))
+
+    def test_stats(self):
+        enricher = wiz_enrichment.Enricher(self.index([("i-1", "alice")]), ("tag:", "Name"))
+        self.assertEqual(enricher.stats()["hit_rate"], 0.0)
+        enricher.lookup(document(), {"Name": "i-1"})
+        for _ in range(2):
+            enricher.lookup(document(), {})
+
+        stats = enricher.stats()
+        self.assertEqual((stats["match"], stats["keys"], stats["hits"], stats["misses"]), ("tag:Name", 1, 1, 2))
+        self.assertEqual(stats["hit_rate"], 0.3333)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import json
+import os
+import sys
+import threading
+import unittest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import wiz_entity_types  # noqa: E402
+
+
+class FakeHelper:
+
+    def new_event(self, **kwargs):
+        return kwargs
+
+
+class FakeEventWriter:
+
+    def __init__(self):
+        self.events = []
+
+    def write_event(self, event):
+        self.events.append(event)
+
+
+class EntityEventWriterTest(unittest.TestCase):
+
+    def writer(self, batch_size=2, tenant=None):
+        self.ew = FakeEventWriter()
+        sourcetypes = wiz_entity_types.parse_entity_types("VIRTUAL_MACHINE, SERVERLESS, CONTAINER_IMAGE=wiz:images")
+        writer = wiz_entity_types.EntityEventWriter(FakeHelper(), self.ew, threading.Lock(), sourcetypes, "wiz", "https://api",
+                                                    tenant, batch_size)
+        writer.start_report("r1")
+        return writer
+
+    def test_rows_are_written_in_batches(self):
+        writer = self.writer()
+        writer.add("SERVERLESS", {"id": 1})
+        self.assertEqual(self.ew.events, [])
+        writer.add("CONTAINER_IMAGE", {"id": 2})
+        writer.add("SERVERLESS", {"id": 3})
+        self.assertEqual(len(self.ew.events), 2)
+
+        writer.flush()
+
+        self.assertEqual([e["sourcetype"] for e in self.ew.events], ["wiz:serverless", "wiz:images", "wiz:serverless"])
+        self.assertEqual({e["source"] for e in self.ew.events}, {"wiz_report_id://r1"})
+        self.assertEqual(writer.counts, {"SERVERLESS": 2, "CONTAINER_IMAGE": 1})
+        self.assertEqual(writer._pending, [])
+
+    def test_unrequested_type_gets_default_sourcetype_and_tenant(self):
+        writer = self.writer(tenant="acme")
+        writer.add("KUBERNETES_CLUSTER", {"id": 1})
+        writer.flush()
+
+        event, = self.ew.events
+        self.assertEqual(event["sourcetype"], "wiz:kubernetesclusters")
+        self.assertEqual(json.loads(event["data"]), {"id": 1, "tenant": "acme"})
+
+
+if __name__ == "__main__":
+    unittest.main()
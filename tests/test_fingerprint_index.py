@@ -0,0 +1,90 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import wiz_fingerprint_index  # noqa: E402
+from wiz_fingerprint_index import STATUS_CHANGED, STATUS_NEW, STATUS_UNCHANGED  # noqa: E402
+
+
+class FingerprintIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "index.bin")
+
+    def builder(self, pairs):
+        builder = wiz_fingerprint_index.FingerprintIndexBuilder()
+        for key, content in pairs:
+            builder.add(key, content)
+        return builder
+
+    def test_lookup_and_status(self):
+        key = wiz_fingerprint_index.id_hash("vm-1")
+        index = self.builder([(key, 10)]).build()
+
+        self.assertEqual(index.get(key), 10)
+        self.assertIsNone(index.get(key + 1))
+        self.assertEqual(index.status(key, 10), STATUS_UNCHANGED)
+        self.assertEqual(index.status(key, 11), STATUS_CHANGED)
+        self.assertEqual(index.status(key + 1, 10), STATUS_NEW)
+
+    def test_duplicates_keep_last_content_across_chunks(self):
+        random.seed(7)
+        expected = {}
+        pairs = []
+        for i in range(5000):
+            key = random.getrandbits(64) if i % 3 else i % 40
+            content = random.getrandbits(64)
+            pairs.append((key, content))
+            expected[key] = content
+
+        with mock.patch.object(wiz_fingerprint_index, "SORT_CHUNK_SIZE", 256):
+            index = self.builder(pairs).build()
+
+        self.assertEqual(list(index._ids), sorted(expected))
+        for key, content in expected.items():
+            self.assertEqual(index.get(key), content)
+
+    def test_builder_accepts_more_pairs_after_build(self):
+        builder = self.builder([(2, 20), (1, 10)])
+        builder.build()
+        builder.add(1, 11)
+        index = builder.build()
+        self.assertEqual((list(index._ids), index.get(1)), ([1, 2], 11))
+
+    def test_save_and_load_round_trip(self):
+        pairs = [(random.getrandbits(64), random.getrandbits(64)) for _ in range(1000)]
+        self.builder(pairs).save(self.path)
+
+        with wiz_fingerprint_index.FingerprintIndex.load(self.path) as index:
+            self.assertEqual(len(index), 1000)
+            self.assertEqual(index.nbytes, 16000)
+            for key, content in pairs:
+                self.assertEqual(index.get(key), content)
+
+    def test_missing_or_corrupt_file_is_empty(self):
+        self.assertEqual(len(wiz_fingerprint_index.FingerprintIndex.load(self.path)), 0)
+        with open(self.path, "wb") as fp:
+            fp.write(b"garbage")
+        self.assertEqual(len(wiz_fingerprint_index.FingerprintIndex.load(self.path)), 0)
+
+    def test_save_replaces_loaded_index(self):
+        self.builder([(1, 10)]).save(self.path)
+        index = wiz_fingerprint_index.FingerprintIndex.load(self.path)
+        index.close()
+        self.builder([(1, 11)]).save(self.path)
+        with wiz_fingerprint_index.FingerprintIndex.load(self.path) as index:
+            self.assertEqual(index.get(1), 11)
+
+
+if __name__ == "__main__":
+    unittest.main()
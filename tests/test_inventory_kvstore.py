@@ -0,0 +1,73 @@
+import json
+import os
+import sys
+import unittest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import wiz_inventory_kvstore  # noqa: E402
+
+
+class FakeData:
+
+    def __init__(self):
+        self.saved = []
+        self.queries = []
+
+    def batch_save(self, *documents):
+        self.saved.extend(documents)
+
+    def delete(self, query):
+        self.queries.append(json.loads(query))
+
+
+def collection(name, remove_legacy_keys=False):
+    inventory = wiz_inventory_kvstore.VmInventoryCollection.__new__(wiz_inventory_kvstore.VmInventoryCollection)
+    inventory.helper = None
+    inventory.name = name
+    inventory.batch_size = 2
+    inventory.remove_legacy_keys = remove_legacy_keys
+    inventory.upserted = inventory.deleted = inventory.requests = 0
+    inventory._pending = []
+    inventory._data = FakeData()
+    return inventory
+
+
+class VmInventoryCollectionTest(unittest.TestCase):
+
+    def test_same_vm_in_two_inputs_has_two_documents(self):
+        vm = {"name": "web-1", "region": "eu-west-1"}
+        first = wiz_inventory_kvstore.project_vm("wiz", "i-1", 1, vm)
+        second = wiz_inventory_kvstore.project_vm("wiz_eu", "i-1", 1, vm)
+
+        self.assertNotEqual(first["_key"], second["_key"])
+        self.assertEqual((first["resource_id"], second["resource_id"]), ("i-1", "i-1"))
+
+    def test_delete_matches_resource_id_within_input(self):
+        inventory = collection("wiz")
+        inventory.delete(["i-1", "i-2"])
+        self.assertEqual(inventory._data.queries,
+                         [{"$and": [{"input": "wiz"}, {"$or": [{"resource_id": "i-1"}, {"resource_id": "i-2"}]}]}])
+        self.assertEqual(inventory.deleted, 2)
+
+    def test_legacy_keys_are_removed_once_migrating(self):
+        inventory = collection("wiz", remove_legacy_keys=True)
+        for resource_id in ("i-1", "i-2", "i-3"):
+            inventory.upsert(wiz_inventory_kvstore.project_vm("wiz", resource_id, 1, {}))
+        inventory.flush()
+
+        self.assertEqual([d["_key"] for d in inventory._data.saved], ["wiz:i-1", "wiz:i-2", "wiz:i-3"])
+        legacy = [clause["_key"] for query in inventory._data.queries for clause in query["$and"][1]["$or"]]
+        self.assertEqual(legacy, ["i-1", "i-2", "i-3"])
+
+    def test_no_legacy_deletes_after_migration(self):
+        inventory = collection("wiz")
+        inventory.upsert(wiz_inventory_kvstore.project_vm("wiz", "i-1", 1, {}))
+        inventory.flush()
+        self.assertEqual(inventory._data.queries, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
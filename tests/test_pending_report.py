@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import input_module_wiz_virtual_machines as input_module  # noqa: E402
+
+URL = "https://api.eu1.app.wiz.io/graphql"
+ENTITY_TYPES = {"VIRTUAL_MACHINE": "wiz:virtualmachines"}
+PENDING_KEY = input_module.PENDING_REPORT_CHECKPOINT_PREFIX + "wiz"
+PREWARM_KEY = input_module.PREWARM_CHECKPOINT_PREFIX + "wiz"
+
+
+class FakeHelper:
+
+    def __init__(self):
+        self.checkpoints = {}
+        self.logs = []
+
+    def get_check_point(self, key):
+        return self.checkpoints.get(key)
+
+    def save_check_point(self, key, state):
+        self.checkpoints[key] = state
+
+    def delete_check_point(self, key):
+        self.checkpoints.pop(key, None)
+
+    def get_global_setting(self, name):
+        return "1" if name == "daemon_mode" else None
+
+    def log_info(self, message):
+        self.logs.append(message)
+
+    log_warning = log_error = log_debug = log_info
+
+
+class ObtainReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.helper = FakeHelper()
+        self.params = input_module.report_params(URL, "", ENTITY_TYPES)
+        self.created = []
+        self.failed = set()
+        patches = [
+            mock.patch.object(input_module, "create_cloud_resource_inventory_report", self.create),
+            mock.patch.object(input_module, "get_cloud_resource_inventory_report", self.retrieve),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def create(self, helper, url, token, project_id, rn, entity_types):
+        self.created.append(f"new-{len(self.created) + 1}")
+        return self.created[-1]
+
+    def retrieve(self, helper, url, token, rn, report_id, *args):
+        if report_id in self.failed:
+            raise input_module.ReportRunFailed(f"Report {report_id} ended with status FAILED.")
+        self.retrieved_state = dict(self.helper.checkpoints)
+        return [report_id]
+
+    def obtain(self):
+        return input_module.obtain_report(self.helper, "wiz", URL, "token", "", "rn", ENTITY_TYPES, {}, None)
+
+    def save(self, key, report_id):
+        self.helper.checkpoints[key] = dict(self.params, report_id=report_id, report_name=report_id, created=time.time())
+
+    def test_new_report_is_pending_until_ingested(self):
+        self.assertEqual(self.obtain(), ("new-1", ["new-1"]))
+        self.assertEqual(self.retrieved_state[PENDING_KEY]["report_id"], "new-1")
+
+    def test_pending_report_is_resumed_before_the_prewarmed_one(self):
+        self.save(PENDING_KEY, "pending")
+        self.save(PREWARM_KEY, "prewarmed")
+
+        self.assertEqual(self.obtain(), ("pending", ["pending"]))
+        self.assertEqual(self.helper.checkpoints[PREWARM_KEY]["report_id"], "prewarmed")
+        self.assertEqual(self.created, [])
+
+    def test_failed_pending_report_is_replaced(self):
+        self.save(PENDING_KEY, "pending")
+        self.failed.add("pending")
+
+        self.assertEqual(self.obtain(), ("new-1", ["new-1"]))
+        self.assertEqual(self.helper.checkpoints[PENDING_KEY]["report_id"], "new-1")
+
+    def test_failed_new_report_is_not_retried(self):
+        self.failed.add("new-1")
+
+        self.assertEqual(self.obtain(), ("new-1", None))
+        self.assertNotIn(PENDING_KEY, self.helper.checkpoints)
+        self.assertEqual(self.created, ["new-1"])
+
+
+class HttpPoolSizeTest(unittest.TestCase):
+
+    def test_pool_covers_every_range_of_every_worker(self):
+        helper = FakeHelper()
+        self.assertEqual(input_module.get_http_pool_size(helper, 4), 4 * input_module.DEFAULT_REPORT_DOWNLOAD_RANGES)
+        helper.get_global_setting = {"report_download_ranges": "1"}.get
+        self.assertEqual(input_module.get_http_pool_size(helper, 4), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import http.server
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import requests  # noqa: E402
+import wiz_range_download  # noqa: E402
+import wiz_report_spill  # noqa: E402
+
+BODY = random.Random(1).getrandbits(8 * 1000003).to_bytes(1000003, "little")
+ETAG = '"report-1"'
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves BODY, honouring Range requests unless the server's `ranges` flag is off. A range whose
+    first byte is in the server's `cut` set is sent only in part, once, then the connection drops.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        requested = self.headers.get("Range")
+        server.requests.append(requested)
+
+        if requested and server.ranges:
+            first, last = (int(n) for n in requested[len("bytes="):].split("-"))
+            data = BODY[first:last + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {first}-{last}/{len(BODY)}")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            if first in server.cut:
+                server.cut.discard(first)
+                self.wfile.write(data[:len(data) // 3])
+                self.wfile.flush()
+                self.close_connection = True
+                return
+            self.wfile.write(data)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.send_header("Accept-Ranges", "bytes" if server.ranges else "none")
+        self.send_header("ETag", ETAG)
+        self.end_headers()
+        self.wfile.write(BODY)
+
+
+class RangeServer(http.server.ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class RangedDownloadTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RangeServer(("127.0.0.1", 0), RangeHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/report.csv"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.ranges = True
+        self.server.cut = set()
+        self.server.requests = []
+        self.session = requests.Session()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "wiz_spill_r1.csv")
+        self._retry_delay = wiz_range_download.RETRY_DELAY_SECONDS
+        wiz_range_download.RETRY_DELAY_SECONDS = 0
+
+    def tearDown(self):
+        wiz_range_download.RETRY_DELAY_SECONDS = self._retry_delay
+        self.session.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def download(self, parts=4, **kwargs):
+        return wiz_range_download.RangedDownload(self.session.get, self.url, self.path, len(BODY), parts, etag=ETAG, **kwargs)
+
+    def read(self):
+        with open(self.path, "rb") as fp:
+            return fp.read()
+
+    def test_probe(self):
+        response = self.session.get(self.url, stream=True)
+        try:
+            self.assertEqual(wiz_range_download.supports_ranges(response), len(BODY))
+            self.assertEqual(wiz_range_download.validator(response), ETAG)
+        finally:
+            response.close()
+
+    def test_ranges(self):
+        download = self.download()
+        self.assertEqual(download.download(), len(BODY))
+        self.assertEqual(self.read(), BODY)
+        self.assertTrue(wiz_report_spill.is_complete(self.path))
+        self.assertEqual(sorted(r for r in self.server.requests), sorted(f"bytes={a}-{b}" for a, b in wiz_range_download.split_ranges(len(BODY), 4)))
+        self.assertFalse(os.path.exists(self.path + wiz_range_download.PART_SUFFIX))
+        self.assertFalse(os.path.exists(self.path + wiz_range_download.PROGRESS_SUFFIX))
+
+    def test_whole_body_answer_falls_back(self):
+        self.server.ranges = False
+        with self.assertRaises(wiz_range_download.RangesNotSupported):
+            self.download().download()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_partial_range_is_resumed(self):
+        ranges = wiz_range_download.split_ranges(len(BODY), 4)
+        self.server.cut = {ranges[0][0], ranges[2][0]}
+        download = self.download()
+        download.download()
+        self.assertEqual(self.read(), BODY)
+        self.assertEqual(download.stats()["retries"], 2)
+        resumed = [r for r in self.server.requests if r not in {f"bytes={a}-{b}" for a, b in ranges}]
+        self.assertEqual(len(resumed), 2)
+        for requested, (first, last) in zip(sorted(resumed, key=lambda r: int(r[6:].split("-")[0])), (ranges[0], ranges[2])):
+            start, end = (int(n) for n in requested[len("bytes="):].split("-"))
+            self.assertGreater(start, first)
+            self.assertEqual(end, last)
+
+    def test_failed_download_resumes_in_a_new_attempt(self):
+        ranges = wiz_range_download.split_ranges(len(BODY), 2)
+        self.server.cut = {ranges[1][0]}
+        with self.assertRaises(IOError):
+            self.download(parts=2, attempts=1).download()
+        with open(self.path + wiz_range_download.PROGRESS_SUFFIX) as fp:
+            progress = json.load(fp)["ranges"]
+        self.assertEqual(progress[0][1], ranges[0][1] + 1)
+        self.assertGreater(progress[1][1], ranges[1][0])
+
+        download = self.download(parts=2)
+        self.assertEqual(download.resumed_bytes, sum(n - a for a, n, b in progress))
+        self.assertEqual(download.download(), len(BODY) - download.resumed_bytes)
+        self.assertEqual(self.read(), BODY)
+        self.assertEqual(self.server.requests[-1], f"bytes={progress[1][1]}-{ranges[1][1]}")
+
+    def test_other_etag_starts_over(self):
+        self.server.cut = {0}
+        with self.assertRaises(IOError):
+            self.download(parts=1, attempts=1).download()
+        download = wiz_range_download.RangedDownload(self.session.get, self.url, self.path, len(BODY), 1, etag='"report-2"')
+        self.assertEqual(download.resumed_bytes, 0)
+
+    def test_progress_is_saved_while_a_range_downloads(self):
+        saved = []
+        download = self.download(parts=1)
+        save_progress = download._save_progress
+
+        def record_progress():
+            save_progress()
+            with open(download.progress_path) as fp:
+                saved.append(json.load(fp)["ranges"][0][1])
+
+        download._save_progress = record_progress
+        previous = wiz_range_download.PROGRESS_SAVE_BYTES, wiz_report_spill.CHUNK_SIZE
+        wiz_range_download.PROGRESS_SAVE_BYTES, wiz_report_spill.CHUNK_SIZE = 128 * 1024, 32 * 1024
+        try:
+            download.download()
+        finally:
+            wiz_range_download.PROGRESS_SAVE_BYTES, wiz_report_spill.CHUNK_SIZE = previous
+
+        partial = [offset for offset in saved if 0 < offset < len(BODY)]
+        self.assertGreaterEqual(len(partial), len(BODY) // (128 * 1024) - 1)
+        self.assertEqual(partial, sorted(partial))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import input_module_wiz_virtual_machines as input_module  # noqa: E402
+import wiz_ratelimit  # noqa: E402
+
+ENDPOINT = "https://api.example.wiz.io/graphql"
+
+
+class FakeHelper:
+
+    def __init__(self, state_dir=None):
+        self.context_meta = {"checkpoint_dir": state_dir}
+        self.warnings = []
+
+    def get_global_setting(self, name):
+        return None
+
+    def log_info(self, message):
+        pass
+
+    def log_warning(self, message):
+        self.warnings.append(message)
+
+    def log_error(self, message):
+        pass
+
+    def log_debug(self, message):
+        pass
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class GovernorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.state_dir)
+
+    def governor(self, rate=10, max_concurrency=2):
+        return wiz_ratelimit.WizApiGovernor(FakeHelper(), self.state_dir, ENDPOINT, rate, max_concurrency)
+
+    def rate(self, governor):
+        return governor._load(time.time())["rate"]
+
+    def test_throttled_response_halves_rate_and_backs_off(self):
+        governor = self.governor()
+
+        retry_after = governor.record_response("query", FakeResponse(429, {"Retry-After": "7"}))
+
+        self.assertEqual(retry_after, 7)
+        self.assertAlmostEqual(self.rate(governor), 5)
+        self.assertGreater(governor._load(time.time())["backoff_until"], time.time() + 6)
+        self.assertEqual(governor.throttled, 1)
+
+    def test_rate_never_drops_below_minimum(self):
+        governor = self.governor(rate=0.1)
+        for _ in range(10):
+            governor.record_response("query", FakeResponse(503, {"Retry-After": "0"}))
+        self.assertAlmostEqual(self.rate(governor), wiz_ratelimit.MIN_RATE)
+
+    def test_success_adds_rate_back_additively(self):
+        governor = self.governor()
+        governor.record_response("query", FakeResponse(429, {"Retry-After": "0"}))
+
+        governor.record_response("query", FakeResponse(200))
+
+        self.assertAlmostEqual(self.rate(governor), 5 + 10 * wiz_ratelimit.INCREASE_FRACTION)
+        for _ in range(100):
+            governor.record_response("query", FakeResponse(200))
+        self.assertAlmostEqual(self.rate(governor), 10)
+
+    def test_state_is_shared_between_governors(self):
+        self.governor().record_response("query", FakeResponse(429, {"Retry-After": "0"}))
+        self.assertAlmostEqual(self.rate(self.governor()), 5)
+
+    def test_retry_after_date_form_uses_default(self):
+        response = FakeResponse(429, {"Retry-After": "Wed, 21 Oct 2026 07:28:00 GMT"})
+        self.assertEqual(wiz_ratelimit.parse_retry_after(response), wiz_ratelimit.DEFAULT_RETRY_AFTER_SECONDS)
+
+    def test_backoff_blocks_new_slots(self):
+        governor = self.governor()
+        governor.record_response("query", FakeResponse(429, {"Retry-After": "60"}))
+        self.assertGreater(governor._try_acquire("lease"), 50)
+
+    def test_concurrency_is_capped(self):
+        governor = self.governor(rate=100, max_concurrency=2)
+        inside = []
+        peak = []
+        lock = threading.Lock()
+
+        def call():
+            with governor.slot("query"):
+                with lock:
+                    inside.append(1)
+                    peak.append(len(inside))
+                time.sleep(0.1)
+                with lock:
+                    inside.pop()
+
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+
+        self.assertEqual(len(peak), 5)
+        self.assertLessEqual(max(peak), 2)
+
+
+class WizRequestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.state_dir)
+        input_module._governors.clear()
+        input_module._circuit_breakers.clear()
+        self.addCleanup(input_module._governors.clear)
+        self.addCleanup(input_module._circuit_breakers.clear)
+
+    def test_throttled_streamed_response_is_closed_before_retry(self):
+        responses = [FakeResponse(429, {"Retry-After": "0"}), FakeResponse(200)]
+        session = mock.Mock()
+        session.request.side_effect = list(responses)
+
+        with mock.patch.object(input_module, "get_http_session", return_value=session):
+            response = input_module.wiz_request(FakeHelper(self.state_dir), ENDPOINT, "download", "GET",
+                                                ENDPOINT, stream=True)
+
+        self.assertIs(response, responses[1])
+        self.assertTrue(responses[0].closed)
+        self.assertFalse(responses[1].closed)
+        self.assertEqual(session.request.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
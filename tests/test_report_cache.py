@@ -0,0 +1,167 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import input_module_wiz_virtual_machines as input_module  # noqa: E402
+import wiz_report_cache  # noqa: E402
+
+URL = "https://api.eu1.app.wiz.io/graphql"
+
+
+class FakeHelper:
+
+    def __init__(self, checkpoint_dir, stanzas, window="600"):
+        self.context_meta = {"checkpoint_dir": checkpoint_dir}
+        self.stanzas = stanzas
+        self.settings = {"report_sharing_window": window}
+
+    def get_input_stanza(self):
+        return self.stanzas
+
+    def get_arg(self, name, stanza):
+        return self.stanzas[stanza].get(name)
+
+    def get_sourcetype(self, stanza):
+        return "wiz:virtualmachines"
+
+    def get_global_setting(self, name):
+        return self.settings.get(name)
+
+    def log_warning(self, message):
+        pass
+
+
+def stanza(client_id="client-1", project_id="", entity_types="", index="main"):
+    return {"global_account": {"username": client_id}, "api_endpoint_url": URL, "project_id": project_id,
+            "entity_types": entity_types, "index": index}
+
+
+class ReportKeyTest(unittest.TestCase):
+
+    def test_key_ignores_entity_type_order(self):
+        self.assertEqual(wiz_report_cache.report_key("c", URL, "", ["SERVERLESS", "VIRTUAL_MACHINE"]),
+                         wiz_report_cache.report_key("c", URL, "", ["VIRTUAL_MACHINE", "SERVERLESS"]))
+
+    def test_key_depends_on_account_endpoint_and_project(self):
+        keys = {
+            wiz_report_cache.report_key("c", URL, "", ["VIRTUAL_MACHINE"]),
+            wiz_report_cache.report_key("d", URL, "", ["VIRTUAL_MACHINE"]),
+            wiz_report_cache.report_key("c", URL + "/v2", "", ["VIRTUAL_MACHINE"]),
+            wiz_report_cache.report_key("c", URL, "p1", ["VIRTUAL_MACHINE"]),
+        }
+        self.assertEqual(len(keys), 4)
+
+
+class SharedReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.checkpoint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.checkpoint_dir)
+
+    def shared(self, key="k1", window=600):
+        return wiz_report_cache.SharedReport(self.checkpoint_dir, key, window)
+
+    def test_store_and_load(self):
+        shared = self.shared()
+        self.assertIsNone(shared.load())
+
+        shared.store("r1", "rn1", b"a,b\n1,2\n")
+
+        self.assertEqual(self.shared().load(), ("r1", "rn1", shared.csv_path))
+        with open(shared.csv_path, "rb") as fp:
+            self.assertEqual(fp.read(), b"a,b\n1,2\n")
+
+    def test_store_file_moves_the_download(self):
+        download = os.path.join(self.checkpoint_dir, "download.csv")
+        with open(download, "wb") as fp:
+            fp.write(b"a\n1\n")
+
+        shared = self.shared()
+        shared.store_file("r1", "rn1", download)
+
+        self.assertFalse(os.path.exists(download))
+        self.assertEqual(shared.load()[0], "r1")
+
+    def test_report_past_the_window_is_not_shared(self):
+        shared = self.shared(window=0)
+        shared.store("r1", "rn1", b"a\n")
+        time.sleep(0.01)
+        self.assertIsNone(shared.load())
+
+    def test_partial_csv_is_not_shared(self):
+        shared = self.shared()
+        shared.store("r1", "rn1", b"a\n1\n")
+        with open(shared.csv_path, "ab") as fp:
+            fp.write(b"2\n")
+        self.assertIsNone(shared.load())
+
+    def test_store_prunes_expired_reports_of_other_keys(self):
+        old = self.shared("old", window=0)
+        old.store("r0", "rn0", b"a\n")
+        past = time.time() - 60
+        for path in (old.csv_path, old.meta_path):
+            os.utime(path, (past, past))
+
+        current = self.shared("k1", window=30)
+        current.store("r1", "rn1", b"a\n")
+
+        self.assertEqual(sorted(f for f in os.listdir(current.spool_dir) if not f.endswith(".lock")),
+                         ["wiz_report_k1.csv", "wiz_report_k1.json"])
+
+    def test_second_input_waits_for_the_first(self):
+        first = self.shared()
+        order = []
+
+        def second():
+            with self.shared().lock():
+                order.append(("second", self.shared().load()))
+
+        with first.lock():
+            thread = threading.Thread(target=second)
+            thread.start()
+            time.sleep(0.2)
+            order.append(("first", None))
+            first.store("r1", "rn1", b"a\n")
+        thread.join(5)
+
+        self.assertEqual(order, [("first", None), ("second", ("r1", "rn1", first.csv_path))])
+
+
+class OpenSharedReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.checkpoint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.checkpoint_dir)
+
+    def open(self, stanzas, window="600", name="a"):
+        helper = FakeHelper(self.checkpoint_dir, stanzas, window)
+        return input_module.open_shared_report(helper, name, "client-1", URL, "", {"VIRTUAL_MACHINE": "wiz:virtualmachines"})
+
+    def test_inputs_with_the_same_report_share_it(self):
+        shared = self.open({"a": stanza(), "b": stanza(index="other")})
+        self.assertIsNotNone(shared)
+        self.assertEqual(shared.key, wiz_report_cache.report_key("client-1", URL, "", ["VIRTUAL_MACHINE"]))
+
+    def test_no_sharing_without_another_input(self):
+        self.assertIsNone(self.open({"a": stanza(), "b": stanza(client_id="client-2"), "c": stanza(project_id="p1"),
+                                     "d": stanza(entity_types="VIRTUAL_MACHINE,SERVERLESS")}))
+
+    def test_no_sharing_when_disabled(self):
+        self.assertIsNone(self.open({"a": stanza(), "b": stanza()}, window="0"))
+
+    def test_unreadable_stanza_is_not_a_match(self):
+        broken = stanza()
+        broken["global_account"] = None
+        self.assertIsNone(self.open({"a": stanza(), "b": broken}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+import csv
+import http.server
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import requests  # noqa: E402
+import input_module_wiz_virtual_machines as input_module  # noqa: E402
+import wiz_entity_types  # noqa: E402
+import wiz_report_spill  # noqa: E402
+
+COLUMNS = ["Cloud Native JSON", "Last Seen", "Subscription ID", "Projects", "Region", "Wiz JSON Object", "External ID",
+           "Entity Type", "Tags"]
+ENTITY_TYPES = {"VIRTUAL_MACHINE": "wiz:virtualmachines", "SERVERLESS": "wiz:serverless"}
+
+
+def make_report(count=40):
+    """
+    A report whose JSON columns are pretty-printed, so most records span several lines, with quoted
+    quotes and multi-line tags thrown in.
+    """
+
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=COLUMNS)
+    writer.writeheader()
+    for i in range(count):
+        vm = {"id": f"i-{i}", "name": f'web "{i}"', "tags": {"note": "first line\nsecond line"}}
+        writer.writerow({
+            "Cloud Native JSON": json.dumps(vm, indent=2),
+            "Last Seen": "2024-01-01T00:00:00Z",
+            "Subscription ID": f"sub-{i % 3}",
+            "Projects": "p1",
+            "Region": "eu-west-1",
+            "Wiz JSON Object": json.dumps({"cloudPlatform": "AWS", "name": vm["name"]}, indent=1),
+            "External ID": f"i-{i}" if i % 5 else "",
+            "Entity Type": "SERVERLESS" if i % 10 == 9 else "VIRTUAL_MACHINE",
+            "Tags": "owner=alice\nteam=\"blue\"" if i % 2 else "",
+        })
+    return out.getvalue().encode("utf-8")
+
+
+REPORT = make_report()
+
+
+class ReportHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(REPORT)))
+        self.end_headers()
+        self.wfile.write(REPORT)
+
+
+class FakeHelper:
+
+    def __init__(self):
+        self.errors = []
+
+    def get_global_setting(self, name):
+        return "0" if name == "report_memory_budget_mb" else None
+
+    def new_event(self, **kwargs):
+        return kwargs
+
+    def log_debug(self, message):
+        pass
+
+    def log_warning(self, message):
+        pass
+
+    def log_error(self, message):
+        self.errors.append(message)
+
+
+class FakeEventWriter:
+
+    def __init__(self):
+        self.events = []
+
+    def write_event(self, event):
+        self.events.append(event)
+
+
+class SpilledReportTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ReportHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/report.csv"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = wiz_report_spill.spill_path(self.directory, "r1")
+        self.helper = FakeHelper()
+        self.ew = FakeEventWriter()
+        self.entity_writer = wiz_entity_types.EntityEventWriter(self.helper, self.ew, threading.Lock(), ENTITY_TYPES, "main",
+                                                                "wiz", batch_size=2)
+        self.entity_writer.start_report("r1")
+
+    def download(self):
+        with requests.get(self.url, stream=True) as response, mock.patch.object(wiz_report_spill, "CHUNK_SIZE", 7):
+            return wiz_report_spill.stream_to_file(response, self.path, int(response.headers["Content-Length"]))
+
+    def parse(self, stats=None):
+        return input_module.parse_spilled_report(self.helper, self.path, "r1", "rn1", stats, ENTITY_TYPES, self.entity_writer)
+
+    def expected(self):
+        return [row for row in csv.DictReader(io.StringIO(REPORT.decode("utf-8")))]
+
+    def test_records_span_lines(self):
+        self.download()
+        with wiz_report_spill.SpilledReport(self.path) as report:
+            self.assertEqual(len(report), len(self.expected()) + 1)
+            self.assertLess(len(report), REPORT.count(b"\n"))
+            self.assertEqual(list(csv.reader([report.record(3).decode("utf-8")]))[0][0],
+                             self.expected()[2]["Cloud Native JSON"])
+
+    def test_streamed_end_to_end(self):
+        self.assertEqual(self.download(), len(REPORT))
+        self.assertTrue(wiz_report_spill.is_complete(self.path))
+
+        stats = {}
+        data = self.parse(stats)
+
+        self.assertIsInstance(data, wiz_report_spill.SpilledRows)
+        self.assertEqual(stats["bytes"], len(REPORT))
+        self.assertTrue(os.path.exists(self.path))
+
+        vms = list(data)
+        expected = self.expected()
+        expected_vms = [row for row in expected if row["Entity Type"] == "VIRTUAL_MACHINE"]
+
+        self.assertIsNone(data.error)
+        self.assertEqual(self.helper.errors, [])
+        self.assertEqual([vm[2] for vm in vms], [dict(json.loads(row["Cloud Native JSON"]), lastSeen=row["Last Seen"],
+                                                     subscriptionID=row["Subscription ID"], projects=row["Projects"],
+                                                     region=row["Region"], wizJsonObject=row["Wiz JSON Object"])
+                                                for row in expected_vms])
+        self.assertEqual([vm[0] for vm in vms], [json.loads(row["Cloud Native JSON"])["id"] for row in expected_vms])
+        self.assertEqual(vms[1][2]["tags"]["note"], "first line\nsecond line")
+        self.assertEqual(len({vm[1] for vm in vms}), len(vms))
+
+        self.assertEqual(self.entity_writer.counts, {"SERVERLESS": len(expected) - len(expected_vms)})
+        self.assertEqual(len(self.ew.events), 4)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.path + wiz_report_spill.COMPLETE_SUFFIX))
+
+    def test_abandoned_iteration_keeps_the_spool_file(self):
+        self.download()
+        data = self.parse()
+        rows = iter(data)
+        next(rows)
+        rows.close()
+
+        self.assertIsNone(data.report._mmap)
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_report_cut_inside_a_quoted_field(self):
+        self.download()
+        with open(self.path, "r+b") as fp:
+            fp.truncate(REPORT.index(b"first line", len(REPORT) // 2))
+
+        self.assertFalse(wiz_report_spill.is_complete(self.path))
+        with self.assertRaises(ValueError):
+            wiz_report_spill.SpilledReport(self.path)
+        self.assertIsNone(self.parse())
+        self.assertEqual(len(self.helper.errors), 1)
+
+    def test_read_error_ends_the_rows_early(self):
+        self.download()
+        data = self.parse()
+        failing = wiz_report_spill.SpilledRows(data.report, self.failing_rows(data), data._on_complete)
+
+        vms = list(failing)
+
+        self.assertEqual(len(vms), 3)
+        self.assertIsInstance(failing.error, OSError)
+        self.assertTrue(input_module.report_read_failed(self.helper, "wiz", "r1", failing, {}))
+        self.assertTrue(os.path.exists(self.path))
+
+    @staticmethod
+    def failing_rows(data):
+        for count, row in enumerate(data._rows):
+            if count == 3:
+                raise OSError("I/O error")
+            yield row
+
+
+if __name__ == "__main__":
+    unittest.main()
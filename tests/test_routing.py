@@ -0,0 +1,93 @@
+import json
+import os
+import sys
+import unittest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import wiz_routing  # noqa: E402
+
+
+def document(platform="AWS", subscription="111122223333", region="eu-west-1", projects=""):
+    return {"cloud_platform": platform, "subscription_id": subscription, "region": region, "projects": projects}
+
+
+def table(*specs):
+    return wiz_routing.RoutingTable(wiz_routing.parse_rules(json.dumps(list(specs))), "main", "wiz:vm")
+
+
+class ParseRulesTest(unittest.TestCase):
+
+    def test_blank_setting_has_no_rules(self):
+        self.assertEqual(wiz_routing.parse_rules(None), [])
+        self.assertEqual(wiz_routing.parse_rules("  "), [])
+        self.assertFalse(wiz_routing.RoutingTable([], "main", "wiz:vm"))
+
+    def test_invalid_rules_are_rejected(self):
+        for text in ("{not json", "{}", "[1]", '[{"match": []}]', '[{"match": {"colour": "red"}, "index": "x"}]',
+                     '[{"fields": "name"}]', '[{"match": {"platform": "AWS"}}]'):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                wiz_routing.parse_rules(text)
+
+    def test_fields_always_keep_last_seen(self):
+        rule, = wiz_routing.parse_rules('[{"fields": ["id", "name", "id"]}]')
+        self.assertEqual(rule.fields, ("lastSeen", "id", "name"))
+
+
+class RoutingTableTest(unittest.TestCase):
+
+    def test_no_match_uses_input_defaults(self):
+        routing = table({"match": {"platform": "Azure"}, "index": "azure"})
+        self.assertEqual(routing.route(document(), {}), wiz_routing.Route("main", "wiz:vm", None))
+        self.assertEqual(routing.stats(), {"default": 1})
+
+    def test_first_matching_rule_wins(self):
+        routing = table({"match": {"platform": "aws", "region": "eu-*"}, "index": "aws_eu"},
+                        {"match": {"platform": "AWS"}, "index": "aws", "sourcetype": "wiz:vm:aws"})
+
+        self.assertEqual(routing.route(document(), {}), wiz_routing.Route("aws_eu", "wiz:vm", None))
+        self.assertEqual(routing.route(document(region="us-east-1"), {}), wiz_routing.Route("aws", "wiz:vm:aws", None))
+        self.assertEqual(routing.stats(), {"rule1": 1, "rule2": 1})
+
+    def test_alternatives_and_wildcards(self):
+        routing = table({"match": {"subscription": ["1111*", "4444*"]}, "index": "prod"})
+        self.assertEqual(routing.route(document(subscription="444455556666"), {}).index, "prod")
+        self.assertEqual(routing.route(document(subscription="999955556666"), {}).index, "main")
+
+    def test_project_matches_any_project(self):
+        routing = table({"match": {"project": "Payments"}, "index": "payments"})
+        self.assertEqual(routing.route(document(projects="Web, payments"), {}).index, "payments")
+        self.assertEqual(routing.route(document(projects=["Web"]), {}).index, "main")
+
+    def test_tag_conditions(self):
+        routing = table({"match": {"tag": "env=prod"}, "index": "prod"},
+                        {"match": {"tag": "owner"}, "index": "owned"})
+
+        self.assertEqual(routing.route(document(), {"Env": "PROD"}).index, "prod")
+        self.assertEqual(routing.route(document(), {"env": "dev", "owner": "x"}).index, "owned")
+        self.assertEqual(routing.route(document(), {"env": "dev"}).index, "main")
+
+    def test_routes_are_cached_without_tag_rules(self):
+        routing = table({"match": {"region": "eu-*"}, "index": "eu"})
+        for _ in range(3):
+            self.assertEqual(routing.route(document(), {}).index, "eu")
+
+        self.assertEqual(len(routing._cache), 1)
+        self.assertEqual(routing.stats(), {"rule1": 3})
+
+    def test_routes_are_not_cached_with_tag_rules(self):
+        routing = table({"match": {"tag": "env=prod"}, "index": "prod"})
+        self.assertEqual(routing.route(document(), {"env": "prod"}).index, "prod")
+        self.assertEqual(routing.route(document(), {"env": "dev"}).index, "main")
+        self.assertEqual(routing._cache, {})
+
+    def test_project_fields(self):
+        vm = {"id": "i-1", "name": "web", "lastSeen": "now", "tags": {}}
+        self.assertIs(wiz_routing.project_fields(vm, None), vm)
+        self.assertEqual(wiz_routing.project_fields(vm, ("lastSeen", "name", "missing")), {"lastSeen": "now", "name": "web"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import unittest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import wiz_run_summary  # noqa: E402
+
+
+def document(platform="AWS", region="eu-west-1", subscription="111", os_name="Linux", power_state="Running"):
+    return {"cloud_platform": platform, "region": region, "subscription_id": subscription, "os": os_name,
+            "power_state": power_state}
+
+
+class RunSummaryTest(unittest.TestCase):
+
+    def test_totals_and_dimensions(self):
+        summary = wiz_run_summary.RunSummary("wiz", "report-1")
+        summary.add(document(), event_bytes=100)
+        summary.add(document(region="us-east-1"), event_bytes=50)
+        summary.add(document(platform="Azure", power_state="Stopped"), event_bytes=25)
+
+        self.assertEqual((summary.total, summary.bytes), (3, 175))
+        self.assertEqual(summary.breakdown("platform"), {"AWS": 2, "Azure": 1})
+        self.assertEqual(summary.breakdown("region"), {"eu-west-1": 2, "us-east-1": 1})
+        self.assertEqual(summary.by_platform_state, {("AWS", "Running"): 2, ("Azure", "Stopped"): 1})
+
+    def test_missing_fields_are_unknown(self):
+        summary = wiz_run_summary.RunSummary("wiz", "report-1")
+        summary.add(document(os_name="", power_state=None))
+        summary.add({})
+
+        self.assertEqual(summary.breakdown("os"), {wiz_run_summary.UNKNOWN: 2})
+        self.assertEqual(summary.breakdown("power_state"), {wiz_run_summary.UNKNOWN: 2})
+        self.assertEqual(summary.breakdown("platform"), {"AWS": 1, wiz_run_summary.UNKNOWN: 1})
+        self.assertEqual(summary.by_combination[(wiz_run_summary.UNKNOWN,) * 4], 1)
+
+    def test_breakdown_folds_the_tail_into_other(self):
+        summary = wiz_run_summary.RunSummary("wiz", "report-1", top_n=2)
+        for region, count in (("a", 5), ("b", 3), ("c", 2), ("d", 1)):
+            for _ in range(count):
+                summary.add(document(region=region))
+
+        self.assertEqual(summary.breakdown("region"), {"a": 5, "b": 3, "other": 3})
+        self.assertEqual(summary.breakdown("platform"), {"AWS": 11})
+
+    def test_to_event(self):
+        summary = wiz_run_summary.RunSummary("wiz", "report-1", top_n=1)
+        summary.add(document(), event_bytes=10)
+        summary.add(document(platform="GCP", power_state="Stopped"), event_bytes=10)
+
+        counts = {"added": 1, "changed": 1, "unchanged": 0, "removed": 3, "skipped": 7}
+        event = summary.to_event(4, counts=counts, duration=1.23456)
+
+        self.assertEqual(event["input"], "wiz")
+        self.assertEqual(event["report_id"], "report-1")
+        self.assertEqual((event["run_id"], event["total"], event["bytes"]), (4, 2, 20))
+        self.assertEqual((event["added"], event["changed"], event["unchanged"], event["removed"]), (1, 1, 0, 3))
+        self.assertNotIn("skipped", event)
+        self.assertEqual(event["duration"], 1.235)
+        self.assertEqual(event["distinct"]["platform"], 2)
+        self.assertEqual(event["by_platform"], {"AWS": 1, "other": 1})
+        self.assertEqual(event["by_platform_power_state"], [{"platform": "AWS", "power_state": "Running", "count": 1}])
+
+    def test_to_event_without_counts(self):
+        event = wiz_run_summary.RunSummary("wiz", "report-1").to_event(1)
+
+        self.assertEqual(event["total"], 0)
+        self.assertNotIn("added", event)
+        self.assertNotIn("duration", event)
+        self.assertEqual(event["by_region"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
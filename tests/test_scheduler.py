@@ -0,0 +1,212 @@
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import input_module_wiz_virtual_machines as input_module  # noqa: E402
+import wiz_scheduler  # noqa: E402
+
+ACCOUNT = {"name": "main", "username": "client", "password": "secret"}
+
+
+class FakeHelper:
+
+    def __init__(self, intervals, settings=None):
+        self.input_stanzas = {
+            name: {"global_account": ACCOUNT, "accounts": "", "index": "main", "interval": str(interval)}
+            for name, interval in intervals.items()
+        }
+        self.settings = settings or {}
+        self.checkpoints = {}
+        self.warnings = []
+        self.infos = []
+
+    def get_input_stanza(self):
+        return self.input_stanzas
+
+    def get_input_stanza_names(self):
+        return list(self.input_stanzas)
+
+    def get_arg(self, name, stanza):
+        return self.input_stanzas[stanza].get(name)
+
+    def get_global_setting(self, name):
+        return self.settings.get(name)
+
+    def get_user_credential_by_id(self, name):
+        return ACCOUNT if name == "main" else None
+
+    def get_check_point(self, key):
+        return self.checkpoints.get(key)
+
+    def save_check_point(self, key, state):
+        self.checkpoints[key] = state
+
+    def get_log_level(self):
+        return "INFO"
+
+    def set_log_level(self, level):
+        pass
+
+    def log_info(self, message):
+        self.infos.append(message)
+
+    def log_warning(self, message):
+        self.warnings.append(message)
+
+    def log_error(self, message):
+        pass
+
+    def log_debug(self, message):
+        pass
+
+
+def launched(name, at):
+    return {input_module.LAST_RUN_CHECKPOINT_PREFIX + name: {"launched": at}}
+
+
+class NextAlignedTimeTest(unittest.TestCase):
+
+    def test_on_phase_returns_now(self):
+        self.assertEqual(wiz_scheduler.next_aligned_time(3700, 3600, 100), 3700)
+
+    def test_before_phase_waits_for_this_window(self):
+        self.assertEqual(wiz_scheduler.next_aligned_time(3650, 3600, 100), 3700)
+
+    def test_after_phase_waits_for_next_window(self):
+        self.assertEqual(wiz_scheduler.next_aligned_time(3701, 3600, 100), 7300)
+
+    def test_without_interval_only_adds_offset(self):
+        self.assertEqual(wiz_scheduler.next_aligned_time(1000, 0, 25), 1025)
+
+
+class GetDueStanzasTest(unittest.TestCase):
+
+    def test_never_launched_is_due(self):
+        helper = FakeHelper({"a": 3600})
+        self.assertEqual(input_module.get_due_stanzas(helper, ["a"], 10000), ["a"])
+
+    def test_longer_interval_is_skipped_until_elapsed(self):
+        helper = FakeHelper({"short": 3600, "long": 7200})
+        helper.checkpoints.update(launched("short", 10000))
+        helper.checkpoints.update(launched("long", 10000))
+
+        self.assertEqual(input_module.get_due_stanzas(helper, ["short", "long"], 13600), ["short"])
+        self.assertEqual(input_module.get_due_stanzas(helper, ["short", "long"], 17200), ["short", "long"])
+
+    def test_launcher_jitter_is_tolerated(self):
+        helper = FakeHelper({"a": 3600})
+        helper.checkpoints.update(launched("a", 10000))
+        self.assertEqual(input_module.get_due_stanzas(helper, ["a"], 13590), ["a"])
+
+    def test_multiple_of_launch_interval_is_not_warned(self):
+        helper = FakeHelper({"short": 3600, "long": 7200})
+        input_module.get_due_stanzas(helper, ["short", "long"], 10000)
+        self.assertEqual(helper.warnings, [])
+
+    def test_interval_not_multiple_of_launch_interval_is_warned(self):
+        helper = FakeHelper({"short": 3600, "odd": 5400})
+        input_module.get_due_stanzas(helper, ["short", "odd"], 10000)
+        self.assertEqual(len(helper.warnings), 1)
+        self.assertIn("odd", helper.warnings[0])
+        self.assertIn("3600s", helper.warnings[0])
+
+
+class SingleInstanceFanOutTest(unittest.TestCase):
+
+    def collect(self, helper):
+        ran = []
+        lock = threading.Lock()
+
+        def run_stanza(helper, ew, name):
+            with lock:
+                ran.append(name)
+            return True
+
+        with mock.patch.dict(os.environ, {"AOB_TEST": "true"}), \
+                mock.patch.object(input_module, "run_stanza", run_stanza), \
+                mock.patch.object(input_module, "get_http_session"):
+            input_module._collect_events(helper, None)
+
+        return sorted(ran)
+
+    def test_every_due_stanza_runs_once(self):
+        helper = FakeHelper({"a": 3600, "b": 3600, "c": 3600})
+        self.assertEqual(self.collect(helper), ["a", "b", "c"])
+        for name in ("a", "b", "c"):
+            self.assertIn(input_module.LAST_RUN_CHECKPOINT_PREFIX + name, helper.checkpoints)
+
+    def test_stanza_not_due_is_not_run(self):
+        helper = FakeHelper({"short": 3600, "long": 7200})
+        self.collect(helper)
+        last = helper.checkpoints[input_module.LAST_RUN_CHECKPOINT_PREFIX + "long"]["launched"]
+        helper.checkpoints.update(launched("short", last - 3600))
+        self.assertEqual(self.collect(helper), ["short"])
+
+    def test_failed_stanza_exits_non_zero(self):
+        helper = FakeHelper({"a": 3600, "b": 3600})
+
+        def run_stanza(helper, ew, name):
+            return name != "b"
+
+        with mock.patch.dict(os.environ, {"AOB_TEST": "true"}), \
+                mock.patch.object(input_module, "run_stanza", run_stanza), \
+                mock.patch.object(input_module, "get_http_session"):
+            with self.assertRaises(SystemExit):
+                input_module._collect_events(helper, None)
+
+
+class PhaseOffsetTest(unittest.TestCase):
+
+    def test_hash_offset_is_stable_and_in_range(self):
+        offset = wiz_scheduler.phase_offset("wiz_prod", 3600)
+        self.assertEqual(offset, wiz_scheduler.phase_offset("wiz_prod", 3600))
+        self.assertTrue(0 <= offset < 3600)
+
+    def test_hash_offsets_differ_between_stanzas(self):
+        offsets = {wiz_scheduler.phase_offset(f"wiz_{i}", 86400) for i in range(20)}
+        self.assertGreater(len(offsets), 15)
+
+    def test_no_interval_has_no_offset(self):
+        self.assertEqual(wiz_scheduler.phase_offset("wiz", 0), 0)
+
+    def test_even_offsets_are_spaced_by_name(self):
+        self.assertEqual(wiz_scheduler.even_offsets(["c", "a", "b", "d"], 3600), {"a": 0, "b": 900, "c": 1800, "d": 2700})
+
+    def test_even_spread_groups_by_interval(self):
+        offsets = wiz_scheduler.compute_offsets({"a": 3600, "b": 3600, "c": 600}, wiz_scheduler.SPREAD_EVEN)
+        self.assertEqual(offsets, {"a": 0, "b": 1800, "c": 0})
+
+    def test_no_spread(self):
+        offsets = wiz_scheduler.compute_offsets({"a": 3600, "b": 3600}, wiz_scheduler.SPREAD_NONE)
+        self.assertEqual(offsets, {"a": 0, "b": 0})
+
+
+class StartupDelaysTest(unittest.TestCase):
+
+    def test_no_window_starts_everything_now(self):
+        helper = FakeHelper({"a": 3600, "b": 3600})
+        self.assertEqual(input_module.get_startup_delays(helper, ["a", "b"]), [(0, "a"), (0, "b")])
+
+    def test_even_window_is_sorted_by_delay(self):
+        helper = FakeHelper({}, settings={"startup_window": "300", "schedule_spread": "even"})
+        self.assertEqual(input_module.get_startup_delays(helper, ["c", "b", "a"]), [(0, "a"), (100, "b"), (200, "c")])
+
+    def test_jitter_stays_within_bound(self):
+        helper = FakeHelper({}, settings={"schedule_jitter": "30", "schedule_spread": "none"})
+        for delay, _ in input_module.get_startup_delays(helper, [f"s{i}" for i in range(50)]):
+            self.assertTrue(0 <= delay <= 30)
+
+    def test_unknown_spread_falls_back_to_default(self):
+        helper = FakeHelper({}, settings={"schedule_spread": "random"})
+        self.assertEqual(input_module.get_schedule_spread(helper), input_module.DEFAULT_SCHEDULE_SPREAD)
+        self.assertEqual(len(helper.warnings), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
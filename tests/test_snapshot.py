@@ -0,0 +1,183 @@
+import array
+import fnmatch
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zlib
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import wiz_snapshot  # noqa: E402
+from wiz_snapshot import CHANGE_ADDED, CHANGE_CHANGED, CHANGE_REMOVED  # noqa: E402
+
+
+def vm(resource_id, **fields):
+    return dict({"id": resource_id, "name": f"vm-{resource_id}"}, **fields)
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.checkpoint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.checkpoint_dir)
+
+    def write(self, run_id, vms, stanza="wiz"):
+        path = wiz_snapshot.snapshot_path(self.checkpoint_dir, stanza, run_id)
+        writer = wiz_snapshot.SnapshotWriter(path)
+        for resource_id, (fingerprint, data) in vms.items():
+            writer.add(resource_id, fingerprint, data)
+        writer.commit()
+        return path
+
+    def test_round_trip(self):
+        vms = {f"i-{n}": (n, vm(f"i-{n}", size=n)) for n in range(50)}
+        path = self.write(1, vms)
+
+        with wiz_snapshot.Snapshot.open(path) as snapshot:
+            self.assertEqual(len(snapshot), 50)
+            self.assertEqual(snapshot.get("i-7"), vms["i-7"][1])
+            self.assertIsNone(snapshot.get("i-missing"))
+            self.assertEqual([r[0] for r in snapshot], list(vms))
+            self.assertEqual(sorted(content for _, content in snapshot.fingerprints()), list(range(50)))
+            resource_id, fingerprint, data = snapshot.record_at(0)
+            self.assertEqual(vms[resource_id], (fingerprint, data))
+
+    def test_uncommitted_snapshot_is_not_listed(self):
+        path = wiz_snapshot.snapshot_path(self.checkpoint_dir, "wiz", 1)
+        writer = wiz_snapshot.SnapshotWriter(path)
+        writer.add("i-1", 1, vm("i-1"))
+        self.assertEqual(wiz_snapshot.list_snapshots(self.checkpoint_dir, "wiz"), [])
+        writer.abort()
+        self.assertEqual(os.listdir(self.checkpoint_dir), [])
+
+    def test_truncated_file_is_rejected(self):
+        path = self.write(1, {"i-1": (1, vm("i-1"))})
+        with open(path, "r+b") as fp:
+            fp.truncate(os.path.getsize(path) - 8)
+        with self.assertRaises(ValueError):
+            wiz_snapshot.Snapshot.open(path)
+
+    def test_diff(self):
+        old = self.write(1, {"a": (1, vm("a")), "b": (2, vm("b")), "c": (3, vm("c"))})
+        new = self.write(2, {"a": (1, vm("a")), "b": (20, vm("b")), "d": (4, vm("d"))})
+
+        with wiz_snapshot.Snapshot.open(old) as before, wiz_snapshot.Snapshot.open(new) as after:
+            changes = {}
+            for change, i, j in wiz_snapshot.diff_snapshots(before, after):
+                record = after.record_at(j) if j is not None else before.record_at(i)
+                changes[record[0]] = change
+
+        self.assertEqual(changes, {"b": CHANGE_CHANGED, "c": CHANGE_REMOVED, "d": CHANGE_ADDED})
+
+    def test_list_latest_and_prune(self):
+        for run_id in (1, 2, 3):
+            self.write(run_id, {"a": (run_id, vm("a"))})
+        self.write(5, {"a": (1, vm("a"))}, stanza="wiz_eu")
+
+        self.assertEqual([run_id for run_id, _ in wiz_snapshot.list_snapshots(self.checkpoint_dir, "wiz")], [1, 2, 3])
+        latest = wiz_snapshot.latest_snapshots(self.checkpoint_dir)
+        self.assertEqual({name: run_id for name, (run_id, _) in latest.items()}, {"wiz": 3, "wiz_eu": 5})
+
+        self.assertEqual(wiz_snapshot.prune_snapshots(self.checkpoint_dir, "wiz", 2), 1)
+        self.assertEqual([run_id for run_id, _ in wiz_snapshot.list_snapshots(self.checkpoint_dir, "wiz")], [2, 3])
+        self.assertEqual(len(wiz_snapshot.list_snapshots(self.checkpoint_dir, "wiz_eu")), 1)
+
+
+def attributes(platform, region, subscription, **tags):
+    return wiz_snapshot.filter_attributes(platform, region, subscription, tags)
+
+
+def glob(pattern):
+    return lambda value: fnmatch.fnmatchcase(value, pattern)
+
+
+class SnapshotSelectTest(unittest.TestCase):
+
+    VMS = {
+        "a": ("AWS", "eu-west-1", "111", {"env": "prod", "Name": "web-a"}),
+        "b": ("AWS", "eu-west-1", "111", {"env": "dev", "Name": "web-b"}),
+        "c": ("AWS", "us-east-1", "222", {"env": "prod", "owner": "team-x", "Name": "db-c"}),
+        "d": ("Azure", "westeurope", "sub-1", {"env": "prod", "owner": "team-y", "Name": "db-d"}),
+        "e": ("GCP", "europe-west1", "proj", {}),
+    }
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "snapshot.snap")
+        writer = wiz_snapshot.SnapshotWriter(self.path)
+        for fingerprint, (resource_id, (platform, region, subscription, tags)) in enumerate(self.VMS.items()):
+            writer.add(resource_id, fingerprint, {"id": resource_id}, attributes(platform, region, subscription, **tags))
+        writer.commit()
+        self.calls = 0
+
+    def select(self, predicate=None, tag_filters=()):
+        def counted(attributes):
+            self.calls += 1
+            return predicate is None or predicate(attributes)
+
+        with wiz_snapshot.Snapshot.open(self.path) as snapshot:
+            return [resource_id for resource_id, _, _ in snapshot.select(counted, tag_filters)]
+
+    def test_no_filter_returns_everything_in_report_order(self):
+        self.assertEqual(self.select(), list(self.VMS))
+
+    def test_predicate_runs_once_per_location_set(self):
+        self.assertEqual(self.select(lambda a: a["platform"] == "AWS"), ["a", "b", "c"])
+        self.assertEqual(self.calls, 4)
+
+    def test_location_sets_exclude_tags(self):
+        with wiz_snapshot.Snapshot.open(self.path) as snapshot:
+            start, length = snapshot._filter_sets
+            sets = json.loads(snapshot._mmap[start:start + length])
+        self.assertEqual(len(sets), 4)
+        self.assertNotIn("tags", sets[0])
+
+    def test_tag_filter(self):
+        self.assertEqual(self.select(tag_filters=[("env", glob("prod"))]), ["a", "c", "d"])
+
+    def test_tag_filters_must_all_match(self):
+        self.assertEqual(self.select(tag_filters=[("env", glob("prod")), ("owner", glob("team-*"))]), ["c", "d"])
+
+    def test_tag_and_location_filters_combine(self):
+        self.assertEqual(self.select(lambda a: a["platform"] == "AWS", [("Name", glob("db-*"))]), ["c"])
+
+    def test_missing_tag_key_matches_nothing(self):
+        self.assertEqual(self.select(tag_filters=[("cost-center", glob("*"))]), [])
+
+    def test_version_2_snapshot_with_tags_in_filter_sets(self):
+        path = self.path + ".v2"
+        records = []
+        with open(path, "wb") as fp:
+            header = wiz_snapshot.HEADERS[wiz_snapshot.VERSION_WITH_TAGS_IN_FILTERS]
+            fp.write(b"\0" * header.size)
+            for resource_id, (platform, region, subscription, tags) in self.VMS.items():
+                record = zlib.compress(json.dumps({"id": resource_id, "fingerprint": 0, "vm": {}}).encode("utf-8"))
+                records.append((wiz_snapshot.id_hash(resource_id), fp.tell()))
+                fp.write(wiz_snapshot.RECORD_LENGTH.pack(len(record)) + record)
+            filter_offset = fp.tell()
+            sets = [attributes(*vm[:3], **vm[3]) for vm in self.VMS.values()]
+            fp.write(json.dumps(sets).encode("utf-8"))
+            filter_length = fp.tell() - filter_offset
+            order = sorted(range(len(records)), key=lambda i: records[i][0])
+            array.array("I", order).tofile(fp)
+            index_offset = fp.tell()
+            array.array("Q", (records[i][0] for i in order)).tofile(fp)
+            array.array("Q", (0 for _ in order)).tofile(fp)
+            array.array("Q", (records[i][1] for i in order)).tofile(fp)
+            fp.seek(0)
+            fp.write(header.pack(wiz_snapshot.MAGIC, 2, wiz_snapshot.BYTE_ORDER_FLAG, len(records), index_offset,
+                                 filter_offset, filter_length))
+
+        with wiz_snapshot.Snapshot.open(path) as snapshot:
+            selected = [r[0] for r in snapshot.select(lambda a: a["platform"] == "AWS", [("env", glob("prod"))])]
+        self.assertEqual(selected, ["a", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import wiz_state_store  # noqa: E402
+
+
+class VmStateStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.checkpoint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.checkpoint_dir)
+        self.now = 1700000000
+
+    def run_once(self, store, vms, report_id=None):
+        self.now += 3600
+        with mock.patch("time.time", return_value=self.now):
+            store.start_run(report_id)
+            for resource_id, fingerprint in vms.items():
+                store.record(resource_id, fingerprint)
+            return store.finish_run()
+
+    def test_first_run_adds_everything(self):
+        with wiz_state_store.VmStateStore(self.checkpoint_dir, "wiz") as store:
+            counts = self.run_once(store, {"vm-1": 1, "vm-2": 2})
+        self.assertEqual(counts, {"seen": 2, "added": 2, "changed": 0, "unchanged": 0, "removed": 0})
+
+    def test_changes_and_removals_between_runs(self):
+        with wiz_state_store.VmStateStore(self.checkpoint_dir, "wiz", batch_size=2) as store:
+            self.run_once(store, {"vm-1": 1, "vm-2": 2, "vm-3": 3})
+            counts = self.run_once(store, {"vm-1": 1, "vm-2": 20, "vm-4": 4})
+            removed = list(store.iter_unseen())
+
+        self.assertEqual(counts, {"seen": 3, "added": 1, "changed": 1, "unchanged": 1, "removed": 1})
+        self.assertEqual(removed, ["vm-3"])
+
+    def test_returning_vm_counts_as_added(self):
+        with wiz_state_store.VmStateStore(self.checkpoint_dir, "wiz") as store:
+            self.run_once(store, {"vm-1": 1})
+            self.run_once(store, {})
+            counts = self.run_once(store, {"vm-1": 1})
+        self.assertEqual(counts["added"], 1)
+
+    def test_stanzas_are_tracked_separately(self):
+        with wiz_state_store.VmStateStore(self.checkpoint_dir, "a") as a, \
+                wiz_state_store.VmStateStore(self.checkpoint_dir, "b") as b:
+            self.run_once(a, {"vm-1": 1})
+            counts = self.run_once(b, {"vm-2": 2})
+            counts_a = self.run_once(a, {"vm-1": 1})
+        self.assertEqual(counts["removed"], 0)
+        self.assertEqual(counts_a["unchanged"], 1)
+
+    def test_large_fingerprints_fit_sqlite_integers(self):
+        with wiz_state_store.VmStateStore(self.checkpoint_dir, "wiz") as store:
+            self.run_once(store, {"vm-1": (1 << 64) - 1})
+            counts = self.run_once(store, {"vm-1": (1 << 64) - 1})
+        self.assertEqual(counts["unchanged"], 1)
+
+    def test_find_run_by_report(self):
+        self.assertIsNone(wiz_state_store.find_run_by_report(self.checkpoint_dir, "wiz", "r1"))
+        with wiz_state_store.VmStateStore(self.checkpoint_dir, "wiz") as store:
+            self.run_once(store, {"vm-1": 1}, report_id="r1")
+            run_id = store.run_id
+        self.assertEqual(wiz_state_store.find_run_by_report(self.checkpoint_dir, "wiz", "r1"), run_id)
+        self.assertIsNone(wiz_state_store.find_run_by_report(self.checkpoint_dir, "other", "r1"))
+
+    def test_prune_tombstones(self):
+        with wiz_state_store.VmStateStore(self.checkpoint_dir, "wiz") as store:
+            self.run_once(store, {"vm-1": 1})
+            self.run_once(store, {})
+            with mock.patch("time.time", return_value=self.now + 86400):
+                self.assertEqual(store.prune_tombstones(3600), 1)
+                self.assertEqual(store.prune_tombstones(3600), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
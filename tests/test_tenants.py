@@ -0,0 +1,140 @@
+import json
+import os
+import sys
+import unittest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import input_module_wiz_virtual_machines as input_module  # noqa: E402
+
+ACCOUNTS = {
+    name: {"name": name, "username": f"client-{name}", "password": "secret", "tenant_id": f"tenant-{name}"}
+    for name in ("main", "eu", "us", "apac")
+}
+
+
+class FakeHelper:
+
+    def __init__(self, accounts=ACCOUNTS):
+        self.accounts = accounts
+        self.errors = []
+
+    def get_user_credential_by_id(self, name):
+        if name == "broken":
+            raise RuntimeError("credential store unavailable")
+        return self.accounts.get(name)
+
+    def log_info(self, message):
+        pass
+
+    def log_error(self, message):
+        self.errors.append(message)
+
+
+def stanza(accounts, global_account="main"):
+    return {"global_account": global_account, "accounts": accounts, "index": "main", "interval": "3600"}
+
+
+class ExpandTenantStanzasTest(unittest.TestCase):
+
+    def expand(self, stanzas, helper=None):
+        return input_module.expand_tenant_stanzas(helper or FakeHelper(), stanzas)
+
+    def test_no_additional_accounts(self):
+        expanded = self.expand({"wiz": stanza("")})
+        self.assertEqual(list(expanded), ["wiz"])
+        self.assertEqual(expanded["wiz"]["global_account"], ACCOUNTS["main"])
+        self.assertNotIn("tenant_id", expanded["wiz"])
+
+    def test_one_account_by_name(self):
+        expanded = self.expand({"wiz": stanza("eu")})
+        self.assertEqual(list(expanded), ["wiz", "wiz_eu"])
+        self.assertEqual(expanded["wiz_eu"]["global_account"], ACCOUNTS["eu"])
+        self.assertEqual(expanded["wiz_eu"]["tenant_id"], "tenant-eu")
+        self.assertEqual(expanded["wiz"]["tenant_id"], "tenant-main")
+
+    def test_one_account_resolved_to_credential(self):
+        helper = FakeHelper()
+        expanded = self.expand({"wiz": stanza(dict(ACCOUNTS["eu"]))}, helper)
+        self.assertEqual(list(expanded), ["wiz", "wiz_eu"])
+        self.assertEqual(expanded["wiz_eu"]["global_account"], ACCOUNTS["eu"])
+        self.assertEqual(helper.errors, [])
+
+    def test_several_accounts(self):
+        expanded = self.expand({"wiz": stanza("eu, us,apac")})
+        self.assertEqual(list(expanded), ["wiz", "wiz_eu", "wiz_us", "wiz_apac"])
+        self.assertEqual([expanded[n]["global_account"]["name"] for n in expanded], ["main", "eu", "us", "apac"])
+
+    def test_several_accounts_as_list(self):
+        expanded = self.expand({"wiz": stanza(["eu", ACCOUNTS["us"]])})
+        self.assertEqual(list(expanded), ["wiz", "wiz_eu", "wiz_us"])
+
+    def test_duplicate_and_global_account_are_collected_once(self):
+        expanded = self.expand({"wiz": stanza("main,eu,eu")})
+        self.assertEqual(list(expanded), ["wiz", "wiz_eu"])
+
+    def test_missing_account_is_skipped(self):
+        helper = FakeHelper()
+        expanded = self.expand({"wiz": stanza("eu,gone")}, helper)
+        self.assertEqual(list(expanded), ["wiz", "wiz_eu"])
+        self.assertEqual(len(helper.errors), 1)
+        self.assertIn("gone", helper.errors[0])
+
+    def test_failing_input_does_not_affect_others(self):
+        helper = FakeHelper()
+        expanded = self.expand({"bad": stanza("eu,broken"), "good": stanza("us")}, helper)
+        self.assertEqual(list(expanded), ["good", "good_us"])
+        self.assertEqual(len(helper.errors), 1)
+        self.assertIn("bad", helper.errors[0])
+
+
+class SettingsHelper:
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    def get_global_setting(self, name):
+        return self.settings.get(name)
+
+    def log_warning(self, message):
+        pass
+
+
+class AccountSlotTest(unittest.TestCase):
+
+    def setUp(self):
+        input_module._account_slots.clear()
+        self.addCleanup(input_module._account_slots.clear)
+
+    def test_no_limit_by_default(self):
+        for settings in ({}, {"max_runs_per_account": ""}):
+            slot = input_module.get_account_slot(SettingsHelper(settings), ACCOUNTS["main"])
+            with slot, slot:
+                pass
+        self.assertEqual(input_module._account_slots, {})
+
+    def test_limit_is_shared_by_the_account(self):
+        helper = SettingsHelper({"max_runs_per_account": "2"})
+        slot = input_module.get_account_slot(helper, ACCOUNTS["main"])
+
+        self.assertIs(input_module.get_account_slot(helper, dict(ACCOUNTS["main"])), slot)
+        self.assertIsNot(input_module.get_account_slot(helper, ACCOUNTS["eu"]), slot)
+        self.assertTrue(slot.acquire(blocking=False) and slot.acquire(blocking=False))
+        self.assertFalse(slot.acquire(blocking=False))
+
+
+class AccountsFieldTest(unittest.TestCase):
+
+    def test_accounts_are_stored_as_names(self):
+        with open(os.path.join(APP_DIR, "appserver", "static", "js", "build", "globalConfig.json")) as fp:
+            config = json.load(fp)
+        fields = {entity["field"]: entity
+                  for service in config["pages"]["inputs"]["services"]
+                  for entity in service["entity"]}
+        self.assertNotIn("referenceName", fields["accounts"].get("options", {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import wiz_vm_lookup  # noqa: E402
+
+
+def document(name, stanza="wiz"):
+    return {"resource_id": f"id-{name}", "name": name, "input": stanza, "region": "eu-west-1",
+            "subscription_id": "111", "cloud_platform": "AWS"}
+
+
+class LookupIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.checkpoint_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.checkpoint_dir)
+        wiz_vm_lookup._loaded.clear()
+        self.addCleanup(wiz_vm_lookup._loaded.clear)
+
+    def save(self, stanza, vms):
+        builder = wiz_vm_lookup.LookupIndexBuilder(stanza)
+        for name, vm in vms.items():
+            builder.add(document(name, stanza), vm, {})
+        path = wiz_vm_lookup.index_path(self.checkpoint_dir, stanza)
+        builder.save(path)
+        return path
+
+    def load(self):
+        return wiz_vm_lookup.LookupIndex.load(self.checkpoint_dir)
+
+    def test_exact_and_range_lookups(self):
+        self.save("wiz", {
+            "web": {"PrivateIpAddress": "10.0.0.5", "PrivateDnsName": "ip-10-0-0-5.ec2.internal", "InstanceId": "i-0abc"},
+            "pods": {"Ipv4Prefixes": [{"Ipv4Prefix": "10.1.0.0/28"}]},
+            "wide": {"aliasIpRanges": [{"ipCidrRange": "10.2.0.0/16"}, {"ipCidrRange": "10.2.3.4/32"}]},
+        })
+        index = self.load()
+
+        self.assertEqual(index.find_ip("10.0.0.5")["name"], "web")
+        self.assertEqual(index.find_ip("10.1.0.9")["name"], "pods")
+        self.assertEqual(index.find_ip("10.2.9.9")["name"], "wide")
+        self.assertIsNone(index.find_ip("10.3.0.1"))
+        self.assertEqual(index.find_hostname("IP-10-0-0-5.ec2.internal.")["name"], "web")
+        self.assertEqual(index.find_instance_id("i-0ABC")["name"], "web")
+
+    def test_security_rules_are_not_ranges(self):
+        self.save("wiz", {"web": {"SecurityGroups": [{"IpPermissions": [{"IpRanges": [{"CidrIp": "0.0.0.0/0"}]}]}]}})
+        self.assertIsNone(self.load().find_ip("8.8.8.8"))
+
+    def test_inputs_are_merged(self):
+        self.save("a", {"one": {"PrivateIpAddress": "10.0.0.1"}})
+        self.save("b", {"two": {"Ipv4Prefixes": [{"Ipv4Prefix": "10.0.0.0/28"}]}})
+        index = self.load()
+        self.assertEqual((index.find_ip("10.0.0.1")["input"], index.find_ip("10.0.0.2")["input"]), ("a", "b"))
+
+    def test_unchanged_files_are_not_parsed_again(self):
+        self.save("wiz", {"web": {"PrivateIpAddress": "10.0.0.5"}})
+        first = self.load()
+        self.assertIs(self.load(), first)
+
+        wiz_vm_lookup._loaded.clear()
+        with mock.patch.object(wiz_vm_lookup.json, "load", side_effect=AssertionError("parsed")):
+            self.assertEqual(self.load().find_ip("10.0.0.5")["name"], "web")
+
+    def test_rewritten_file_is_reloaded(self):
+        path = self.save("wiz", {"web": {"PrivateIpAddress": "10.0.0.5"}})
+        self.load()
+        self.save("wiz", {"db": {"PrivateIpAddress": "10.0.0.5"}})
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        self.assertEqual(self.load().find_ip("10.0.0.5")["name"], "db")
+
+    def test_corrupt_cache_is_rebuilt(self):
+        self.save("wiz", {"web": {"PrivateIpAddress": "10.0.0.5"}})
+        with open(os.path.join(self.checkpoint_dir, wiz_vm_lookup.CACHE_FILE_NAME), "wb") as fp:
+            fp.write(b"not a pickle")
+        self.assertEqual(self.load().find_ip("10.0.0.5")["name"], "web")
+
+    def test_missing_directory_is_empty(self):
+        self.assertEqual(len(wiz_vm_lookup.LookupIndex.load(os.path.join(self.checkpoint_dir, "missing"))), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import sys
+import unittest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "TA-wiz-discovered-vms")
+sys.path.insert(0, os.path.join(APP_DIR, "bin"))
+
+import ta_wiz_discovered_vms_declare  # noqa: E402,F401
+import wizexpand  # noqa: E402
+
+
+class RequiredKeysTest(unittest.TestCase):
+
+    def keys(self, path):
+        return wizexpand.required_keys(wizexpand.compile_path(path))
+
+    def test_child_path_requires_every_key(self):
+        self.assertEqual(self.keys("$.network.privateIp"), {"network", "privateIp"})
+
+    def test_wildcards_require_nothing(self):
+        self.assertEqual(self.keys("tags[*].key"), {"tags", "key"})
+        self.assertEqual(self.keys("network.*"), {"network"})
+
+    def test_several_field_names_require_none_of_them(self):
+        self.assertEqual(self.keys("network.'privateIp','publicIp'"), {"network"})
+
+    def test_markers_match_present_keys(self):
+        markers = wizexpand.key_markers(self.keys("network.'privateIp','publicIp'"))
+        raw = '{"network": {"publicIp": "1.2.3.4"}}'
+        self.assertTrue(all(any(marker in raw for marker in forms) for forms in markers))
+        self.assertEqual([m.value for m in wizexpand.compile_path("network.'privateIp','publicIp'").find(
+            {"network": {"publicIp": "1.2.3.4"}})], ["1.2.3.4"])
+
+
+class OutputFieldTest(unittest.TestCase):
+
+    def test_named_like_spath(self):
+        self.assertEqual(wizexpand.output_field("", "$.tags[*].key"), "tags{}.key")
+        self.assertEqual(wizexpand.output_field("wiz.", "name"), "wiz.name")
+
+
+if __name__ == "__main__":
+    unittest.main()